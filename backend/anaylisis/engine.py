@@ -6,8 +6,6 @@ import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Ensure we can import robust Async Client 
-from google import genai
 from google.genai import types
 
 # Setup path to import backend modules securely from the parent level
@@ -20,9 +18,17 @@ load_dotenv(backend_dir / ".env")
 
 # This will instantiate the Supabase logger via the existing client module
 from supabase_client import supabase_logger
+from deadlines import CallPolicy, call_with_deadline
+from governor import BACKGROUND, governor
+from clients import clients
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Reports are long and expensive: one jittered retry, no hedging, and a budget
+# that fits inside the caller's 45 s wait_for
+REPORT_POLICY = CallPolicy.from_env("report", budget_sec=40.0, first_chunk_sec=35.0, hedge=False, on_event=metrics.call_event, governor=governor, priority=BACKGROUND)
+
 
 class InterviewAnalyzerEngine:
     """
@@ -35,11 +41,12 @@ class InterviewAnalyzerEngine:
         self.prompt_path = backend_dir / "prompts" / "analyzer_prompt.txt"
         
         api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        if not api_key and not clients.stubbed:
             logger.error("GEMINI_API_KEY environment variable is missing.")
             raise ValueError("GEMINI_API_KEY is required to initialize the Analyzer Engine.")
         
-        self.client = genai.Client(api_key=api_key)
+        # Shared pooled client, same connections as the chat/TTS calls
+        self.client = clients.gemini()
         
         # Ensures that the prompt file actually exists before we start anything
         if not self.prompt_path.exists():
@@ -138,7 +145,7 @@ class InterviewAnalyzerEngine:
             # We enforce high precision analysis. temperature=0.3 helps stay grounded in the data 
             # while providing structured analysis matching the markdown requirements.
             print(f"[INFO] Sending {len(ai_input_message)} characters of session data to {self.model}...")
-            response = await self.client.aio.models.generate_content(
+            response = await call_with_deadline(lambda: self.client.aio.models.generate_content(
                 model=self.model,
                 contents=ai_input_message,
                 config=types.GenerateContentConfig(
@@ -146,7 +153,7 @@ class InterviewAnalyzerEngine:
                     temperature=0.3, 
                     max_output_tokens=3000, # Providing plenty of runway for a detailed point-by-point breakdown
                 )
-            )
+            ), REPORT_POLICY)
             
             report = response.text
             logger.info("Deep analysis successfully completed.")
@@ -25,7 +25,7 @@ if parent_dir not in sys.path:
 
 from supabase_client import supabase_logger
 from dotenv import load_dotenv
-from openai import OpenAI
+from clients import clients
 from video.models import VisualConfidenceModel
 
 load_dotenv() # Load variables from .env
@@ -34,7 +34,7 @@ app = Flask(__name__)
 CORS(app)
 
 # Note: Ensure OPENAI_API_KEY and ELEVENLABS_API_KEY are set in environment variables
-client = OpenAI()
+client = clients.openai() # pooled keep-alive connections shared by every request
 
 INTERVIEW_QUESTIONS = [
     "Welcome to Ace It. To start, can you tell me a bit about your experience with AI and machine learning?",
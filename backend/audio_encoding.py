@@ -0,0 +1,117 @@
+import logging
+
+import numpy as np
+
+try:
+    import av # PyAV, already installed as an aiortc dependency
+except ImportError:
+    av = None
+
+logger = logging.getLogger(__name__)
+
+OPUS_BITRATE = 32000
+OGG_PAGE_DURATION_US = 100000 # Emit an Ogg page every 100 ms instead of the 1 s default
+CLUSTER_TIME_LIMIT_MS = 100    # Same for WebM clusters
+
+# Accept media type -> (container format, response Content-Type)
+_CONTAINERS = {
+    "audio/ogg": ("ogg", "audio/ogg; codecs=opus"),
+    "audio/opus": ("ogg", "audio/ogg; codecs=opus"),
+    "audio/webm": ("webm", "audio/webm; codecs=opus"),
+}
+
+
+def negotiate_container(accept_header):
+    """
+    Pick an Opus container from an Accept header, honouring q-values. Returns
+    (format, content_type), or None when the client did not ask for one (or
+    PyAV is unavailable) and raw PCM should be sent.
+    """
+    if av is None or not accept_header:
+        return None
+    best = None
+    for item in accept_header.split(","):
+        parts = [p.strip() for p in item.split(";")]
+        media = parts[0].lower()
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media in _CONTAINERS and q > 0 and (best is None or q > best[0]):
+            best = (q, _CONTAINERS[media])
+    return best[1] if best else None
+
+
+class _Sink:
+    """Write-only, non-seekable target so the muxer streams instead of seeking back."""
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+class OpusStreamEncoder:
+    """
+    Incremental PCM (16-bit mono) -> Opus encoder muxed as Ogg or WebM. encode()
+    returns whatever container bytes are ready so they can be written straight to
+    the response; close() flushes the encoder and trailer and is safe to call again.
+
+    encode() runs inline on the event loop: libopus at 32 kbit/s mono costs about
+    0.7 ms per 100 ms of 24 kHz audio (~0.7% of real time, max ~8 ms for a 500 ms
+    chunk), well below what a thread hand-off would save.
+    """
+    def __init__(self, container_format, sample_rate=24000, bitrate=OPUS_BITRATE):
+        if av is None:
+            raise RuntimeError("PyAV is required for Opus encoding")
+        self.sample_rate = sample_rate
+        self._sink = _Sink()
+        options = {"page_duration": str(OGG_PAGE_DURATION_US)} if container_format == "ogg" else {"live": "1", "cluster_time_limit": str(CLUSTER_TIME_LIMIT_MS)}
+        self._container = av.open(self._sink, mode="w", format=container_format, options=options, buffer_size=4096)
+        # libopus takes 24 kHz input natively, so no resampling step is needed
+        self._stream = self._container.add_stream("libopus", rate=sample_rate, layout="mono")
+        self._stream.bit_rate = bitrate
+        self._pts = 0
+        self._carry = b""
+        self._closed = False
+
+    def encode(self, pcm):
+        pcm = self._carry + pcm
+        usable = len(pcm) & ~1
+        self._carry = pcm[usable:]
+        if usable:
+            samples = np.frombuffer(pcm[:usable], dtype=np.int16).reshape(1, -1)
+            frame = av.AudioFrame.from_ndarray(samples, format="s16", layout="mono")
+            frame.sample_rate = self.sample_rate
+            frame.pts = self._pts
+            self._pts += samples.shape[1]
+            for packet in self._stream.encode(frame):
+                self._container.mux(packet)
+        return self._sink.take()
+
+    def close(self):
+        if self._closed:
+            return b""
+        self._closed = True
+        for packet in self._stream.encode(None):
+            self._container.mux(packet)
+        self._container.close()
+        return self._sink.take()
+
+
+def encode_opus(pcm, sample_rate, container_format="ogg", bitrate=OPUS_BITRATE):
+    """One-shot mono PCM (float in [-1, 1], or int16) -> a complete Opus file."""
+    pcm = np.asarray(pcm)
+    if pcm.dtype != np.int16:
+        pcm = (np.clip(pcm, -1.0, 1.0) * 32767).astype(np.int16)
+    encoder = OpusStreamEncoder(container_format, sample_rate, bitrate)
+    return encoder.encode(pcm.astype("<i2").tobytes()) + encoder.close()
@@ -0,0 +1,90 @@
+"""
+Hedged vs. plain streaming calls through the real Gemini client against stub_provider.py.
+
+    python bench_hedging.py [--requests 400] [--concurrency 40]
+
+The stub is started in-process (PROVIDER_MODE=stub) and requests go through
+clients.gemini(), so the pooled connections and SDK streaming are part of every
+measurement. Latency comes from the STUB_* profile; unless set, time to first
+chunk is log-normal around 250 ms with a 6% tail of +2 s, roughly what
+generate_content_stream looks like on a bad day.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import time
+
+os.environ.setdefault("PROVIDER_MODE", "stub")
+os.environ.setdefault("STUB_TAIL_RATE", "0.06")
+os.environ.setdefault("STUB_TAIL_MS", "2000")
+
+import deadlines
+from clients import clients
+from stub_provider import STUB_PROVIDER_PORT, StubProfile, StubProvider
+
+BENCH_MODEL = "models/gemini-3-flash-preview"
+
+
+def pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+async def run(provider, hedge, n_requests, concurrency):
+    gemini = clients.gemini()
+    profile = provider.profile
+    policy = deadlines.CallPolicy("bench", budget_sec=20.0, first_chunk_sec=8.0, retries=1, hedge=hedge)
+    # Prime the percentile window the way a running server would have
+    rng = random.Random(profile.seed)
+    for _ in range(deadlines.MIN_SAMPLES * 5):
+        policy.latency.record(profile.ttft_ms / 1000.0 * rng.lognormvariate(0.0, profile.ttft_sigma))
+    sem = asyncio.Semaphore(concurrency)
+    # The stub derives latency from the request body, so every attempt (hedge or
+    # retry) gets its own body; otherwise a hedge would repeat the primary's tail
+    attempts = itertools.count()
+    upstream_before = provider.requests
+    first, total = [], []
+
+    async def one(i):
+        def call():
+            return gemini.aio.models.generate_content_stream(
+                model=BENCH_MODEL, contents=f"Question {i}, attempt {next(attempts)}")
+
+        async with sem:
+            start = time.monotonic()
+            got_first = None
+            async for _ in deadlines.stream_with_deadline(call, policy):
+                if got_first is None:
+                    got_first = time.monotonic() - start
+            first.append(got_first)
+            total.append(time.monotonic() - start)
+
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    return first, total, provider.requests - upstream_before
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=40)
+    args = parser.parse_args()
+
+    provider = StubProvider(StubProfile())
+    await provider.start(port=STUB_PROVIDER_PORT)
+    try:
+        await clients.warm()
+        print(f"{'mode':<10}{'ttfc p50':>10}{'ttfc p99':>10}{'total p50':>11}{'total p99':>11}{'upstream':>10}")
+        for hedge in (False, True):
+            first, total, upstream = await run(provider, hedge, args.requests, args.concurrency)
+            mode = "hedged" if hedge else "plain"
+            print(f"{mode:<10}{pct(first, .5):>9.3f}s{pct(first, .99):>9.3f}s"
+                  f"{pct(total, .5):>10.3f}s{pct(total, .99):>10.3f}s{upstream / args.requests:>9.2f}x")
+    finally:
+        await clients.aclose()
+        await provider.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# How often (at most) the prompt directories are re-stat'ed for edits
+CATALOG_CHECK_INTERVAL_SEC = float(os.environ.get("CATALOG_CHECK_INTERVAL_SEC", "2.0"))
+# Persona fields the interviewer is told to say verbatim, so their audio can be cached
+PERSONA_PHRASE_FIELDS = ("greeting", "sign_off")
+
+
+def render_persona_prompt(data):
+    persona_prompt = f"PERSONA: {data.get('name')}\n"
+    persona_prompt += f"ROLE: {data.get('role')}\n"
+    persona_prompt += f"TRAITS: {data.get('traits')}\n\n"
+    persona_prompt += f"YOUR MISSION:\n{data.get('description')}\n"
+    if data.get('example_reaction'):
+        persona_prompt += f"\nEXAMPLE REACTION: {data.get('example_reaction')}"
+    return persona_prompt
+
+
+class _CatalogDir:
+    """
+    Parsed JSON files of one prompts/ subdirectory, keyed by filename stem. Only
+    files whose mtime (or size) changed since the last scan are re-read.
+    """
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.entries = {} # stem -> parsed dict
+        self._stamps = {} # stem -> (mtime_ns, size)
+
+    def scan(self):
+        """Returns True when anything was added, changed or removed."""
+        seen = {}
+        if os.path.isdir(self.path):
+            for filename in os.listdir(self.path):
+                if not filename.endswith(".json"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.path, filename))
+                except OSError:
+                    continue
+                seen[filename[:-len(".json")]] = (st.st_mtime_ns, st.st_size)
+
+        changed = False
+        for stem in list(self.entries):
+            if stem not in seen:
+                del self.entries[stem]
+                self._stamps.pop(stem, None)
+                changed = True
+        for stem, stamp in seen.items():
+            if self._stamps.get(stem) == stamp:
+                continue
+            self._stamps[stem] = stamp
+            try:
+                with open(os.path.join(self.path, f"{stem}.json"), "r") as f:
+                    self.entries[stem] = json.load(f)
+                logger.info(f"Catalog: loaded {self.kind} {stem}")
+            except Exception as e:
+                logger.error(f"Error loading {self.kind} {stem}.json: {e}")
+                self.entries.pop(stem, None)
+            changed = True
+        return changed
+
+
+class PromptCatalog:
+    """
+    In-memory index of the interviewer personas and job descriptions under prompts/.
+
+    Everything per-request work used to redo is precomputed when a file changes:
+    rendered persona prompts for chat/init-session, and the serialized
+    /api/interviewers and /api/jobs bodies with their ETags.
+    """
+    def __init__(self, prompts_dir, check_interval=CATALOG_CHECK_INTERVAL_SEC):
+        self.check_interval = check_interval
+        self._interviewers = _CatalogDir(os.path.join(prompts_dir, "interviewers"), "interviewer")
+        self._jobs = _CatalogDir(os.path.join(prompts_dir, "job_descriptions"), "job")
+        self._persona_prompts = {}
+        self._interviewers_body = (b"", "")
+        self._jobs_body = (b"", "")
+        self._last_check = 0.0
+        self.refresh(force=True)
+
+    @staticmethod
+    def _serialize(payload):
+        body = json.dumps(payload).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        return body, etag
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        if self._interviewers.scan() or force:
+            interviewers = []
+            for stem in sorted(self._interviewers.entries):
+                data = dict(self._interviewers.entries[stem])
+                # Ensure ID matches filename just in case
+                if "id" not in data:
+                    data["id"] = stem
+                interviewers.append(data)
+            self._interviewers_body = self._serialize({"interviewers": interviewers})
+            self._persona_prompts = {
+                stem: render_persona_prompt(data) for stem, data in self._interviewers.entries.items()
+            }
+
+        if self._jobs.scan() or force:
+            jobs = []
+            for stem in sorted(self._jobs.entries):
+                data = dict(self._jobs.entries[stem])
+                data["id"] = stem
+                jobs.append(data)
+            self._jobs_body = self._serialize({"jobs": jobs})
+
+    def persona(self, persona_id):
+        self.refresh()
+        return self._interviewers.entries.get(persona_id)
+
+    def persona_voices(self):
+        self.refresh()
+        return sorted({data["voice"] for data in self._interviewers.entries.values() if data.get("voice")})
+
+    def persona_phrases(self):
+        """{voice: [greeting, sign-off, ...]} over all personas (None for the default voice)."""
+        self.refresh()
+        phrases = {}
+        for data in self._interviewers.entries.values():
+            for field in PERSONA_PHRASE_FIELDS:
+                if data.get(field):
+                    phrases.setdefault(data.get("voice"), []).append(data[field])
+        return phrases
+
+    def persona_prompt(self, persona_id, default):
+        if not persona_id:
+            return default
+        self.refresh()
+        return self._persona_prompts.get(persona_id, default)
+
+    def interviewers_response(self):
+        """(json_body_bytes, etag) for /api/interviewers."""
+        self.refresh()
+        return self._interviewers_body
+
+    def jobs_response(self):
+        """(json_body_bytes, etag) for /api/jobs."""
+        self.refresh()
+        return self._jobs_body
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import threading
+
+import httpx
+
+from governor import PROVIDER_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# One pool per process, shared by every LLM / STT / TTS call site. Each governor slot
+# can have two requests in flight (primary + hedge), so the pool must not be the
+# tighter limit; the headroom covers ungoverned calls (warm-up, context caches).
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", str(PROVIDER_MAX_CONCURRENCY * 2 + 16)))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", str(PROVIDER_MAX_CONCURRENCY)))
+HTTP_KEEPALIVE_EXPIRY_SEC = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SEC", "120"))
+HTTP_CONNECT_TIMEOUT_SEC = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SEC", "10"))
+HTTP_READ_TIMEOUT_SEC = float(os.environ.get("HTTP_READ_TIMEOUT_SEC", "120"))
+# Waiting for a free pooled connection fails fast instead of eating the call's deadline
+HTTP_POOL_TIMEOUT_SEC = float(os.environ.get("HTTP_POOL_TIMEOUT_SEC", "2"))
+
+# live: real Gemini/OpenAI endpoints
+# stub: stub_provider.py started inside this process on STUB_PROVIDER_PORT
+# stub-http: a stub_provider.py already running at STUB_PROVIDER_URL
+PROVIDER_MODE = os.environ.get("PROVIDER_MODE", "live").lower()
+STUB_PROVIDER_URL = os.environ.get(
+    "STUB_PROVIDER_URL", f"http://127.0.0.1:{os.environ.get('STUB_PROVIDER_PORT', '9100')}/"
+)
+
+# Hosts whose TCP+TLS connections are opened at startup
+if PROVIDER_MODE == "live":
+    WARM_URLS = (
+        "https://generativelanguage.googleapis.com/",
+        "https://api.openai.com/v1/",
+    )
+else:
+    WARM_URLS = (STUB_PROVIDER_URL,)
+
+try:
+    import h2 # noqa: F401  (enables HTTP/2 multiplexing when installed)
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+
+class ClientRegistry:
+    """
+    Lazily built, process-wide API clients on top of two shared httpx pools (sync
+    and async) with keep-alive and connection limits, so a turn reuses warm TLS
+    connections instead of each call site handshaking on its own.
+
+    Host lookups happen once per pooled connection; with a long keep-alive the
+    resolver is rarely on the per-turn path.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_http = None
+        self._async_http = None
+        self._gemini = None
+        self._openai = None
+        self._async_openai = None
+
+    @property
+    def stubbed(self):
+        return PROVIDER_MODE != "live"
+
+    @staticmethod
+    def _pool_args():
+        return {
+            "limits": httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SEC,
+            ),
+            "timeout": httpx.Timeout(HTTP_READ_TIMEOUT_SEC, connect=HTTP_CONNECT_TIMEOUT_SEC, pool=HTTP_POOL_TIMEOUT_SEC),
+            "http2": _HTTP2,
+        }
+
+    def sync_http(self):
+        with self._lock:
+            if self._sync_http is None:
+                self._sync_http = httpx.Client(**self._pool_args())
+            return self._sync_http
+
+    def async_http(self):
+        with self._lock:
+            if self._async_http is None:
+                self._async_http = httpx.AsyncClient(**self._pool_args())
+            return self._async_http
+
+    def gemini(self):
+        if self._gemini is None:
+            from google import genai
+            from google.genai import types
+            http_options = types.HttpOptions(
+                httpx_client=self.sync_http(),
+                httpx_async_client=self.async_http(),
+            )
+            if self.stubbed:
+                http_options.base_url = STUB_PROVIDER_URL
+            client = genai.Client(
+                api_key=os.environ.get("GEMINI_API_KEY") or ("stub" if self.stubbed else ""),
+                http_options=http_options,
+            )
+            with self._lock:
+                if self._gemini is None:
+                    self._gemini = client
+        return self._gemini
+
+    def _openai_args(self):
+        if not self.stubbed:
+            return {}
+        return {"base_url": STUB_PROVIDER_URL.rstrip("/") + "/v1", "api_key": os.environ.get("OPENAI_API_KEY") or "stub"}
+
+    def openai(self):
+        if self._openai is None:
+            from openai import OpenAI
+            client = OpenAI(http_client=self.sync_http(), **self._openai_args())
+            with self._lock:
+                if self._openai is None:
+                    self._openai = client
+        return self._openai
+
+    def async_openai(self):
+        if self._async_openai is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(http_client=self.async_http(), **self._openai_args())
+            with self._lock:
+                if self._async_openai is None:
+                    self._async_openai = client
+        return self._async_openai
+
+    async def warm(self, urls=WARM_URLS):
+        """Open pooled connections to the provider hosts (status codes are irrelevant)."""
+        http = self.async_http()
+
+        async def touch(url):
+            try:
+                await http.head(url, timeout=HTTP_CONNECT_TIMEOUT_SEC)
+                return True
+            except Exception as e:
+                logger.warning(f"Connection warm-up to {url} failed: {e}")
+                return False
+
+        results = await asyncio.gather(*(touch(url) for url in urls))
+        logger.info(f"Warmed {sum(results)}/{len(urls)} provider connections")
+
+    async def aclose(self):
+        """Close both pools; clients built on them must not be used afterwards."""
+        with self._lock:
+            sync_http, self._sync_http = self._sync_http, None
+            async_http, self._async_http = self._async_http, None
+            self._gemini = self._openai = self._async_openai = None
+        if async_http is not None:
+            await async_http.aclose()
+        if sync_http is not None:
+            sync_http.close()
+
+
+clients = ClientRegistry()
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per endpoint for the hedge-delay percentile
+LATENCY_WINDOW = 200
+# Below this many samples the policy's default hedge delay is used
+MIN_SAMPLES = 20
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The call's overall budget, or its first-chunk watchdog, ran out."""
+
+
+class _EmptyStream(Exception):
+    pass
+
+
+class LatencyTracker:
+    """Rolling window of observed latencies (seconds) for one endpoint."""
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class CallPolicy:
+    """
+    Latency budget for one kind of provider call.
+
+    budget_sec          overall deadline, including retries
+    first_chunk_sec     watchdog: give up on an attempt with no first chunk/result by then
+    retries             extra attempts after a failure, while budget remains
+    hedge               start a duplicate when the first chunk is later than the
+                        hedge_percentile of recent latencies (clamped to min/max)
+    governor            optional admission control (governor.ProviderGovernor); the
+                        call waits for a slot of class `priority`, within the budget
+    """
+    def __init__(self, name, budget_sec, first_chunk_sec, retries=1, hedge=True, hedge_percentile=0.95,
+                 default_hedge_sec=2.0, min_hedge_sec=0.25, max_hedge_sec=None, retry_base_sec=0.25,
+                 on_event=None, governor=None, priority=0):
+        self.name = name
+        self.budget_sec = budget_sec
+        self.first_chunk_sec = first_chunk_sec
+        self.retries = retries
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_sec = default_hedge_sec
+        self.min_hedge_sec = min_hedge_sec
+        self.max_hedge_sec = max_hedge_sec if max_hedge_sec is not None else first_chunk_sec / 2
+        self.retry_base_sec = retry_base_sec
+        self.on_event = on_event # callback(policy_name, event, value) for metrics
+        self.governor = governor
+        self.priority = priority
+        self.latency = LatencyTracker()
+
+    @classmethod
+    def from_env(cls, name, budget_sec, first_chunk_sec, **kwargs):
+        """Defaults overridable via <NAME>_DEADLINE_SEC / <NAME>_FIRST_CHUNK_SEC / <NAME>_HEDGE."""
+        prefix = name.upper()
+        budget_sec = float(os.environ.get(f"{prefix}_DEADLINE_SEC", budget_sec))
+        first_chunk_sec = float(os.environ.get(f"{prefix}_FIRST_CHUNK_SEC", first_chunk_sec))
+        if f"{prefix}_HEDGE" in os.environ:
+            kwargs["hedge"] = os.environ[f"{prefix}_HEDGE"] != "0"
+        return cls(name, budget_sec, first_chunk_sec, **kwargs)
+
+    def hedge_delay(self):
+        if len(self.latency.samples) < MIN_SAMPLES:
+            delay = self.default_hedge_sec
+        else:
+            delay = self.latency.percentile(self.hedge_percentile)
+        return min(max(delay, self.min_hedge_sec), self.max_hedge_sec)
+
+    def backoff(self, attempt):
+        return self.retry_base_sec * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _event(self, event, value=1):
+        if self.on_event:
+            self.on_event(self.name, event, value)
+
+
+@asynccontextmanager
+async def _admitted(policy, deadline_at):
+    """Hold a governor slot (if the policy has a governor) for the whole call."""
+    if policy.governor is None:
+        yield
+        return
+    slot = policy.governor.slot(policy.priority, timeout=max(0.0, deadline_at - time.monotonic()))
+    try:
+        await slot.__aenter__()
+    except asyncio.TimeoutError:
+        policy._event("deadline_exceeded")
+        raise DeadlineExceeded(f"{policy.name}: no provider slot within {policy.budget_sec:.1f}s") from None
+    try:
+        yield
+    finally:
+        await slot.__aexit__(None, None, None)
+
+
+def _try_charge(policy):
+    """A token for an extra request (a hedge) if one is free right now."""
+    return policy.governor is None or policy.governor.try_token(policy.priority)
+
+
+async def _charge(policy, deadline_at):
+    """Wait for a token for an extra request (a retry), within the budget."""
+    if policy.governor is None:
+        return
+    try:
+        await policy.governor.token(policy.priority, timeout=max(0.0, deadline_at - time.monotonic()))
+    except asyncio.TimeoutError:
+        policy._event("deadline_exceeded")
+        raise DeadlineExceeded(f"{policy.name}: no provider token for a retry within {policy.budget_sec:.1f}s") from None
+
+
+async def _close(obj):
+    aclose = getattr(obj, "aclose", None)
+    if aclose:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            result = await task
+        except BaseException:
+            continue
+        if isinstance(result, tuple):
+            await _close(result[0]) # a stream that started after we stopped caring
+
+
+async def _race(start_attempt, policy, limit):
+    """
+    Run start_attempt(), hedging with a second copy if it is slow. Returns the first
+    successful result; the loser is cancelled. Raises DeadlineExceeded after
+    `limit` seconds, or the last error if every attempt failed.
+    """
+    started = time.monotonic()
+    first_task = asyncio.create_task(start_attempt())
+    tasks = {first_task}
+    hedged = not policy.hedge
+    hedge_started = False
+    hedge_at = policy.hedge_delay()
+    last_error = None
+    try:
+        while tasks:
+            elapsed = time.monotonic() - started
+            wait_until = limit if hedged else min(hedge_at, limit)
+            done, _ = await asyncio.wait(tasks, timeout=max(0.0, wait_until - elapsed), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tasks.discard(task)
+                if task.exception() is None:
+                    if hedge_started:
+                        policy._event("hedge_won" if task is not first_task else "hedge_lost")
+                    return task.result(), time.monotonic() - started
+                last_error = task.exception()
+            if done:
+                continue
+            if time.monotonic() - started >= limit:
+                policy._event("first_chunk_timeout")
+                raise DeadlineExceeded(f"{policy.name}: nothing received within {limit:.2f}s")
+            if not hedged:
+                hedged = True
+                if not _try_charge(policy):
+                    # The rate limit is already tight; a duplicate would only add to it
+                    policy._event("hedge_skipped")
+                    continue
+                policy._event("hedged")
+                hedge_started = True
+                tasks.add(asyncio.create_task(start_attempt()))
+        raise last_error
+    finally:
+        if tasks:
+            await _cancel(tasks)
+
+
+async def _retrying(start_attempt, policy, deadline_at):
+    attempt = 0
+    while True:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            policy._event("deadline_exceeded")
+            raise DeadlineExceeded(f"{policy.name}: budget of {policy.budget_sec:.1f}s exhausted")
+        try:
+            result, latency = await _race(start_attempt, policy, min(policy.first_chunk_sec, remaining))
+            policy.latency.record(latency)
+            return result
+        except _EmptyStream:
+            raise
+        except Exception as e:
+            if attempt >= policy.retries:
+                raise
+            delay = policy.backoff(attempt)
+            if time.monotonic() + delay >= deadline_at:
+                raise
+            attempt += 1
+            policy._event("retried")
+            logger.warning(f"{policy.name}: attempt failed ({e}); retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            await _charge(policy, deadline_at)
+
+
+async def call_with_deadline(make_call, policy):
+    """Await make_call() under the policy: watchdog, hedging, jittered retries, budget."""
+    deadline_at = time.monotonic() + policy.budget_sec
+
+    async def attempt():
+        return await make_call()
+
+    async with _admitted(policy, deadline_at):
+        return await _retrying(attempt, policy, deadline_at)
+
+
+async def stream_with_deadline(make_stream, policy):
+    """
+    Async-iterate make_stream() (a coroutine returning an async iterator) under the
+    policy. Hedging and retries only apply until the first chunk; after that the
+    winning stream is consumed to the end or until the overall budget runs out.
+    """
+    deadline_at = time.monotonic() + policy.budget_sec
+
+    async def attempt():
+        iterator = (await make_stream()).__aiter__()
+        try:
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            raise _EmptyStream()
+        return iterator, first
+
+    async with _admitted(policy, deadline_at):
+        try:
+            iterator, first = await _retrying(attempt, policy, deadline_at)
+        except _EmptyStream:
+            return
+        try:
+            yield first
+            while True:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    policy._event("deadline_exceeded")
+                    raise DeadlineExceeded(f"{policy.name}: stream exceeded its {policy.budget_sec:.1f}s budget")
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    policy._event("deadline_exceeded")
+                    raise DeadlineExceeded(f"{policy.name}: stream exceeded its {policy.budget_sec:.1f}s budget")
+                yield chunk
+        finally:
+            await _close(iterator)
@@ -0,0 +1,177 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+
+from metrics import metrics
+
+# Priority classes; lower is served first
+INTERACTIVE = 0 # a candidate is waiting on it: chat, tts, init_session, transcription
+BACKGROUND = 1  # reports, history summaries, cache creation, TTS prewarm
+_CLASS_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Provider request rate (token bucket) and in-flight limits, shared by every call site
+PROVIDER_RATE_PER_SEC = float(os.environ.get("PROVIDER_RATE_PER_SEC", "10"))
+PROVIDER_BURST = float(os.environ.get("PROVIDER_BURST", "20"))
+PROVIDER_MAX_CONCURRENCY = int(os.environ.get("PROVIDER_MAX_CONCURRENCY", "32"))
+# Background work never holds more than this many slots, so live turns always find one
+PROVIDER_MAX_BACKGROUND = int(os.environ.get("PROVIDER_MAX_BACKGROUND", "4"))
+# Background requests beyond this queue length, or waiting longer than this, are shed
+BACKGROUND_QUEUE_LIMIT = int(os.environ.get("BACKGROUND_QUEUE_LIMIT", "16"))
+BACKGROUND_MAX_WAIT_SEC = float(os.environ.get("BACKGROUND_MAX_WAIT_SEC", "30"))
+
+
+class GovernorShed(Exception):
+    """Background work was dropped because interactive traffic needed the capacity."""
+
+
+class ProviderGovernor:
+    """
+    Admission control in front of all outbound provider calls: a token bucket for
+    the request rate plus a concurrency cap, with waiters served strictly by
+    priority class. Queued background work is overtaken by any interactive call,
+    is limited to a few in-flight slots, and is shed when its queue is full or it
+    has waited too long. Event-loop only.
+
+    A slot covers one logical call and takes its first token. Hedges and retries
+    inside it are extra provider requests, so they take their own tokens through
+    try_token() and token().
+    """
+    def __init__(self, rate_per_sec=PROVIDER_RATE_PER_SEC, burst=PROVIDER_BURST,
+                 max_concurrency=PROVIDER_MAX_CONCURRENCY, max_background=PROVIDER_MAX_BACKGROUND,
+                 background_queue_limit=BACKGROUND_QUEUE_LIMIT, background_max_wait_sec=BACKGROUND_MAX_WAIT_SEC):
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_background = max_background
+        self.background_queue_limit = background_queue_limit
+        self.background_max_wait_sec = background_max_wait_sec
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        self._waiters = [] # heap of (priority, seq, future, needs_slot)
+        self._seq = itertools.count()
+        self._queued = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._active = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_sec)
+        self._refilled_at = now
+
+    def _has_slot(self, priority):
+        if self._active[INTERACTIVE] + self._active[BACKGROUND] >= self.max_concurrency:
+            return False
+        return priority == INTERACTIVE or self._active[BACKGROUND] < self.max_background
+
+    def _dispatch(self):
+        self._refill()
+        while self._waiters:
+            priority, _, future, needs_slot = self._waiters[0]
+            if future.done(): # gave up while queued
+                heapq.heappop(self._waiters)
+                continue
+            if needs_slot and not self._has_slot(priority):
+                break # a release will dispatch again
+            if self._tokens < 1:
+                self._wake_in((1 - self._tokens) / self.rate_per_sec)
+                break
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            if needs_slot:
+                self._queued[priority] -= 1
+                self._active[priority] += 1
+            future.set_result(None)
+        self._export()
+
+    def _wake_in(self, delay):
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _release(self, priority):
+        self._active[priority] -= 1
+        self._dispatch()
+
+    def _export(self):
+        for priority, name in _CLASS_NAMES.items():
+            metrics.set_gauge(f"governor_queue_{name}", self._queued[priority])
+            metrics.set_gauge(f"governor_active_{name}", self._active[priority])
+        metrics.set_gauge("governor_tokens", round(self._tokens, 2))
+
+    @asynccontextmanager
+    async def slot(self, priority=INTERACTIVE, timeout=None):
+        """
+        Hold one provider slot for the body of the `async with`. Raises GovernorShed
+        for background work that is refused, asyncio.TimeoutError if an interactive
+        caller's `timeout` runs out while queued.
+        """
+        name = _CLASS_NAMES[priority]
+        if priority == BACKGROUND:
+            if self._queued[BACKGROUND] >= self.background_queue_limit:
+                metrics.inc("governor_background_shed")
+                raise GovernorShed("background queue is full")
+            timeout = self.background_max_wait_sec if timeout is None else min(timeout, self.background_max_wait_sec)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future, True))
+        self._queued[priority] += 1
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                self._release(priority) # granted just as we gave up
+            else:
+                self._queued[priority] -= 1
+                self._export()
+            if isinstance(e, asyncio.TimeoutError):
+                if priority == BACKGROUND:
+                    metrics.inc("governor_background_shed")
+                    raise GovernorShed(f"waited over {timeout:.1f}s for a provider slot") from None
+                metrics.inc(f"governor_{name}_timeout")
+            raise
+        metrics.observe(f"governor_wait_{name}_sec", time.monotonic() - queued_at)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def try_token(self, priority=INTERACTIVE):
+        """
+        Take one request token at once, for an extra request made inside a slot that
+        is already held (a hedge). False if none is free or others are queued first.
+        """
+        self._refill()
+        if self._tokens < 1 or any(p <= priority and not f.done() for p, _, f, _ in self._waiters):
+            metrics.inc("governor_token_refused")
+            return False
+        self._tokens -= 1
+        self._export()
+        return True
+
+    async def token(self, priority=INTERACTIVE, timeout=None):
+        """
+        Wait for one request token without taking a slot, for an extra request made
+        inside a slot that is already held (a retry). Raises asyncio.TimeoutError
+        if `timeout` runs out first.
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future, False))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self._tokens += 1 # granted just as we gave up
+                self._dispatch()
+            raise
+
+
+governor = ProviderGovernor()
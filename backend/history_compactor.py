@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+
+from session_store import format_history
+
+logger = logging.getLogger(__name__)
+
+# Prompt budget for the conversation part of each /api/chat request
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", "1200"))
+# Most recent history entries (one question or one answer each) always kept verbatim
+CHAT_HISTORY_KEEP_ENTRIES = int(os.environ.get("CHAT_HISTORY_KEEP_ENTRIES", "6"))
+# Share of the budget the rolling summary may use
+SUMMARY_BUDGET_SHARE = 0.35
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose; only used for budgeting
+    return len(text) // 4 + 1
+
+
+class HistoryCompactor:
+    """
+    Keeps the conversation part of the chat prompt roughly constant in size.
+
+    The last CHAT_HISTORY_KEEP_ENTRIES entries are sent verbatim. Older entries are
+    folded into a per-session rolling summary, regenerated by `summarize` in a
+    background task, so the chat turn never waits on it. Entries that have aged
+    out of the verbatim window but are not summarized yet are included in clipped
+    form while budget remains.
+    """
+    def __init__(self, summarize, token_budget=CHAT_HISTORY_TOKEN_BUDGET, keep_entries=CHAT_HISTORY_KEEP_ENTRIES, on_update=None):
+        self._summarize = summarize
+        self.token_budget = token_budget
+        self.keep_entries = max(2, keep_entries)
+        self._on_update = on_update
+        self._tasks = {} # session_id -> running summary task
+
+    def build_context(self, state):
+        history = state.history
+        if state.summarized_upto > len(history):
+            # History was replaced or rolled back behind the summary
+            state.summary, state.summarized_upto = "", 0
+
+        summary = state.summary
+        summary_budget = int(self.token_budget * SUMMARY_BUDGET_SHARE)
+        if estimate_tokens(summary) > summary_budget:
+            summary = summary[:summary_budget * 4].rsplit(" ", 1)[0] + " ..."
+        remaining = self.token_budget - estimate_tokens(summary)
+
+        # Verbatim window: newest entries first, at least the last exchange
+        start = len(history)
+        while start > 0 and len(history) - start < self.keep_entries:
+            cost = estimate_tokens(history[start - 1].get("text") or "")
+            if remaining - cost < 0 and len(history) - start >= 2:
+                break
+            remaining -= cost
+            start -= 1
+        verbatim = history[start:]
+
+        # Aged-out entries the summary has not absorbed yet, clipped, newest first
+        pending = []
+        for entry in reversed(history[state.summarized_upto:start]):
+            if remaining <= 40:
+                break
+            text = entry.get("text") or ""
+            clip = min(len(text), (remaining - 10) * 4, 280)
+            pending.append({"speaker": entry.get("speaker"), "text": text[:clip] + ("..." if clip < len(text) else "")})
+            remaining -= estimate_tokens(pending[-1]["text"])
+        pending.reverse()
+
+        if start > state.summarized_upto:
+            self._schedule(state, start)
+
+        context = ""
+        if summary:
+            context += f"--- CONVERSATION SUMMARY (EARLIER TURNS) ---\n{summary.strip()}\n\n"
+        context += format_history(pending + verbatim)
+        return context
+
+    def _schedule(self, state, upto):
+        running = self._tasks.get(state.session_id)
+        if running and not running.done():
+            return
+        self._tasks[state.session_id] = asyncio.create_task(self._refresh(state, upto))
+
+    async def _refresh(self, state, upto):
+        base_upto, base_summary = state.summarized_upto, state.summary
+        # Copies, so a rewrite of the history while we wait can be detected below
+        entries = [dict(e) for e in state.history[base_upto:upto]]
+        if not entries:
+            return
+        try:
+            summary = await self._summarize(base_summary, entries, int(self.token_budget * SUMMARY_BUDGET_SHARE))
+        except Exception as e:
+            logger.error(f"History summary failed for {state.session_id}: {e}")
+            return
+        finally:
+            self._tasks.pop(state.session_id, None)
+        # Discard if the history was rewritten underneath us (resync, retry rollback)
+        if summary and state.summarized_upto == base_upto and state.summary == base_summary and state.history[base_upto:upto] == entries:
+            state.summary = summary.strip()
+            state.summarized_upto = upto
+            print(f"[DEBUG] Rolling summary for {state.session_id} now covers {upto} entries ({estimate_tokens(state.summary)} tokens)")
+            if self._on_update:
+                self._on_update(state)
@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+# Samples kept per histogram for percentile estimates
+HISTOGRAM_WINDOW = 512
+
+
+class _Histogram:
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.last = value
+        self.recent.append(value)
+
+    def snapshot(self):
+        ordered = sorted(self.recent)
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "last": self.last,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "max": ordered[-1] if ordered else 0.0,
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters, gauges and histograms served as JSON on /api/metrics.
+    Safe to update from worker threads as well as the event loop.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = defaultdict(_Histogram)
+        self.started_at = time.time()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            self._histograms[name].observe(value)
+
+    def call_event(self, policy_name, event, value=1):
+        """on_event hook for deadlines.CallPolicy: counts e.g. chat_hedged, tts_retried."""
+        self.inc(f"{policy_name}_{event}", value)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0.0)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_sec": time.time() - self.started_at,
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {name: h.snapshot() for name, h in self._histograms.items()},
+            }
+
+
+metrics = MetricsRegistry()
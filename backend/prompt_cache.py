@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from google.genai import types
+
+from governor import BACKGROUND, GovernorShed, governor
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# "provider": register static prefixes with the Gemini context cache
+# "local":    in-process stand-in (tests / offline), same request shape
+# "off":      always send the prefix as a plain system instruction
+PROMPT_CACHE_MODE = os.environ.get("PROMPT_CACHE_MODE", "provider").lower()
+PROMPT_CACHE_TTL_SEC = int(os.environ.get("PROMPT_CACHE_TTL_SEC", "3600"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.environ.get("PROMPT_CACHE_MAX_ENTRIES", "500"))
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("digest", "name", "expires_at", "failed", "hits")
+
+    def __init__(self, digest, name=None, expires_at=0.0, failed=False):
+        self.digest = digest
+        self.name = name
+        self.expires_at = expires_at
+        self.failed = failed
+        self.hits = 0
+
+
+class PrefixCache:
+    """
+    Splits each generation request into a per-session static prefix (system
+    instruction) and a per-turn dynamic tail (sent in contents).
+
+    In provider mode the prefix is registered once per session with
+    `client.aio.caches.create`, in a background task so no turn waits on it; until
+    it is ready, or if the provider rejects it (e.g. below the minimum cacheable
+    size), turns send the prefix uncached. Either way the prefix stays byte-identical
+    at the start of the request, which also lets implicit provider caching apply.
+    """
+    def __init__(self, get_client, model, mode=PROMPT_CACHE_MODE, ttl_sec=PROMPT_CACHE_TTL_SEC, max_entries=PROMPT_CACHE_MAX_ENTRIES):
+        self._get_client = get_client
+        self.model = model
+        self.mode = mode
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # session key -> _Entry
+        self._pending = {} # session key -> creation task
+
+    def generation_args(self, key, prefix, tail, prompt, **config):
+        """(contents, GenerateContentConfig) for one turn."""
+        contents = f"{tail}\n\n{prompt}" if tail else prompt
+        name = self._lookup(key, prefix) if key and self.mode != "off" else None
+        if name and self.mode == "provider":
+            return contents, types.GenerateContentConfig(cached_content=name, **config)
+        return contents, types.GenerateContentConfig(system_instruction=prefix, **config)
+
+    def _lookup(self, key, prefix):
+        digest = _digest(prefix)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            if entry.digest == digest and (entry.failed or entry.expires_at > time.monotonic()):
+                if entry.name:
+                    entry.hits += 1
+                return entry.name
+            # Prefix changed (persona/resume edited) or the provider entry expired
+            self._drop(key, entry)
+
+        if self.mode == "local":
+            self._store(key, _Entry(digest, name=f"local/{digest[:16]}", expires_at=time.monotonic() + self.ttl_sec))
+            return None # first turn pays full price, like the provider
+        if self.mode == "provider" and key not in self._pending:
+            self._pending[key] = asyncio.create_task(self._create(key, digest, prefix))
+        return None
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            old_key, old = self._entries.popitem(last=False)
+            self._drop(old_key, old, forget=False)
+
+    def _drop(self, key, entry, forget=True):
+        if forget:
+            self._entries.pop(key, None)
+        if self.mode == "provider" and entry.name:
+            asyncio.create_task(self._delete(entry.name))
+
+    async def _create(self, key, digest, prefix):
+        try:
+            async with governor.slot(BACKGROUND):
+                cached = await self._get_client().aio.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=prefix,
+                        display_name=key[:128],
+                        ttl=f"{self.ttl_sec}s",
+                    )
+                )
+            # Refresh a little early so a turn never references an expired entry
+            self._store(key, _Entry(digest, name=cached.name, expires_at=time.monotonic() + self.ttl_sec * 0.9))
+            metrics.inc("prompt_cache_created")
+            print(f"[DEBUG] Registered prompt prefix cache for {key}: {cached.name}")
+        except GovernorShed:
+            # Busy, not broken: a later turn tries again
+            metrics.inc("prompt_cache_create_deferred")
+        except Exception as e:
+            # Remember the failure for this prefix so we don't retry every turn
+            self._store(key, _Entry(digest, failed=True))
+            metrics.inc("prompt_cache_create_failed")
+            logger.warning(f"Prompt prefix cache unavailable for {key}: {e}")
+        finally:
+            self._pending.pop(key, None)
+
+    async def _delete(self, name):
+        try:
+            await self._get_client().aio.caches.delete(name=name)
+        except Exception as e:
+            logger.debug(f"Failed to delete cached content {name}: {e}")
+
+    def record_usage(self, key, usage, prefix=""):
+        """
+        Per-turn cached vs. uncached prompt token accounting from the provider's
+        usage_metadata. In local mode the cached share is estimated from the prefix.
+        """
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+        if self.mode == "local" and not cached_tokens:
+            entry = self._entries.get(key)
+            if entry is not None and entry.hits and prefix and entry.digest == _digest(prefix):
+                cached_tokens = min(prompt_tokens or len(prefix) // 4, len(prefix) // 4)
+        uncached_tokens = max(0, prompt_tokens - cached_tokens)
+        metrics.inc("chat_prompt_tokens_cached", cached_tokens)
+        metrics.inc("chat_prompt_tokens_uncached", uncached_tokens)
+        metrics.observe("chat_prompt_tokens_cached_per_turn", cached_tokens)
+        metrics.observe("chat_prompt_tokens_uncached_per_turn", uncached_tokens)
+        return cached_tokens, uncached_tokens
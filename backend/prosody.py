@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+
+# Live prosody from the WebRTC audio track. Everything is kept as exponentially
+# decaying running sums, so the cost per sample is constant and nothing is
+# recomputed over history when a snapshot is pushed.
+FRAME_SAMPLES = 320           # 20 ms at 16 kHz
+WINDOW_SEC = 4.0              # Time constant of the running averages
+VOICED_FLOOR_RMS = 0.01       # Frames quieter than this are treated as silence
+SYLLABLES_PER_WORD = 1.5
+SYLLABLE_ONSET = 1.2          # Envelope/running-RMS ratio that starts a syllable nucleus
+SYLLABLE_RELEASE = 0.8        # ...and the ratio it must drop below before the next one counts
+
+
+class ProsodyTracker:
+    """
+    Incremental volume, pitch-variability and speaking-rate estimates for a 16 kHz
+    mono stream. Units match the per-turn metrics in server.compute_audio_metrics so
+    the live meter and the logged keyframes agree.
+    """
+    def __init__(self, sample_rate=16000, frame_samples=FRAME_SAMPLES, window_sec=WINDOW_SEC):
+        self.sample_rate = sample_rate
+        self.frame_samples = frame_samples
+        self.frame_sec = frame_samples / float(sample_rate)
+        # Per-frame decay giving a time constant of window_sec
+        self.decay = math.exp(-self.frame_sec / window_sec)
+
+        self._frame = np.zeros(frame_samples, dtype=np.float32)
+        self._fill = 0
+
+        self.energy = 0.0          # EMA of mean-square over all frames
+        self.weight = 0.0          # EMA normaliser (warm-up correction)
+        self.zcr_mean = 0.0        # EMA of ZCR over voiced frames
+        self.zcr_sq = 0.0          # EMA of ZCR^2 over voiced frames
+        self.voiced_weight = 0.0
+        self.voiced_time = 0.0     # Decayed seconds of voiced audio
+        self.syllables = 0.0       # Decayed syllable-nucleus count
+        self._envelope = 0.0       # Fast envelope for nucleus detection
+        self._rising = False
+
+    def update_int16(self, samples):
+        """Feed a block of int16 PCM samples."""
+        i = 0
+        n = len(samples)
+        while i < n:
+            take = min(self.frame_samples - self._fill, n - i)
+            np.multiply(samples[i:i + take], 1.0 / 32768.0,
+                        out=self._frame[self._fill:self._fill + take], casting="unsafe")
+            self._fill += take
+            i += take
+            if self._fill == self.frame_samples:
+                self._update_frame(self._frame)
+                self._fill = 0
+
+    def _update_frame(self, frame):
+        d = self.decay
+        ms = float(np.dot(frame, frame)) / len(frame)
+        rms = math.sqrt(ms)
+
+        self.energy = d * self.energy + (1 - d) * ms
+        self.weight = d * self.weight + (1 - d)
+
+        self.voiced_time *= d
+        self.syllables *= d
+        if rms >= VOICED_FLOOR_RMS:
+            signs = np.signbit(frame)
+            zcr = float(np.count_nonzero(signs[1:] != signs[:-1])) / len(frame)
+            self.zcr_mean = d * self.zcr_mean + (1 - d) * zcr
+            self.zcr_sq = d * self.zcr_sq + (1 - d) * zcr * zcr
+            self.voiced_weight = d * self.voiced_weight + (1 - d)
+            self.voiced_time += self.frame_sec
+
+        # Syllable nuclei: peaks of the fast envelope over the slow running RMS, with
+        # hysteresis so one vowel is not counted twice
+        self._envelope = 0.6 * self._envelope + 0.4 * rms
+        slow_rms = math.sqrt(self.energy / self.weight) if self.weight > 0 else 0.0
+        if not self._rising:
+            if self._envelope > max(VOICED_FLOOR_RMS, SYLLABLE_ONSET * slow_rms):
+                self._rising = True
+                self.syllables += 1.0
+        elif self._envelope < SYLLABLE_RELEASE * slow_rms or self._envelope < VOICED_FLOOR_RMS:
+            self._rising = False
+
+    def snapshot(self):
+        """Current running metrics plus the derived confidence score."""
+        volume_rms = math.sqrt(self.energy / self.weight) if self.weight > 0 else 0.0
+        pitch_stdev = 400.0
+        if self.voiced_weight > 0:
+            mean = self.zcr_mean / self.voiced_weight
+            var = max(0.0, self.zcr_sq / self.voiced_weight - mean * mean)
+            pitch_stdev = math.sqrt(var) * 1000.0
+        pacing_wpm = 0.0
+        if self.voiced_time > 0.5:
+            pacing_wpm = (self.syllables / self.voiced_time) * 60.0 / SYLLABLES_PER_WORD
+        confidence = ((max(0.0, 1.0 - (pitch_stdev / 400.0))) * 0.4) + (min(1.0, volume_rms * 20.0) * 0.6)
+        return {
+            "volume_rms": volume_rms,
+            "pitch_stdev": pitch_stdev,
+            "pacing_wpm": pacing_wpm,
+            "confidence": confidence,
+            "is_speaking": self._envelope >= VOICED_FLOOR_RMS,
+        }
@@ -5,9 +5,12 @@ import io
 import asyncio
 import json
 import logging
+import math
 import uuid
 import os
+import time
 import tempfile
+from contextlib import aclosing
 import numpy as np
 import librosa
 from dotenv import load_dotenv
@@ -26,8 +29,6 @@ from aiohttp import web
 from aiortc import RTCPeerConnection, RTCSessionDescription
 from aiortc.contrib.media import MediaBlackhole
 from supabase_client import supabase_logger
-from openai import OpenAI, AsyncOpenAI
-from google import genai
 from google.genai import types
 from scipy.interpolate import interp1d
 import cv2
@@ -41,29 +42,40 @@ pcs = set()
 # Initialize API Clients and Shared Resources
 try:
     from stream_processor import (
-        get_landmarkers, get_visual_model, whisper_model,
+        get_landmarkers, get_visual_model, get_whisper_model,
         process_mediapipe_results, device, SEQUENCE_LENGTH, VisualConfidenceModel,
         VideoStreamProcessor, AudioStreamProcessor, DataChannelManager,
         SpeechAnalyzer
     )
     from anaylisis.engine import InterviewAnalyzerEngine
+    from transcription import (
+        ChunkedTranscription, ChunkedTranscriptionManager, MIN_TRIM_SAVING_SEC, SAMPLE_RATE,
+        create_transcription_backend
+    )
+    from vad import trim_silence
+    from catalog import PromptCatalog
+    from session_store import CodeVersionError, SessionState, SessionStore, TurnSequenceError, format_history
+    from history_compactor import HistoryCompactor
+    from prompt_cache import PrefixCache
+    from metrics import metrics
+    from streaming import ClientDisconnected, DisconnectWatch, ScoreTagParser, SSEWriter
+    from deadlines import CallPolicy, call_with_deadline, stream_with_deadline
+    from governor import BACKGROUND, GovernorShed, governor
+    from tts import OrderedSynthesizer, SentenceSynthesisError, SpeechPipeline, split_sentences, synthesize_stream, TTS_MODEL, TTS_PREWARM_POLICY, TTS_SAMPLE_RATE
+    from audio_encoding import OpusStreamEncoder, negotiate_container
+    from tts_cache import TTSCache
+    from clients import PROVIDER_MODE, STUB_PROVIDER_URL, clients
+    from session_prep import SessionPreparer
     
-    sync_client = OpenAI()
-    _async_client = None
-    def get_async_client():
-        global _async_client
-        if _async_client is None:
-            _async_client = AsyncOpenAI()
-        return _async_client
-        
-    _gemini_client = None
-    def get_gemini_client():
-        global _gemini_client
-        if _gemini_client is None:
-            _gemini_client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY", ""))
-        return _gemini_client
+    # Provider clients share pooled keep-alive connections (see clients.py)
+    get_async_client = clients.async_openai
+    get_gemini_client = clients.gemini
         
     analyzer_engine = InterviewAnalyzerEngine()
+    stt_backend = create_transcription_backend(get_async_client, get_whisper_model)
+    if stt_backend.name == "local":
+        get_whisper_model() # Load up front so the first turn doesn't pay for it
+    print(f"STT backend: {stt_backend.name}")
     
     # Load base prompt constraints
     BASE_PROMPT = ""
@@ -71,6 +83,56 @@ try:
     if os.path.exists(base_prompt_path):
         with open(base_prompt_path, "r") as f:
             BASE_PROMPT = f.read()
+
+    # Personas and job descriptions, parsed once and reloaded only when edited
+    prompt_catalog = PromptCatalog(os.path.join(BACKEND_DIR, "prompts"))
+    session_store = SessionStore()
+
+    # Latency budgets per provider call (overridable via <NAME>_DEADLINE_SEC etc.)
+    CHAT_POLICY = CallPolicy.from_env("chat", budget_sec=30.0, first_chunk_sec=8.0, on_event=metrics.call_event, governor=governor)
+    INIT_SESSION_POLICY = CallPolicy.from_env("init_session", budget_sec=30.0, first_chunk_sec=15.0, default_hedge_sec=5.0, on_event=metrics.call_event, governor=governor)
+    # Opening questions generated before anyone asked for them: may never be claimed, so no hedge
+    SPECULATIVE_QUESTION_POLICY = CallPolicy.from_env("speculative_question", budget_sec=30.0, first_chunk_sec=15.0, hedge=False, on_event=metrics.call_event, governor=governor, priority=BACKGROUND)
+    SUMMARY_POLICY = CallPolicy.from_env("summary", budget_sec=30.0, first_chunk_sec=20.0, hedge=False, on_event=metrics.call_event, governor=governor, priority=BACKGROUND)
+
+    async def summarize_history(previous_summary, entries, max_tokens):
+        """Fold aged-out conversation entries into the rolling interview summary."""
+        prompt = ""
+        if previous_summary:
+            prompt += f"CURRENT SUMMARY:\n{previous_summary}\n\n"
+        prompt += format_history(entries)
+        response = await call_with_deadline(lambda: get_gemini_client().aio.models.generate_content(
+            model="models/gemini-3-flash-preview",
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                system_instruction=(
+                    "You maintain a running summary of a job interview for the interviewer. "
+                    "Merge the new conversation lines into the current summary. Keep questions asked, "
+                    "the candidate's key claims, technologies, numbers and weak spots. "
+                    f"Plain prose, third person, under {max_tokens * 3 // 4} words."
+                ),
+                max_output_tokens=max_tokens,
+                temperature=0.2,
+            )
+        ), SUMMARY_POLICY)
+        return response.text or ""
+
+    # Keeps the per-turn chat prompt bounded as interviews get long
+    history_compactor = HistoryCompactor(summarize_history, on_update=session_store.save)
+
+    # Static per-session system context is registered once with the provider's cache
+    CHAT_MODEL = "models/gemini-3-flash-preview"
+    prompt_cache = PrefixCache(get_gemini_client, CHAT_MODEL)
+
+    # Opening questions generated while the candidate is still on the upload screen
+    session_preparer = SessionPreparer(
+        lambda system_prompt, user_prompt: generate_question(system_prompt, user_prompt, SPECULATIVE_QUESTION_POLICY),
+        lambda *inputs: initial_question_prompts(*inputs),
+        warm=clients.warm
+    )
+
+    # Repeated utterances (greetings, transitions, sign-offs) are synthesized once
+    tts_cache = TTSCache(lambda text, voice: synthesize_stream(get_gemini_client(), text, voice), TTS_MODEL)
             
     print("Backend initialization successful (Models, API clients, & Analyzer ready)")
 except Exception as e:
@@ -79,6 +141,19 @@ except Exception as e:
     traceback.print_exc()
     sys.exit(1)
 
+GRADING_RUBRIC = (
+    "CRITICAL GRADING INSTRUCTION: You MUST evaluate the candidate's last answer and assign a quality score A (0.0 to 1.0).\n"
+    "IMPORTANT: Decouple your persona's tone from this grade. Even if your persona is skeptical, aggressive, or cold, you MUST give a high score (0.8-1.0) if the candidate provides specific, deep technical details (e.g., race conditions, idempotency, architectural trade-offs).\n"
+    "Scoring Rubric (BE OBJECTIVE AND REWARD TECHNICAL DEPTH):\n"
+    "- 0.0-0.1: Says 'no', one-word/vague answer, deflects, or low effort.\n"
+    "- 0.2-0.3: Basic but incomplete or factually weak answer.\n"
+    "- 0.4-0.6: Solid, standard technical answer covering the basics.\n"
+    "- 0.7-0.8: Strong technical answer with specific architectural details or complex problem solving.\n"
+    "- 0.9-1.0: Mastery. Exceptional depth, trade-offs, scalability, and specific advanced technical concepts.\n"
+    "\n"
+    "At the VERY END of your response, you MUST output a score tag in this EXACT format: [SCORE: 0.95]. "
+)
+
 FALLBACK_QUESTIONS = [
     "Welcome to Ace It. To start, can you tell me a bit about your experience with AI and machine learning?",
     "That's interesting. How do you approach debugging a complex problem in your code?",
@@ -181,6 +256,136 @@ def convert_to_wav(input_path):
         logger.error(f"FFmpeg conversion failed: {e}")
         return None
 
+def load_audio_pcm(a_path, sr=None):
+    """
+    Decode an uploaded audio file to mono float PCM, falling back to an ffmpeg
+    WAV conversion for containers librosa cannot read directly (e.g. webm).
+    Returns (samples, sample_rate); samples is empty when decoding fails.
+    """
+    try:
+        return librosa.load(a_path, sr=sr)
+    except Exception:
+        print(f"[DEBUG] Direct load failed for {a_path}, trying WAV conversion fallback...")
+        wav_path = convert_to_wav(a_path)
+        if wav_path and os.path.exists(wav_path):
+            try:
+                return librosa.load(wav_path, sr=sr)
+            finally:
+                if os.path.exists(wav_path): os.remove(wav_path)
+        return np.array([], dtype=np.float32), sr or 16000
+
+def compute_audio_metrics(y, sr, transcribed_text, speech_duration=None):
+    """
+    Volume, pitch-variability and pacing metrics for one answer. Pacing divides by
+    speech_duration when the caller has already measured it with the VAD.
+    """
+    mean_rms = 0.05
+    pitch_stdev = 400
+    pacing_wpm = 0
+    confidence_score = 0.5
+    if len(y) > 0:
+        duration = speech_duration if speech_duration else librosa.get_duration(y=y, sr=sr)
+        word_count = len(transcribed_text.split())
+        pacing_wpm = (word_count / duration) * 60 if duration > 0 else 0
+        
+        rms_data = librosa.feature.rms(y=y)
+        mean_rms = np.mean(rms_data) if rms_data.size > 0 else 0.05
+        
+        zcr = librosa.feature.zero_crossing_rate(y)
+        active_zcr = zcr[zcr > np.median(zcr)]
+        pitch_stdev = (np.std(active_zcr) * 1000) if len(active_zcr) > 0 else 400
+        
+        confidence_score = ((max(0.0, 1.0 - (pitch_stdev / 400.0))) * 0.4) + (min(1.0, mean_rms * 20.0) * 0.6)
+        print(f"[DEBUG] Audio metrics: RMS={mean_rms:.4f}, PitchSD={pitch_stdev:.2f}, WPM={pacing_wpm:.1f}, Conf={confidence_score:.2f}")
+    return {
+        "mean_rms": mean_rms,
+        "pitch_stdev": pitch_stdev,
+        "pacing_wpm": pacing_wpm,
+        "confidence_score": confidence_score,
+    }
+
+async def transcribe_file(path):
+    return await stt_backend.transcribe_file(path)
+
+async def transcribe_pcm(pcm, sr):
+    return await stt_backend.transcribe(pcm, sr)
+
+async def transcribe_speech(pcm, speech, sr, original_path=None):
+    """
+    STT for one upload: the VAD-trimmed speech, unless trimming removed next to
+    nothing and the backend takes files, in which case the client's original
+    (already compressed) upload is sent instead of a re-encode.
+    """
+    if original_path and stt_backend.accepts_files and len(pcm) - len(speech) < MIN_TRIM_SAVING_SEC * sr:
+        return await transcribe_file(original_path)
+    return await transcribe_pcm(speech, sr)
+
+async def run_metrics_background(s_id, t_sec, transcribed_text, a_path=None, v_data=None, pcm=None, sr=16000, speech_duration=None, video_metrics=None):
+    """
+    Heavy per-turn biometrics, run off the request path. Audio comes either from an
+    uploaded file (a_path, removed afterwards) or from already-decoded PCM. Video
+    comes from an uploaded clip or, for live turns, the latest (conf, gaze, fidget)
+    from the VideoStreamProcessor.
+    """
+    try:
+        print(f"[DEBUG] Processing metrics for session {s_id} at {t_sec}s")
+        audio_metrics = compute_audio_metrics(np.array([]), sr, transcribed_text)
+
+        # Audio Metrics
+        try:
+            if pcm is None and a_path:
+                pcm, sr = await asyncio.to_thread(load_audio_pcm, a_path)
+            if pcm is not None:
+                audio_metrics = await asyncio.to_thread(compute_audio_metrics, pcm, sr, transcribed_text, speech_duration)
+        except Exception as lib_err:
+            print(f"[ERROR] Audio metrics calculation failed: {lib_err}")
+
+        # Video Metrics
+        v_conf, v_gaze, v_fidget = video_metrics or (0.5, 0.8, 0.1)
+        if v_data:
+            t_video = os.path.join(tempfile.gettempdir(), f"v_{uuid.uuid4().hex}.webm")
+            with open(t_video, 'wb') as f: f.write(v_data)
+            try:
+                v_conf, v_gaze, v_fidget = await asyncio.to_thread(extract_video_metrics, t_video)
+                print(f"[DEBUG] Video metrics: Gaze={v_gaze:.2f}, Fidget={v_fidget:.2f}, Conf={v_conf:.2f}")
+            except Exception as vid_err:
+                print(f"[ERROR] Video analysis failed: {vid_err}")
+            finally:
+                if os.path.exists(t_video): os.remove(t_video)
+        elif not video_metrics:
+            print(f"[DEBUG] No video data provided")
+
+        # Speech Analysis (Fillers & Tone)
+        speech_results = SpeechAnalyzer.analyze(transcribed_text)
+        filler_count = speech_results["filler_count"]
+        sentiment_score = speech_results["sentiment"]
+
+        # Log to Supabase (Unified record)
+        print(f"[DEBUG] Logging Background Analysis for {s_id}")
+        confidence_score = audio_metrics["confidence_score"]
+        supabase_logger.log_keyframe(
+            session_id=s_id,
+            timestamp_sec=t_sec,
+            associated_transcript=transcribed_text,
+            volume_rms=float(audio_metrics["mean_rms"]),
+            pitch_stdev=float(audio_metrics["pitch_stdev"]),
+            pacing_wpm=float(audio_metrics["pacing_wpm"]),
+            is_audibly_confident=confidence_score >= 0.5,
+            gaze_score=float(v_gaze),
+            fidget_index=float(v_fidget),
+            is_visually_confident=v_conf >= 0.5,
+            overall_confidence_score=float(confidence_score),
+            filler_words_count=filler_count,
+            sentiment_score=sentiment_score,
+            keyframe_reason="Background Analysis"
+        )
+    except Exception as e:
+        logger.error(f"Background metrics error: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        if a_path and os.path.exists(a_path): os.remove(a_path)
+
 async def stream_process(request):
     reader = await request.multipart()
     audio_data = None
@@ -203,204 +408,418 @@ async def stream_process(request):
     if not audio_data:
         return web.json_response({"error": "No audio provided"}, status=400)
 
-    # 1. Transcribe immediately
     temp_audio = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4().hex}.webm")
     with open(temp_audio, 'wb') as f:
         f.write(audio_data)
 
     try:
-        with open(temp_audio, "rb") as f:
-            transcription = await get_async_client().audio.transcriptions.create(model="whisper-1", file=f)
-        text = transcription.text
+        # 1. Decode once and drop silence before anything is sent to STT
+        pcm, sr = await asyncio.to_thread(load_audio_pcm, temp_audio, SAMPLE_RATE)
+        if len(pcm) == 0:
+            # Undecodable here; let the STT backend try the original container
+            text = await transcribe_file(temp_audio)
+            asyncio.create_task(run_metrics_background(session_id, timestamp_sec, text, a_path=temp_audio, v_data=video_data))
+            return web.json_response({"text": text})
+
+        speech, speech_duration, _ = await asyncio.to_thread(trim_silence, pcm, sr)
+        if speech_duration == 0:
+            os.remove(temp_audio)
+            print(f"[DEBUG] Silent upload for session {session_id}, skipping STT")
+            return web.json_response({"text": "", "silent": True, "speech_duration_sec": 0.0})
+
+        # 2. Transcribe the speech-only audio (or the original upload if nothing was trimmed)
+        text = await transcribe_speech(pcm, speech, sr, temp_audio)
+        os.remove(temp_audio)
         
-        # 2. Return text to frontend ASAP
-        # We start a background task for the heavy biometrics
-        # We need a copy of video_data if we want to process it in background
-        async def run_metrics_background(a_path, v_data, s_id, t_sec, transcribed_text):
-            try:
-                print(f"[DEBUG] Processing metrics for session {s_id} at {t_sec}s")
-                # Defaults
-                mean_rms = 0.05
-                pitch_stdev = 400
-                pacing_wpm = 0
-                confidence_score = 0.5
-                
-                # Audio Metrics
-                try:
-                    # Try direct load first
-                    try:
-                        y, sr = librosa.load(a_path, sr=None)
-                    except Exception:
-                        print(f"[DEBUG] Direct load failed for {a_path}, trying WAV conversion fallback...")
-                        wav_path = convert_to_wav(a_path)
-                        if wav_path and os.path.exists(wav_path):
-                            y, sr = librosa.load(wav_path, sr=None)
-                            if os.path.exists(wav_path): os.remove(wav_path)
-                        else:
-                            y = np.array([])
-                    
-                    if len(y) > 0:
-                        duration = librosa.get_duration(y=y, sr=sr)
-                        word_count = len(transcribed_text.split())
-                        pacing_wpm = (word_count / duration) * 60 if duration > 0 else 0
-                        
-                        rms_data = librosa.feature.rms(y=y)
-                        mean_rms = np.mean(rms_data) if rms_data.size > 0 else 0.05
-                        
-                        zcr = librosa.feature.zero_crossing_rate(y)
-                        active_zcr = zcr[zcr > np.median(zcr)]
-                        pitch_stdev = (np.std(active_zcr) * 1000) if len(active_zcr) > 0 else 400
-                        
-                        confidence_score = ((max(0.0, 1.0 - (pitch_stdev / 400.0))) * 0.4) + (min(1.0, mean_rms * 20.0) * 0.6)
-                        print(f"[DEBUG] Audio metrics: RMS={mean_rms:.4f}, PitchSD={pitch_stdev:.2f}, WPM={pacing_wpm:.1f}, Conf={confidence_score:.2f}")
-                except Exception as lib_err:
-                    print(f"[ERROR] Audio metrics calculation failed: {lib_err}")
-
-                # Video Metrics
-                v_conf, v_gaze, v_fidget = 0.5, 0.8, 0.1
-                if v_data:
-                    t_video = os.path.join(tempfile.gettempdir(), f"v_{uuid.uuid4().hex}.webm")
-                    with open(t_video, 'wb') as f: f.write(v_data)
-                    try:
-                        v_conf, v_gaze, v_fidget = await asyncio.to_thread(extract_video_metrics, t_video)
-                        print(f"[DEBUG] Video metrics: Gaze={v_gaze:.2f}, Fidget={v_fidget:.2f}, Conf={v_conf:.2f}")
-                    except Exception as vid_err:
-                        print(f"[ERROR] Video analysis failed: {vid_err}")
-                    finally:
-                        if os.path.exists(t_video): os.remove(t_video)
-                else:
-                    print(f"[DEBUG] No video data provided")
-
-                # Speech Analysis (Fillers & Tone)
-                speech_results = SpeechAnalyzer.analyze(transcribed_text)
-                filler_count = speech_results["filler_count"]
-                sentiment_score = speech_results["sentiment"]
-
-                # Log to Supabase (Unified record)
-                print(f"[DEBUG] Logging Background Analysis for {s_id}")
-                supabase_logger.log_keyframe(
-                    session_id=s_id,
-                    timestamp_sec=t_sec,
-                    associated_transcript=transcribed_text,
-                    volume_rms=float(mean_rms),
-                    pitch_stdev=float(pitch_stdev),
-                    pacing_wpm=float(pacing_wpm),
-                    is_audibly_confident=confidence_score >= 0.5,
-                    gaze_score=float(v_gaze),
-                    fidget_index=float(v_fidget),
-                    is_visually_confident=v_conf >= 0.5,
-                    overall_confidence_score=float(confidence_score),
-                    filler_words_count=filler_count,
-                    sentiment_score=sentiment_score,
-                    keyframe_reason="Background Analysis"
-                )
-            except Exception as e:
-                logger.error(f"Background metrics error: {e}")
-                import traceback
-                traceback.print_exc()
-            finally:
-                if os.path.exists(a_path): os.remove(a_path)
+        # 3. Return text to frontend ASAP
+        # We start a background task for the heavy biometrics; they see the real
+        # pauses, and only pacing uses the VAD speech duration
+        asyncio.create_task(run_metrics_background(
+            session_id, timestamp_sec, text, v_data=video_data,
+            pcm=pcm, sr=sr, speech_duration=speech_duration
+        ))
+
+        return web.json_response({"text": text, "speech_duration_sec": round(speech_duration, 2)})
+    except Exception as e:
+        if os.path.exists(temp_audio): os.remove(temp_audio)
+        return web.json_response({"error": str(e)}, status=500)
 
-        # Fire and forget
-        asyncio.create_task(run_metrics_background(temp_audio, video_data, session_id, timestamp_sec, text))
+# --- CHUNKED (INCREMENTAL) TRANSCRIPTION ---
+# The client uploads self-contained audio segments while the candidate is still
+# talking (each one re-including `overlap_sec` of the previous segment's tail).
+# Segments are transcribed in the background; at turn end only the last segment
+# is still in flight.
+chunked_turns = ChunkedTranscriptionManager(transcribe_speech, load_audio_pcm)
+
+async def _read_chunk_form(request):
+    reader = await request.multipart()
+    form = {"audio": None, "video": None, "filename": ""}
+    while True:
+        part = await reader.next()
+        if part is None: break
+        if part.name == 'audio':
+            form["filename"] = getattr(part, 'filename', '') or ''
+            form["audio"] = await part.read()
+        elif part.name == 'video':
+            form["video"] = await part.read()
+        else:
+            form[part.name] = (await part.read()).decode()
+    return form
+
+def _segment_suffix(filename):
+    ext = os.path.splitext(filename)[1]
+    return ext if ext else ".webm"
+
+async def stream_chunk(request):
+    form = await _read_chunk_form(request)
+    session_id = form.get("session_id")
+    turn_id = form.get("turn_id")
+    if not session_id or not turn_id:
+        return web.json_response({"error": "session_id and turn_id are required"}, status=400)
+    if not form["audio"]:
+        return web.json_response({"error": "No audio provided"}, status=400)
+    try:
+        seq = int(form.get("seq", 0))
+        overlap_sec = float(form.get("overlap_sec", 0.0))
+    except ValueError:
+        return web.json_response({"error": "seq and overlap_sec must be numeric"}, status=400)
+
+    turn = chunked_turns.get_or_create(session_id, turn_id)
+    turn.add_segment(seq, form["audio"], overlap_sec, suffix=_segment_suffix(form["filename"]))
+    return web.json_response({"turn_id": turn_id, "seq": seq, "pending": turn.pending}, status=202)
+
+async def stream_finalize(request):
+    form = await _read_chunk_form(request)
+    session_id = form.get("session_id")
+    turn_id = form.get("turn_id")
+    if not session_id or not turn_id:
+        return web.json_response({"error": "session_id and turn_id are required"}, status=400)
+    try:
+        timestamp_sec = float(form.get("timestamp_sec", 0.0))
+    except ValueError:
+        timestamp_sec = 0.0
+
+    turn = chunked_turns.pop(session_id, turn_id)
+    if turn is None and not form["audio"]:
+        return web.json_response({"error": "Unknown turn and no audio provided"}, status=404)
+    if turn is None:
+        turn = ChunkedTranscription(session_id, turn_id, transcribe_speech, load_audio_pcm)
+    if form["audio"]:
+        try:
+            seq = int(form.get("seq", max(turn.segments, default=-1) + 1))
+            overlap_sec = float(form.get("overlap_sec", 0.0))
+        except ValueError:
+            return web.json_response({"error": "seq and overlap_sec must be numeric"}, status=400)
+        turn.add_segment(seq, form["audio"], overlap_sec, suffix=_segment_suffix(form["filename"]))
 
-        return web.json_response({"text": text})
+    try:
+        text, pcm = await turn.finalize()
     except Exception as e:
-        if os.path.exists(temp_audio): os.remove(temp_audio)
+        turn.cancel()
         return web.json_response({"error": str(e)}, status=500)
 
-async def init_session(request):
+    _, speech_duration, _ = await asyncio.to_thread(trim_silence, pcm, SAMPLE_RATE)
+    print(f"[DEBUG] Chunked turn {turn_id} finalized from {len(turn.segments)} segments ({speech_duration:.1f}s speech)")
+    if speech_duration > 0:
+        asyncio.create_task(run_metrics_background(
+            session_id, timestamp_sec, text, v_data=form["video"],
+            pcm=pcm, sr=SAMPLE_RATE, speech_duration=speech_duration
+        ))
+    return web.json_response({
+        "text": text,
+        "segments": len(turn.segments),
+        "silent": speech_duration == 0,
+        "speech_duration_sec": round(speech_duration, 2)
+    })
+
+# --- LIVE TURNS (segmented server-side from the WebRTC audio track) ---
+async def handle_live_turn(pcm, turn, dc_manager, video_processor=None):
+    """
+    Transcribe a turn cut from the live audio track and push the text back over the
+    DataChannel; the PCM never leaves memory and is never decoded twice.
+    """
+    session_id = turn["session_id"]
+    reply = {"type": "turn_transcript", "turn_id": turn["turn_id"], "timestamp_sec": turn["timestamp_sec"], "reason": turn["reason"]}
     try:
-        reader = await request.multipart()
-        resume_text = ""
-        job_description = ""
-        interviewer_persona_id = ""
-        role = "Software Engineer"
-        company = "AceIt"
-        user_id = ""
-        resume_filename = "resume.pdf"
-        
-        while True:
-            part = await reader.next()
-            if part is None: break
-            if part.name == 'resume':
-                resume_filename = getattr(part, 'filename', '') or 'resume.pdf'
-                content = await part.read()
-                if resume_filename.endswith('.pdf'):
-                    resume_text = extract_text_from_pdf(content)
-                else:
-                    resume_text = content.decode('utf-8', errors='ignore')
-            elif part.name == 'job_description':
-                job_description = (await part.read()).decode('utf-8')
-            elif part.name == 'interviewer_persona':
-                interviewer_persona_id = (await part.read()).decode('utf-8')
-            elif part.name == 'role':
-                role = (await part.read()).decode('utf-8')
-            elif part.name == 'company':
-                company = (await part.read()).decode('utf-8')
-            elif part.name == 'user_id':
-                user_id = (await part.read()).decode('utf-8')
-
-        # Load persona prompt
-        persona_prompt = "You are an expert AI Interviewer."
-        if interviewer_persona_id:
-            persona_path = os.path.join(BACKEND_DIR, "prompts", "interviewers", f"{interviewer_persona_id}.json")
-            if os.path.exists(persona_path):
-                try:
-                    with open(persona_path, 'r') as f:
-                        data = json.load(f)
-                        persona_prompt = f"PERSONA: {data.get('name')}\n"
-                        persona_prompt += f"ROLE: {data.get('role')}\n"
-                        persona_prompt += f"TRAITS: {data.get('traits')}\n\n"
-                        persona_prompt += f"YOUR MISSION:\n{data.get('description')}\n"
-                        if data.get('example_reaction'):
-                            persona_prompt += f"\nEXAMPLE REACTION: {data.get('example_reaction')}"
-                except Exception as e:
-                    logger.error(f"Error loading persona JSON: {e}")
-
-
-        system_prompt = (
-            f"{BASE_PROMPT}\n\n"
-            "--- CURRENT INTERVIEWER PERSONA ---\n"
-            f"{persona_prompt}\n\n"
-            "Based on the candidate's resume and the job description, "
-            "introduce yourself briefly and ask an introductory question about their background. "
-            "Keep it professional and concise (under 3 sentences)."
-        )
-        user_prompt = f"Resume:\n{resume_text}\n\nJob Description:\n{job_description}"
-        
-        # Immediate generation for first question
-        gemini = get_gemini_client()
-        response = await gemini.aio.models.generate_content(
-            model="models/gemini-3-flash-preview",
-            contents=user_prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-            )
+        if pcm is None or len(pcm) == 0:
+            dc_manager.send_json({**reply, "text": "", "silent": True, "speech_duration_sec": 0.0})
+            return
+        speech, speech_duration, _ = await asyncio.to_thread(trim_silence, pcm, SAMPLE_RATE)
+        if speech_duration == 0:
+            dc_manager.send_json({**reply, "text": "", "silent": True, "speech_duration_sec": 0.0})
+            return
+
+        text = await transcribe_pcm(speech, SAMPLE_RATE)
+        dc_manager.send_json({**reply, "text": text, "silent": False, "speech_duration_sec": round(speech_duration, 2)})
+
+        video_metrics = video_processor.last_inference if video_processor else None
+        asyncio.create_task(run_metrics_background(
+            session_id, turn["timestamp_sec"], text, pcm=pcm, sr=SAMPLE_RATE,
+            speech_duration=speech_duration, video_metrics=video_metrics
+        ))
+    except Exception as e:
+        logger.error(f"Live turn {turn['turn_id']} failed: {e}")
+        dc_manager.send_json({**reply, "error": str(e)})
+
+INIT_SESSION_MODEL = "models/gemini-3-flash-preview"
+DEFAULT_INITIAL_QUESTION = "Welcome. Tell me about your background."
+
+
+async def _read_session_form(request):
+    """Fields of the init-session / prepare-session multipart form that were sent."""
+    form = {}
+    reader = await request.multipart()
+    while True:
+        part = await reader.next()
+        if part is None: break
+        if part.name == 'resume':
+            form['resume_filename'] = getattr(part, 'filename', '') or 'resume.pdf'
+            content = await part.read()
+            if form['resume_filename'].endswith('.pdf'):
+                # pypdf is pure Python and slow on long resumes; keep it off the event loop
+                form['resume_text'] = await asyncio.to_thread(extract_text_from_pdf, content)
+            else:
+                form['resume_text'] = content.decode('utf-8', errors='ignore')
+        elif part.name in ('resume_text', 'job_description', 'interviewer_persona', 'role', 'company', 'user_id', 'prep_id', 'tts', 'voice'):
+            form[part.name] = (await part.read()).decode('utf-8')
+    return form
+
+
+def _form_flag(value):
+    """Checkbox-style form field: "1"/"true"/"yes"/"on" are set, anything else is not."""
+    return (value or "").strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _client_timestamp(value):
+    """A client-supplied session time in seconds, or None unless it is a finite, non-negative number."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) and value >= 0 else None
+
+
+def _verbatim_instruction(persona_id, field, position):
+    """Prompt suffix making the model open/close with the persona's cached phrase, if it has one."""
+    phrase = (prompt_catalog.persona(persona_id) or {}).get(field) if persona_id else None
+    if not phrase:
+        return ""
+    return f" {position} your response with exactly this sentence: '{phrase}'"
+
+
+def initial_question_prompts(interviewer_persona_id, resume_text, job_description):
+    """(system_instruction, contents) for the opening question."""
+    # Load persona prompt
+    persona_prompt = prompt_catalog.persona_prompt(interviewer_persona_id, "You are an expert AI Interviewer.")
+
+    system_prompt = (
+        f"{BASE_PROMPT}\n\n"
+        "--- CURRENT INTERVIEWER PERSONA ---\n"
+        f"{persona_prompt}\n\n"
+        "Based on the candidate's resume and the job description, "
+        "introduce yourself briefly and ask an introductory question about their background. "
+        "Keep it professional and concise (under 3 sentences)."
+        + _verbatim_instruction(interviewer_persona_id, "greeting", "Start")
+    )
+    user_prompt = f"Resume:\n{resume_text}\n\nJob Description:\n{job_description}"
+    return system_prompt, user_prompt
+
+
+async def generate_question(system_prompt, user_prompt, policy=INIT_SESSION_POLICY):
+    gemini = get_gemini_client()
+    response = await call_with_deadline(lambda: gemini.aio.models.generate_content(
+        model=INIT_SESSION_MODEL,
+        contents=user_prompt,
+        config=types.GenerateContentConfig(
+            system_instruction=system_prompt,
         )
-        initial_question = response.text or "Welcome. Tell me about your background."
-        
+    ), policy)
+    return response.text or DEFAULT_INITIAL_QUESTION
+
+
+async def generate_initial_question(interviewer_persona_id, resume_text, job_description):
+    system_prompt, user_prompt = initial_question_prompts(interviewer_persona_id, resume_text, job_description)
+    return await generate_question(system_prompt, user_prompt)
+
+
+async def prepare_session(request):
+    """
+    Phase one of session setup, called as soon as the interviewer and job are
+    picked (and again with the resume once it is available). Returns a prep_id for
+    /api/init-session; the opening question is generated in the meantime.
+    """
+    try:
+        form = await _read_session_form(request)
+    except Exception as e:
+        return web.json_response({"error": f"Invalid form: {e}"}, status=400)
+    entry = session_preparer.prepare(
+        form.get('prep_id'),
+        persona_id=form.get('interviewer_persona', ''),
+        job_text=form.get('job_description', ''),
+        role=form.get('role', ''),
+        company=form.get('company', ''),
+        user_id=form.get('user_id', ''),
+        resume_text=form.get('resume_text', ''),
+        resume_filename=form.get('resume_filename', ''),
+    )
+    return web.json_response({"prep_id": entry.prep_id, "question_started": entry.question is not None})
+
+
+async def init_session(request):
+    try:
+        form = await _read_session_form(request)
+        # Anything not re-sent comes from the matching /api/prepare-session call
+        prep = session_preparer.take(form.get('prep_id'))
+        resume_text = form.get('resume_text') or (prep.resume_text if prep else "")
+        job_description = form.get('job_description') or (prep.job_text if prep else "")
+        interviewer_persona_id = form.get('interviewer_persona') or (prep.persona_id if prep else "")
+        role = form.get('role') or (prep and prep.role) or "Software Engineer"
+        company = form.get('company') or (prep and prep.company) or "AceIt"
+        user_id = form.get('user_id') or (prep.user_id if prep else "")
+        resume_filename = form.get('resume_filename') or (prep and prep.resume_filename) or "resume.pdf"
+
         session_id = f"session-{uuid.uuid4().hex[:8]}"
-        
-        # Save metadata to Supabase (Initial)
-        supabase_logger.save_session_metadata(session_id, role, company, user_id=user_id)
-        
-        # PERSIST RESUME: If we have a user_id, save the extracted resume text for future auto-fill
-        if user_id and resume_text:
-            logger.info(f"[PERSISTENCE] Saving resume for user {user_id}")
-            supabase_logger.save_resume(user_id, resume_text, filename=resume_filename)
+        # Server-side conversation state; /api/chat only needs deltas from here on.
+        # It joins the store only once the opening question exists, so a failed
+        # init leaves no session behind
+        state = SessionState(
+            session_id, persona_id=interviewer_persona_id, resume_text=resume_text,
+            job_text=job_description, role=role, company=company
+        )
+
+        async def persist_session():
+            try:
+                # Save metadata to Supabase (Initial)
+                await asyncio.to_thread(supabase_logger.save_session_metadata, session_id, role, company, user_id=user_id)
+
+                # PERSIST RESUME: If we have a user_id, save the extracted resume text for future auto-fill
+                if user_id and resume_text:
+                    logger.info(f"[PERSISTENCE] Saving resume for user {user_id}")
+                    await asyncio.to_thread(supabase_logger.save_resume, user_id, resume_text, filename=resume_filename)
+            except Exception as e:
+                logger.error(f"Session persistence failed for {session_id}: {e}")
+
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            return await _stream_init_session(request, state, prep, form, persist_session)
+
+        # Usually already generated speculatively; otherwise generate it now
+        initial_question = None
+        if prep:
+            initial_question = await session_preparer.question_for(prep, interviewer_persona_id, resume_text, job_description)
+        if initial_question is None:
+            initial_question = await generate_initial_question(interviewer_persona_id, resume_text, job_description)
+
+        state.add_entry("interviewer", initial_question)
+        session_store.add(state)
+        await persist_session()
         
         return web.json_response({
             "session_id": session_id,
             "resume_text": resume_text,
             "job_text": job_description,
-            "initial_question": initial_question
+            "initial_question": initial_question,
+            "turn_seq": state.turn_seq
         })
     except Exception as e:
         import traceback
         traceback.print_exc()
         return web.json_response({"error": str(e)}, status=500)
 
+
+async def _stream_init_session(request, state, prep, form, persist_session):
+    """
+    SSE variant of init_session (Accept: text/event-stream): {"session_id", ...}
+    first, then the opening question as {"token"} events (plus audio events when
+    the form sets `tts`), then {"done", "initial_question", "turn_seq"}. The resume
+    is not echoed back. The session is in the store from the first event, so the
+    client can open its peer connection at once; the greeting joins its history
+    just before "done". If the stream does not complete, the session is discarded
+    and later requests treat it as unknown; otherwise it is written to Supabase
+    afterwards.
+    """
+    response = web.StreamResponse(
+        status=200,
+        reason='OK',
+        headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'}
+    )
+    await response.prepare(request)
+    sse = SSEWriter(response)
+
+    speech = None
+    initial_question = ""
+    completed = False
+    watch = DisconnectWatch(request)
+    session_store.add(state)
+    try:
+        async with watch:
+            await sse.send({'session_id': state.session_id, 'job_text': state.job_text, 'turn_seq': state.turn_seq})
+            if _form_flag(form.get('tts')):
+                persona = prompt_catalog.persona(state.persona_id) or {}
+                speech = SpeechPipeline(tts_cache.stream, sse.send, voice=form.get('voice') or persona.get('voice'))
+
+            # A finished speculative question goes out at once; otherwise stream a fresh one
+            if prep:
+                initial_question = await watch.race(session_preparer.question_for(prep, state.persona_id, state.resume_text, state.job_text)) or ""
+            if initial_question:
+                await sse.send_token(initial_question)
+                if speech:
+                    speech.feed(initial_question)
+            else:
+                inputs = (state.persona_id, state.resume_text, state.job_text)
+                system_prompt, user_prompt = (prep and session_preparer.prompts_for(prep, *inputs)) or initial_question_prompts(*inputs)
+                gemini = get_gemini_client()
+                stream = stream_with_deadline(lambda: gemini.aio.models.generate_content_stream(
+                    model=INIT_SESSION_MODEL,
+                    contents=user_prompt,
+                    config=types.GenerateContentConfig(system_instruction=system_prompt)
+                ), INIT_SESSION_POLICY)
+                async with aclosing(watch.guard(stream)) as chunks:
+                    async for chunk in chunks:
+                        if chunk.text:
+                            initial_question += chunk.text
+                            await sse.send_token(chunk.text)
+                            if speech:
+                                speech.feed(chunk.text)
+                if not initial_question.strip():
+                    initial_question = DEFAULT_INITIAL_QUESTION
+                    await sse.send_token(initial_question)
+                    if speech:
+                        speech.feed(initial_question)
+            initial_question = initial_question.strip()
+
+            state.add_entry("interviewer", initial_question)
+            session_store.save(state)
+            await sse.send({'done': True, 'initial_question': initial_question, 'turn_seq': state.turn_seq, 'tts': bool(speech)})
+            completed = True
+            if speech:
+                await watch.race(speech.close())
+
+    except (ClientDisconnected, ConnectionResetError) as e:
+        metrics.inc("init_session_cancelled")
+        metrics.inc("init_session_cancelled_wasted_sec", time.monotonic() - watch.started_at)
+        print(f"[DEBUG] Client left during init-session {state.session_id} ({e})")
+    except Exception as e:
+        logger.error(f"Init Session Stream Error: {e}")
+        try:
+            await sse.send({'error': str(e)})
+        except: pass
+    finally:
+        if speech:
+            speech.cancel()
+        await sse.close()
+        if watch.connected:
+            await response.write_eof()
+        if completed and sse.error is None:
+            # Persistence never delays the first question
+            asyncio.create_task(persist_session())
+        else:
+            # The client never got a usable session
+            session_store.discard(state.session_id)
+
+    return response
+
 async def get_latest_resume(request):
     """
     Fetch the most recently uploaded resume for a given user.
@@ -424,27 +843,76 @@ async def chat(request):
         data = await request.json()
     except:
         return web.json_response({"error": "Invalid JSON"}, status=400)
+    # One turn per session at a time: a retry or double submit waits for the turn in
+    # flight instead of interleaving its begin_turn/commit_turn with it
+    async with session_store.lock(data.get('session_id')):
+        return await _chat_turn(request, data)
 
+
+async def _chat_turn(request, data):
     user_text = data.get('text', '')
     question_index = data.get('question_index', 0)
     session_id = data.get('session_id')
     timestamp_sec = data.get('timestamp_sec', float(question_index))
-    resume_text = data.get('resume_text', '')
-    job_text = data.get('job_text', '')
-    interviewer_persona_id = data.get('interviewer_persona', '')
     pressure_score = data.get('pressure_score', 50)
     pressure_trend = data.get('pressure_trend', 'stable')
-    history = data.get('history', [])
     current_code = data.get('code', '')
-
-    # Format history for prompt context
-    history_context = ""
-    if history:
-        history_context = "--- CONVERSATION HISTORY ---\n"
-        for entry in history:
-            speaker = "CANDIDATE" if entry.get('speaker') == 'user' else "INTERVIEWER"
-            history_context += f"{speaker}: {entry.get('text')}\n"
-        history_context += "\n"
+    try:
+        turn_seq = int(data['turn_seq']) if data.get('turn_seq') is not None else None
+    except (TypeError, ValueError):
+        return web.json_response({"error": "turn_seq must be an integer"}, status=400)
+
+    # Conversation state lives server-side: clients send only the new utterance and
+    # turn_seq. Requests that carry the full `history` (older clients, or a resync
+    # after a 409) re-seed the stored state instead.
+    state = session_store.get(session_id)
+    if 'history' in data:
+        if state is None and session_id:
+            state = session_store.create(session_id)
+        if state is not None:
+            state.replace_history(data.get('history') or [])
+            if turn_seq is not None:
+                state.turn_seq = turn_seq - 1
+    elif state is None and session_id:
+        if turn_seq is not None and turn_seq > 1:
+            return web.json_response({"error": "Unknown session state, resend full history", "resync": True, "expected_turn_seq": None}, status=409)
+        state = session_store.create(session_id)
+    elif state is not None:
+        try:
+            state.begin_turn(turn_seq)
+        except TurnSequenceError as e:
+            return web.json_response({"error": str(e), "resync": True, "expected_turn_seq": e.expected}, status=409)
+
+    # Live-coding buffer: clients send `code_delta` {"base_version", "ops"} against the
+    # server's snapshot, or the full `code` (older clients, or a resync after a 409)
+    code_delta = data.get('code_delta')
+    if state is not None:
+        try:
+            if code_delta is not None:
+                state.apply_code_delta(int(code_delta['base_version']), code_delta.get('ops') or [])
+            elif 'code' in data:
+                state.set_code(data.get('code') or '')
+        except CodeVersionError as e:
+            return web.json_response({"error": str(e), "code_resync": True, "code_version": e.current}, status=409)
+        except (KeyError, TypeError, ValueError) as e:
+            return web.json_response({"error": f"Invalid code_delta: {e}"}, status=400)
+        current_code = state.code
+    elif code_delta is not None:
+        return web.json_response({"error": "Unknown session state, resend full code", "code_resync": True, "code_version": None}, status=409)
+
+    if state is not None:
+        for field, key in (("resume_text", "resume_text"), ("job_text", "job_text"), ("persona_id", "interviewer_persona")):
+            if data.get(key):
+                setattr(state, field, data[key])
+        resume_text = state.resume_text
+        job_text = state.job_text
+        interviewer_persona_id = state.persona_id
+        history_context = history_compactor.build_context(state)
+    else:
+        resume_text = data.get('resume_text', '')
+        job_text = data.get('job_text', '')
+        interviewer_persona_id = data.get('interviewer_persona', '')
+        history_context = format_history(data.get('history', []))
 
     print(f"[DEBUG] /api/chat hit! session={session_id}, text='{user_text[:50]}...', index={question_index}")
     
@@ -464,22 +932,7 @@ async def chat(request):
             is_coding_phase = True
 
     # Load base persona prompt
-    persona_prompt = "You are a professional technical interviewer for AceIt."
-    if interviewer_persona_id:
-        persona_path = os.path.join(BACKEND_DIR, "prompts", "interviewers", f"{interviewer_persona_id}.json")
-        if os.path.exists(persona_path):
-            try:
-                with open(persona_path, 'r') as f:
-                    data = json.load(f)
-                    persona_prompt = f"PERSONA: {data.get('name')}\n"
-                    persona_prompt += f"ROLE: {data.get('role')}\n"
-                    persona_prompt += f"TRAITS: {data.get('traits')}\n\n"
-                    persona_prompt += f"YOUR MISSION:\n{data.get('description')}\n"
-                    if data.get('example_reaction'):
-                        persona_prompt += f"\nEXAMPLE REACTION: {data.get('example_reaction')}"
-            except Exception as e:
-                logger.error(f"Error loading persona JSON: {e}")
-
+    persona_prompt = prompt_catalog.persona_prompt(interviewer_persona_id, "You are a professional technical interviewer for AceIt.")
 
     # ── CHESS ENGINE: Adaptive Difficulty Tiers (HARSHER) ─────────────────────────────
     if pressure_score < 20:
@@ -544,32 +997,30 @@ async def chat(request):
     elif pressure_trend == "falling":
         trend_modifier = " [TREND: FALLING — the candidate is struggling. Ease up slightly. Focus on confidence recovery without drastically changing your persona.]"
 
-    system_prompt = (
+    # Stable for the whole session: registered once with the prompt cache
+    static_prefix = (
         f"{BASE_PROMPT}\n\n"
         f"--- CURRENT INTERVIEWER PERSONA ---\n"
         f"{persona_prompt}\n\n"
+        f"Context - Job Description: {job_text[:300]}... Resume Summary: {resume_text[:300]}...\n\n"
+        f"{GRADING_RUBRIC}"
+    )
+    # Changes every turn: sent in the request contents ahead of the prompt
+    turn_instructions = (
         f"{history_context}"
         f"--- ADAPTIVE DIFFICULTY INSTRUCTION ---\n"
         f"{difficulty_mode}{trend_modifier}\n\n"
         "Keep your response under 3 sentences. "
-        + ("" if is_coding_phase else "First, react to the candidate's last answer in 1 sentence (do not be generic). ") +
-        f"\nContext - Job Description: {job_text[:300]}... Resume Summary: {resume_text[:300]}...\n\n"
-        "CRITICAL GRADING INSTRUCTION: You MUST evaluate the candidate's last answer and assign a quality score A (0.0 to 1.0).\n"
-        "IMPORTANT: Decouple your persona's tone from this grade. Even if your persona is skeptical, aggressive, or cold, you MUST give a high score (0.8-1.0) if the candidate provides specific, deep technical details (e.g., race conditions, idempotency, architectural trade-offs).\n"
-        "Scoring Rubric (BE OBJECTIVE AND REWARD TECHNICAL DEPTH):\n"
-        "- 0.0-0.1: Says 'no', one-word/vague answer, deflects, or low effort.\n"
-        "- 0.2-0.3: Basic but incomplete or factually weak answer.\n"
-        "- 0.4-0.6: Solid, standard technical answer covering the basics.\n"
-        "- 0.7-0.8: Strong technical answer with specific architectural details or complex problem solving.\n"
-        "- 0.9-1.0: Mastery. Exceptional depth, trade-offs, scalability, and specific advanced technical concepts.\n"
-        "\n"
-        "At the VERY END of your response, you MUST output a score tag in this EXACT format: [SCORE: 0.95]. "
+        + ("" if is_coding_phase else "First, react to the candidate's last answer in 1 sentence (do not be generic). ")
     )
     if is_coding_phase:
-        system_prompt += (
+        # The code appears once per prompt; the diff shows what the candidate just did
+        code_changes = state.code_changes() if state is not None else ""
+        turn_instructions += (
             "\n\nLIVE CODING CONTEXT:\n"
             f"Current Python Code: \n```python\n{current_code}\n```\n"
-            "Evaluate the code quality and the candidate's explanation. "
+            + (f"Changes since last turn:\n```diff\n{code_changes}\n```\n" if code_changes else "")
+            + "Evaluate the code quality and the candidate's explanation. "
             "If the code is incomplete, that's okay, you are in-progress. "
             "Encourage them to continue or explain a specific part."
         )
@@ -587,6 +1038,7 @@ async def chat(request):
             "background or their interest in the role. "
             "CRITICAL: Start your response with a clear greeting (e.g., 'Hello!', 'Hi there!', 'Welcome!') "
             "to ensure the user starts hearing you immediately."
+            + _verbatim_instruction(interviewer_persona_id, "greeting", "Start")
         )
         is_finished = False
         next_index = 0
@@ -603,7 +1055,7 @@ async def chat(request):
             )
         else:
             prompt = (
-                f"The candidate is in the middle of a coding challenge. Current code: {current_code}. "
+                "The candidate is in the middle of a coding challenge (their code is in the LIVE CODING CONTEXT above). "
                 f"They said: '{user_text}'. Ask a direct technical or guiding question "
                 "to help them move forward or justify a decision. No fluff."
             )
@@ -623,6 +1075,7 @@ async def chat(request):
         prompt = (
             f"The candidate said: '{user_text}'. React to their answer in one sentence, "
             "then thank them and professionally conclude the interview."
+            + _verbatim_instruction(interviewer_persona_id, "sign_off", "End")
         )
         is_finished = True
         next_index = question_index
@@ -635,68 +1088,75 @@ async def chat(request):
     )
     await response.prepare(request)
 
+    # Coalesces tokens and writes in the background; audio events share the same queue
+    sse = SSEWriter(response)
+
     full_ai_response = ""
+    speech = None
+    # Strips [SCORE: x] before anything reaches the client
+    score_parser = ScoreTagParser()
+    # Stops generating (and paying for) a reply nobody is reading
+    watch = DisconnectWatch(request)
     try:
-        # Use stream=True for token-by-token delivery via Gemini
-        gemini = get_gemini_client()
-        stream = await gemini.aio.models.generate_content_stream(
-            model="models/gemini-3-flash-preview",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-            )
-        )
-
-        print(f"[DEBUG] Starting Gemini stream for session={session_id}...")
-        async for chunk in stream:
-            if chunk.text:
-                content = chunk.text
-                full_ai_response += content
-                safe_content = content[:20].replace('\n', ' ')
-                print(f"[DEBUG] Sending token: '{safe_content}...'")
-                # SSE Format: data: <payload>\n\n
-                await response.write(f"data: {json.dumps({'token': content})}\n\n".encode())
-            else:
-                print(f"[DEBUG] Received empty or non-text chunk from Gemini")
-
-        # Extract the score from the full response
-        quality_score = 0.5 # Default
-        import re
-        # Case insensitive match for [SCORE: X.X]
-        match = re.search(r"\[SCORE:\s*(\d+\.?\d*)\]", full_ai_response, re.IGNORECASE)
-        if match:
-            try:
-                quality_score = float(match.group(1))
+        async with watch:
+            # Use stream=True for token-by-token delivery via Gemini
+            gemini = get_gemini_client()
+            if data.get('tts'):
+                # Speak each sentence as soon as it is complete instead of after the reply
+                persona = prompt_catalog.persona(interviewer_persona_id) or {}
+                speech = SpeechPipeline(tts_cache.stream, sse.send, voice=data.get('voice') or persona.get('voice'))
+            contents, config = prompt_cache.generation_args(session_id, static_prefix, turn_instructions, prompt)
+            stream = stream_with_deadline(lambda: gemini.aio.models.generate_content_stream(
+                model=CHAT_MODEL,
+                contents=contents,
+                config=config
+            ), CHAT_POLICY)
+
+            print(f"[DEBUG] Starting Gemini stream for session={session_id}...")
+            usage = None
+            async with aclosing(watch.guard(stream)) as chunks:
+                async for chunk in chunks:
+                    if chunk.usage_metadata:
+                        usage = chunk.usage_metadata
+                    if chunk.text:
+                        content = score_parser.feed(chunk.text)
+                        if not content:
+                            continue
+                        await sse.send_token(content)
+                        if speech:
+                            speech.feed(content)
+            score_parser.finish() # an unterminated tag is dropped, not sent
+            full_ai_response = score_parser.text.strip()
+
+            quality_score = score_parser.score
+            if quality_score is not None:
                 print(f"[DEBUG] Extracted quality_score: {quality_score}")
-                # Clean up the display text by removing the score tag
-                full_ai_response = re.sub(r"\[SCORE:\s*\d+\.?\d*\]", "", full_ai_response, flags=re.IGNORECASE).strip()
-            except Exception as e:
-                print(f"[DEBUG] Failed to parse quality_score from match: {match.group(1)} - {e}")
-                pass
-        else:
-            # Progressive fallbacks:
-            # 1. Any bracketed number anywhere: [0.2]
-            res = re.search(r"\[(\d+\.?\d*)]", full_ai_response)
-            if not res:
-                # 2. "Score: X" anywhere
-                res = re.search(r"score:\s*(\d+\.?\d*)", full_ai_response, re.IGNORECASE)
-            if not res:
-                # 3. Any decimal number at the very end
-                res = re.search(r"(\d\.\d+)\s*$", full_ai_response)
-            
-            if res:
-                try:
-                    quality_score = float(res.group(1))
+            else:
+                # No tag from the model; best-effort recovery from the text
+                quality_score = score_parser.fallback_score()
+                if quality_score is not None:
                     print(f"[DEBUG] Robust extraction recovered: {quality_score}")
-                except: pass
+                else:
+                    quality_score = 0.5 # Default
+                    tail = full_ai_response[-100:].replace('\n', ' ')
+                    print(f"[DEBUG] Extraction failed. Raw tail: ...{tail}")
+
+            cached_tokens, uncached_tokens = prompt_cache.record_usage(session_id, usage, static_prefix)
+            print(f"[DEBUG] Prompt tokens for session={session_id}: cached={cached_tokens}, uncached={uncached_tokens}")
 
-            if quality_score == 0.5:
-                tail = full_ai_response[-100:].replace('\n', ' ')
-                print(f"[DEBUG] Extraction failed. Raw tail: ...{tail}")
+            if state is not None:
+                state.commit_turn(user_text, full_ai_response, turn_seq)
+                if is_coding_phase:
+                    state.code_seen = state.code
+                session_store.save(state)
 
-        # Send metadata at the end including the quality score A
-        print(f"[DEBUG] Gemini stream complete. Total text length: {len(full_ai_response)}, score: {quality_score}")
-        await response.write(f"data: {json.dumps({'done': True, 'full_text': full_ai_response, 'quality_score': quality_score, 'next_index': next_index, 'is_finished': is_finished, 'is_coding_phase': is_coding_phase})}\n\n".encode())
+            # Send metadata at the end including the quality score A
+            print(f"[DEBUG] Gemini stream complete. Total text length: {len(full_ai_response)}, score: {quality_score}")
+            await sse.send({'done': True, 'full_text': full_ai_response, 'quality_score': quality_score, 'next_index': next_index, 'is_finished': is_finished, 'is_coding_phase': is_coding_phase, 'turn_seq': state.turn_seq if state else None, 'code_version': state.code_version if state else None, 'tts': bool(speech)})
+
+            # Remaining audio follows the done event, ending with {"audio_done": true}
+            if speech:
+                await watch.race(speech.close())
 
         # ── BACKGROUND: Supabase Logging & Analysis ──
         # Skip logging if this was a "safe skip" (empty response after intro)
@@ -736,6 +1196,9 @@ async def chat(request):
                             print(f"[DEBUG] background analysis complete for {session_id}")
                         except asyncio.TimeoutError:
                             print(f"[WARNING] background analysis timed out for {session_id}")
+                        except GovernorShed as e:
+                            # Live turns had the provider capacity; the next report covers this turn too
+                            print(f"[WARNING] background analysis shed for {session_id}: {e}")
                         except Exception as e:
                             print(f"[ERROR] background analysis failed: {e}")
             except Exception as bg_err:
@@ -744,14 +1207,36 @@ async def chat(request):
         # No-op here, task fire moved to finally block or just before return
         pass
 
+    except (ClientDisconnected, ConnectionResetError) as e:
+        wasted = time.monotonic() - watch.started_at
+        metrics.inc("chat_cancelled")
+        metrics.inc("chat_cancelled_wasted_sec", wasted)
+        print(f"[DEBUG] Client left session={session_id} mid-reply ({e}); generation cancelled after {wasted:.2f}s")
+        # The turn is not committed (the client may retry it), but keep a trace of it
+        if session_id and not is_skip:
+            asyncio.create_task(asyncio.to_thread(
+                supabase_logger.log_keyframe,
+                session_id=session_id,
+                timestamp_sec=float(timestamp_sec),
+                interviewer_question=f"Dynamic Question {question_index}",
+                associated_transcript=user_text,
+                ai_response=score_parser.text.strip(),
+                keyframe_reason=f"Cancelled - Q{question_index + 1}"
+            ))
+        return response
+
     except Exception as e:
         logger.error(f"Chat Stream Error: {e}")
         try:
-            await response.write(f"data: {json.dumps({'error': str(e)})}\n\n".encode())
+            await sse.send({'error': str(e)})
         except: pass
     
     finally:
-        await response.write_eof()
+        if speech:
+            speech.cancel() # no-op once all audio has been sent
+        await sse.close()
+        if watch.connected:
+            await response.write_eof()
         # Fire and forget WITHOUT awaiting in the handler, 
         # but do it AFTER eof is written to free up the stream
         if not is_skip and 'finalize_turn_async' in locals():
@@ -762,88 +1247,99 @@ async def chat(request):
 async def tts(request):
     data = await request.json()
     text = data.get('text', '')
-    voice_name = data.get('voice', 'Puck')
-    print(f"[DEBUG] /api/tts hit! Length: {len(text)} chars, Voice: {voice_name}")
-    
-    gemini = get_gemini_client()
-    audio_prompt = f"Please read the following text aloud naturally and professionally:\n\n{text}"
+    voice_name = data.get('voice') # None keeps the model's default voice
+    print(f"[DEBUG] /api/tts hit! Length: {len(text)} chars, Voice: {voice_name or 'default'}")
+
+    # Clients that send Accept: audio/ogg or audio/webm get Opus; others get raw PCM
+    container = negotiate_container(request.headers.get('Accept', ''))
+    encoder = OpusStreamEncoder(container[0], TTS_SAMPLE_RATE) if container else None
 
     # Prepare the streaming response object but don't prepare/send headers yet
     response = web.StreamResponse(
         status=200,
         reason='OK',
         headers={
-            'Content-Type': 'application/octet-stream',
+            'Content-Type': container[1] if container else 'application/octet-stream',
             'Cache-Control': 'no-cache',
             'Connection': 'keep-alive',
+            'Vary': 'Accept',
         }
     )
 
-    max_retries = 2
-    for attempt in range(max_retries + 1):
-        try:
-            print(f"[DEBUG] Requesting streaming TTS from Gemini (Attempt {attempt+1})...")
-            start_time = asyncio.get_event_loop().time()
-            
-            # 1. Initialize the stream coroutine
-            gemini_stream_coro = gemini.aio.models.generate_content_stream(
-                model="models/gemini-2.5-flash-preview-tts",
-                contents=audio_prompt,
-                config=types.GenerateContentConfig(
-                    response_modalities=["AUDIO"],
-                )
-            )
-            
-            # 2. Get the stream iterator
-            stream_it = await gemini_stream_coro
-            
-            # 3. Buffer the first chunk to ensure the stream is valid before sending headers
-            headers_prepared = False
-            
-            async for chunk in stream_it:
-                if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
+    # Sentences are synthesized concurrently and streamed back in order; retries
+    # happen per sentence inside the synthesizer
+    sentences = split_sentences(text)
+    synth = OrderedSynthesizer(tts_cache.stream, voice_name)
+    for sentence in sentences:
+        synth.submit(sentence)
+    synth.close()
+    print(f"[DEBUG] Requesting streaming TTS from Gemini ({len(sentences)} sentences)...")
+
+    start_time = asyncio.get_event_loop().time()
+    # Don't send headers until the first chunk proves the stream is valid
+    headers_prepared = False
+    skipped = None # last sentence failure, reported if no audio was produced at all
+    watch = DisconnectWatch(request)
+    try:
+        async with watch:
+            chunks = synth.chunks()
+            while True:
+                try:
+                    _, audio_bytes = await watch.race(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                except SentenceSynthesisError as e:
+                    # Skip the sentence rather than cut off the rest of the utterance
+                    logger.warning(f"TTS skipping sentence {e.index}: {e.cause}")
+                    skipped = e
+                    chunks = synth.chunks(e.index + 1)
                     continue
-                    
-                part = chunk.candidates[0].content.parts[0]
-                audio_bytes = None
-                
-                if hasattr(part, 'inline_data') and part.inline_data and part.inline_data.data:
-                    audio_bytes = part.inline_data.data
-                elif hasattr(part, 'blob') and part.blob and part.blob.data:
-                    audio_bytes = part.blob.data
-                
-                if audio_bytes:
-                    if not headers_prepared:
-                        await response.prepare(request)
-                        headers_prepared = True
-                        first_time = asyncio.get_event_loop().time()
-                        print(f"[DEBUG] Gemini TTS first chunk received in {first_time - start_time:.2f}s")
-                    
-                    await response.write(audio_bytes)
+                if not headers_prepared:
+                    await response.prepare(request)
+                    headers_prepared = True
+                    first_time = asyncio.get_event_loop().time()
+                    print(f"[DEBUG] Gemini TTS first chunk received in {first_time - start_time:.2f}s")
+
+                if encoder:
+                    audio_bytes = encoder.encode(audio_bytes)
+                    if not audio_bytes:
+                        continue
+                await response.write(audio_bytes)
+
+        if not headers_prepared:
+            # We finished without ever getting audio bytes
+            if skipped is not None:
+                raise skipped.cause
+            raise Exception("Gemini stream completed without sending any audio data.")
+
+        if encoder:
+            await response.write(encoder.close())
+        await response.write_eof()
+        end_time = asyncio.get_event_loop().time()
+        print(f"[DEBUG] TTS stream complete in {end_time - start_time:.2f}s")
+        return response
+
+    except (ClientDisconnected, ConnectionResetError) as e:
+        # Remaining sentences are cancelled upstream by synth.cancel() below
+        wasted = time.monotonic() - watch.started_at
+        metrics.inc("tts_cancelled")
+        metrics.inc("tts_cancelled_wasted_sec", wasted)
+        print(f"[DEBUG] TTS client disconnected ({e}); synthesis cancelled after {wasted:.2f}s")
+        return response
 
-            if headers_prepared:
-                await response.write_eof()
-                end_time = asyncio.get_event_loop().time()
-                print(f"[DEBUG] TTS stream complete in {end_time - start_time:.2f}s")
-                return response
-            else:
-                # We finished the loop without ever getting audio bytes
-                raise Exception("Gemini stream completed without sending any audio data.")
-
-        except Exception as e:
-            logger.error(f"Gemini TTS Error (Attempt {attempt+1}): {e}")
-            if attempt < max_retries:
-                # Wait a bit before retrying
-                await asyncio.sleep(1)
-                continue
-            
-            # If we already sent headers, we can't send a JSON error
-            if 'headers_prepared' in locals() and headers_prepared:
-                # The connection is already in an invalid state for a new response
-                # Just close the stream
-                return response
-            
-            return web.json_response({"error": str(e)}, status=500)
+    except Exception as e:
+        logger.error(f"Gemini TTS Error: {e}")
+        # If we already sent headers, we can't send a JSON error; just close the stream
+        if headers_prepared:
+            return response
+        return web.json_response({"error": str(e)}, status=500)
+    finally:
+        synth.cancel()
+        if encoder:
+            try:
+                encoder.close() # no-op after a completed stream; releases the muxer otherwise
+            except Exception as e:
+                logger.warning(f"TTS encoder close failed: {e}")
 
 async def offer(request):
     try:
@@ -874,6 +1370,32 @@ async def offer(request):
             def on_message(message):
                 if isinstance(message, str) and message.startswith("ping"):
                     channel.send("pong" + message[4:])
+                    return
+                # Turn control for server-side segmentation:
+                #   {"type": "session", "session_id": ..., "timestamp_sec": ...}  enable + bind (acked with "session_bound")
+                #   {"type": "turn_start"}  candidate's turn begins (drops anything buffered)
+                #   {"type": "turn_end", "timestamp_sec": ...}  candidate finished answering
+                try:
+                    msg = json.loads(message)
+                except (TypeError, ValueError):
+                    return
+                if not isinstance(msg, dict):
+                    return
+                audio_proc = next((p for p in processors if isinstance(p, AudioStreamProcessor)), None)
+                if audio_proc is None:
+                    return
+                msg_type = msg.get("type")
+                # A malformed timestamp must not raise inside the channel callback;
+                # it falls back to the server's clock for the session
+                timestamp_sec = _client_timestamp(msg.get("timestamp_sec"))
+                if msg_type == "session" and isinstance(msg.get("session_id"), str) and msg["session_id"]:
+                    audio_proc.bind_session(msg["session_id"], timestamp_sec if timestamp_sec is not None else audio_proc.session_time())
+                    log_info("Server-side turn segmentation enabled for %s", msg["session_id"])
+                    dc_manager.send_json({"type": "session_bound", "session_id": msg["session_id"]})
+                elif msg_type == "turn_start":
+                    audio_proc.start_turn()
+                elif msg_type == "turn_end":
+                    audio_proc.end_turn(timestamp_sec)
 
         @pc.on("connectionstatechange")
         async def on_connectionstatechange():
@@ -890,10 +1412,14 @@ async def offer(request):
             if track.kind == "video":
                 processor = VideoStreamProcessor(track, dc_manager)
                 processors.append(processor)
-            # AudioStreamProcessor is commented out as requested to favor turn-based logic
-            # elif track.kind == "audio":
-            #    processor = AudioStreamProcessor(track, dc_manager)
-            #    processors.append(processor)
+            # Audio feeds live prosody, and turn segmentation once the client sends a
+            # "session" message on the DataChannel
+            elif track.kind == "audio":
+                async def on_turn(pcm, turn):
+                    video_proc = next((p for p in processors if isinstance(p, VideoStreamProcessor)), None)
+                    await handle_live_turn(pcm, turn, dc_manager, video_proc)
+                processor = AudioStreamProcessor(track, dc_manager, on_turn=on_turn)
+                processors.append(processor)
 
             @track.on("ended")
             async def on_ended():
@@ -1021,38 +1547,49 @@ async def get_session_details_handler(request):
         
     return web.json_response({"data": metadata})
 
+def _catalog_response(request, body, etag):
+    # Conditional GET: the catalog only changes when a prompt file is edited
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return web.Response(status=304, headers={"ETag": etag})
+    return web.Response(body=body, content_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
 async def get_jobs_handler(request):
-    jobs_dir = os.path.join(BACKEND_DIR, "prompts", "job_descriptions")
-    jobs = []
-    if os.path.exists(jobs_dir):
-        for filename in sorted(os.listdir(jobs_dir)):
-            if filename.endswith(".json"):
-                with open(os.path.join(jobs_dir, filename), "r") as f:
-                    try:
-                        job_data = json.load(f)
-                        job_data["id"] = filename.replace(".json", "")
-                        jobs.append(job_data)
-                    except Exception as e:
-                        logger.error(f"Error loading job {filename}: {e}")
-    return web.json_response({"jobs": jobs})
+    body, etag = prompt_catalog.jobs_response()
+    return _catalog_response(request, body, etag)
 
 async def get_interviewers_handler(request):
-    interviewers_dir = os.path.join(BACKEND_DIR, "prompts", "interviewers")
-    interviewers = []
-    if os.path.exists(interviewers_dir):
-        # Sort files to maintain order if needed, but normally frontend might sort by sector/difficulty
-        for filename in sorted(os.listdir(interviewers_dir)):
-            if filename.endswith(".json"):
-                try:
-                    with open(os.path.join(interviewers_dir, filename), "r") as f:
-                        interviewer_data = json.load(f)
-                        # Ensure ID matches filename just in case
-                        if "id" not in interviewer_data:
-                            interviewer_data["id"] = filename.replace(".json", "")
-                        interviewers.append(interviewer_data)
-                except Exception as e:
-                    logger.error(f"Error loading interviewer {filename}: {e}")
-    return web.json_response({"interviewers": interviewers})
+    body, etag = prompt_catalog.interviewers_response()
+    return _catalog_response(request, body, etag)
+
+async def metrics_handler(request):
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    cached = counters.get("chat_prompt_tokens_cached", 0)
+    total = cached + counters.get("chat_prompt_tokens_uncached", 0)
+    snapshot["chat_prompt_cache_ratio"] = cached / total if total else 0.0
+    hits = counters.get("tts_cache_hit_memory", 0) + counters.get("tts_cache_hit_disk", 0)
+    lookups = hits + counters.get("tts_cache_miss", 0)
+    snapshot["tts_cache_hit_rate"] = hits / lookups if lookups else 0.0
+    return web.json_response(snapshot)
+
+
+async def on_startup(app):
+    if PROVIDER_MODE == "stub":
+        # Offline benchmarking: every provider call is answered by the local stub
+        from stub_provider import StubProvider
+        app["stub_provider"] = StubProvider()
+        await app["stub_provider"].start(port=int(STUB_PROVIDER_URL.rstrip("/").rsplit(":", 1)[-1]))
+    # Open TLS connections to the providers before the first turn needs them
+    app["warm_clients"] = asyncio.create_task(clients.warm())
+    if os.environ.get("TTS_PREWARM", "1") != "0":
+        # Default voice (what /api/tts uses without a voice) plus every persona's voice
+        voices = [None] + prompt_catalog.persona_voices()
+        # Greetings and sign-offs in their persona's voice, and in the default voice for /api/tts
+        voice_phrases = prompt_catalog.persona_phrases()
+        voice_phrases[None] = [phrase for phrases in voice_phrases.values() for phrase in phrases]
+        prewarm_synthesize = lambda text, voice: synthesize_stream(get_gemini_client(), text, voice, TTS_PREWARM_POLICY)
+        app["tts_prewarm"] = asyncio.create_task(tts_cache.prewarm(voices, synthesize=prewarm_synthesize, voice_phrases=voice_phrases))
 
 
 async def on_shutdown(app):
@@ -1060,6 +1597,9 @@ async def on_shutdown(app):
     coros = [pc.close() for pc in pcs]
     await asyncio.gather(*coros)
     pcs.clear()
+    await clients.aclose()
+    if "stub_provider" in app:
+        await app["stub_provider"].stop()
 
 
 if __name__ == "__main__":
@@ -1080,6 +1620,7 @@ if __name__ == "__main__":
         import aiohttp_cors
 
         app = web.Application()
+        app.on_startup.append(on_startup)
         app.on_shutdown.append(on_shutdown)
         
         # Configure CORS
@@ -1093,12 +1634,15 @@ if __name__ == "__main__":
         })
 
         # Prefix all routes with /api/ to handle proxy
+        app.router.add_post("/api/prepare-session", prepare_session)
         app.router.add_post("/api/init-session", init_session)
         app.router.add_get("/api/get-latest-resume", get_latest_resume)
         res_offer = app.router.add_post("/api/offer", offer)
         res_health = app.router.add_get("/api/health", lambda request: web.Response(text="OK"))
         res_heartbeat = app.router.add_get("/api/heartbeat", heartbeat)
         res_stream = app.router.add_post("/api/stream-process", stream_process)
+        app.router.add_post("/api/stream-chunk", stream_chunk)
+        app.router.add_post("/api/stream-finalize", stream_finalize)
         res_chat = app.router.add_post("/api/chat", chat)
         res_tts = app.router.add_post("/api/tts", tts)
         app.router.add_get("/api/report/{session_id}", get_report_handler)
@@ -1109,6 +1653,7 @@ if __name__ == "__main__":
         app.router.add_get("/api/jobs", get_jobs_handler)
         app.router.add_get("/api/interviewers", get_interviewers_handler)
         app.router.add_post("/api/log-skip", log_skip_handler)
+        app.router.add_get("/api/metrics", metrics_handler)
 
         # Add CORS to all routes
         for route in list(app.router.routes()):
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Prepared sessions not claimed by /api/init-session within this window are dropped
+SESSION_PREP_TTL_SEC = float(os.environ.get("SESSION_PREP_TTL_SEC", "600"))
+SESSION_PREP_MAX = int(os.environ.get("SESSION_PREP_MAX", "200"))
+
+
+class PreparedSession:
+    def __init__(self, prep_id):
+        self.prep_id = prep_id
+        self.persona_id = ""
+        self.job_text = ""
+        self.role = ""
+        self.company = ""
+        self.user_id = ""
+        self.resume_text = ""
+        self.resume_filename = ""
+        self.prompts = None # (system_instruction, contents) for the opening question
+        self.prompts_key = None # (persona_id, resume_text, job_text) they were built for
+        self.question = None # asyncio.Task -> opening question text
+        self.question_key = None # (persona_id, resume_text, job_text) the task was started for
+        self.created_at = time.monotonic()
+
+    def inputs(self):
+        return (self.persona_id, self.resume_text, self.job_text)
+
+
+def _consume(task):
+    # Mark the exception retrieved; question_for() reports failures to its caller
+    if not task.cancelled():
+        task.exception()
+
+
+class SessionPreparer:
+    """
+    Speculative first half of /api/init-session. /api/prepare-session registers
+    the interviewer and job as soon as they are picked, pre-builds the persona and
+    system prompt for the opening question (and re-opens provider connections);
+    the question starts generating the moment resume text is known. init_session
+    then claims the entry by prep_id and awaits, or simply takes, the question,
+    falling back to a fresh call if the inputs changed.
+    """
+    def __init__(self, generate_question, build_prompts, warm=None, ttl_sec=SESSION_PREP_TTL_SEC, max_entries=SESSION_PREP_MAX):
+        self._generate = generate_question # async (system_instruction, contents) -> str
+        self._build_prompts = build_prompts # (persona_id, resume_text, job_text) -> (system_instruction, contents)
+        self._warm = warm
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # prep_id -> PreparedSession
+
+    def prepare(self, prep_id=None, **fields):
+        """Create or update a prepared session; fields left out keep their value."""
+        self._evict()
+        entry = self._entries.get(prep_id) if prep_id else None
+        if entry is None:
+            entry = PreparedSession(f"prep-{uuid.uuid4().hex[:12]}")
+            self._entries[entry.prep_id] = entry
+            metrics.inc("session_prep_created")
+            if self._warm:
+                asyncio.create_task(self._warm())
+        for name, value in fields.items():
+            if value:
+                setattr(entry, name, value)
+        if entry.persona_id or entry.job_text:
+            self._build(entry)
+        if entry.resume_text:
+            self._start(entry)
+        return entry
+
+    def _build(self, entry):
+        key = entry.inputs()
+        if entry.prompts_key != key:
+            entry.prompts = self._build_prompts(*key)
+            entry.prompts_key = key
+
+    def _start(self, entry):
+        key = entry.inputs()
+        if entry.question_key == key:
+            return
+        if entry.question is not None:
+            entry.question.cancel()
+        self._build(entry)
+        entry.question_key = key
+        entry.question = asyncio.create_task(self._generate(*entry.prompts))
+        entry.question.add_done_callback(_consume)
+        metrics.inc("session_prep_question_started")
+
+    def take(self, prep_id):
+        """Claim (and remove) a prepared session; None if unknown or expired."""
+        self._evict()
+        return self._entries.pop(prep_id, None) if prep_id else None
+
+    def prompts_for(self, entry, persona_id, resume_text, job_text):
+        """The pre-built (system_instruction, contents) if built for exactly these inputs, else None."""
+        if entry.prompts_key != (persona_id, resume_text, job_text):
+            return None
+        return entry.prompts
+
+    async def question_for(self, entry, persona_id, resume_text, job_text):
+        """
+        The speculative opening question if it was generated for exactly these
+        inputs, else None (the caller generates one itself).
+        """
+        if entry.question is None or entry.question_key != (persona_id, resume_text, job_text):
+            if entry.question is not None:
+                entry.question.cancel()
+            metrics.inc("session_prep_miss")
+            return None
+        metrics.inc("session_prep_hit" if entry.question.done() else "session_prep_wait")
+        try:
+            return await entry.question
+        except Exception as e:
+            logger.warning(f"Speculative opening question for {entry.prep_id} failed: {e}")
+            metrics.inc("session_prep_failed")
+            return None
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._entries:
+            prep_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - entry.created_at <= self.ttl_sec:
+                break
+            del self._entries[prep_id]
+            if entry.question is not None:
+                entry.question.cancel()
+            metrics.inc("session_prep_expired")
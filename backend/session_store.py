@@ -0,0 +1,265 @@
+import asyncio
+import difflib
+import json
+import logging
+import os
+import re
+import time
+import weakref
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE_MAX = int(os.environ.get("SESSION_STORE_MAX", "500"))
+SESSION_IDLE_TTL_SEC = float(os.environ.get("SESSION_IDLE_TTL_SEC", str(2 * 3600)))
+# Directory for the JSON persistence stand-in; unset keeps state in memory only
+SESSION_STORE_DIR = os.environ.get("SESSION_STORE_DIR", "")
+
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+# Larger "changes since last turn" diffs are dropped; the full code is in the prompt anyway
+CODE_DIFF_MAX_LINES = int(os.environ.get("CODE_DIFF_MAX_LINES", "80"))
+
+
+def format_history_line(entry):
+    speaker = "CANDIDATE" if entry.get('speaker') == 'user' else "INTERVIEWER"
+    return f"{speaker}: {entry.get('text')}\n"
+
+
+def format_history(history):
+    if not history:
+        return ""
+    return "--- CONVERSATION HISTORY ---\n" + "".join(format_history_line(e) for e in history) + "\n"
+
+
+class TurnSequenceError(Exception):
+    """The client's turn_seq does not follow the server's; it must resend full state."""
+    def __init__(self, expected, received):
+        super().__init__(f"Expected turn_seq {expected}, got {received}")
+        self.expected = expected
+        self.received = received
+
+
+class CodeVersionError(Exception):
+    """A code delta was based on a different snapshot; the client must resend the full code."""
+    def __init__(self, current, received):
+        super().__init__(f"Code is at version {current}, delta is based on {received}")
+        self.current = current
+        self.received = received
+
+
+def apply_code_ops(code, ops):
+    """
+    Apply edits in order, each {"offset", "length", "text"} replacing `length`
+    characters at `offset` of the text as left by the previous edit (the shape of
+    an editor's content-change events).
+    """
+    for op in ops:
+        offset, length, text = int(op["offset"]), int(op.get("length", 0)), op.get("text", "")
+        if offset < 0 or length < 0 or offset + length > len(code) or not isinstance(text, str):
+            raise ValueError(f"Edit out of range for a {len(code)}-character buffer: {op}")
+        code = code[:offset] + text + code[offset + length:]
+    return code
+
+
+def code_diff(old, new, max_lines=CODE_DIFF_MAX_LINES):
+    """Compact unified diff of old -> new, or "" if unchanged or too large to help."""
+    if old == new:
+        return ""
+    lines = list(difflib.unified_diff(old.splitlines(), new.splitlines(), "previous", "current", n=1, lineterm=""))
+    if len(lines) > max_lines:
+        return ""
+    return "\n".join(lines[2:]) # drop the ---/+++ header
+
+
+class SessionState:
+    """
+    Everything /api/chat needs about an interview besides the new utterance: the
+    conversation so far, resume/job context, the interviewer persona and the
+    live-coding buffer.
+    """
+    FIELDS = ("session_id", "persona_id", "resume_text", "job_text", "role", "company",
+              "history", "turn_seq", "created_at", "summary", "summarized_upto",
+              "code", "code_version", "code_seen")
+
+    def __init__(self, session_id, persona_id="", resume_text="", job_text="", role="", company=""):
+        self.session_id = session_id
+        self.persona_id = persona_id
+        self.resume_text = resume_text
+        self.job_text = job_text
+        self.role = role
+        self.company = company
+        self.history = [] # [{"speaker": "user" | "interviewer", "text": str}]
+        self.turn_seq = 0 # last turn applied to history
+        self.created_at = time.time()
+        self.last_access = time.monotonic()
+        self.summary = "" # Rolling summary of history[:summarized_upto] (see history_compactor)
+        self.summarized_upto = 0
+        self.code = "" # Live-coding buffer, updated by full snapshots or deltas
+        self.code_version = 0
+        self.code_seen = "" # Code as of the last coding turn the model saw
+        self._turn_start = 0 # len(history) before the last applied turn, for retries
+        self._last_delta = None # (base_version, ops) of the last applied delta, for retries
+
+    def add_entry(self, speaker, text):
+        self.history.append({"speaker": speaker, "text": text})
+
+    def replace_history(self, history):
+        history = [{"speaker": e.get("speaker"), "text": e.get("text")} for e in history if isinstance(e, dict)]
+        # Keep the rolling summary only if the part it covers is unchanged
+        upto = self.summarized_upto
+        if upto > len(history) or history[:upto] != self.history[:upto]:
+            self.summary, self.summarized_upto = "", 0
+        self.history = history
+        self._turn_start = len(self.history)
+
+    def begin_turn(self, turn_seq):
+        """
+        Validate the client's turn number before a turn is generated. A repeat of the
+        last turn (client retry) rolls that turn back so it is not applied twice.
+        """
+        if turn_seq is None:
+            return
+        if turn_seq == self.turn_seq and turn_seq > 0:
+            del self.history[self._turn_start:]
+            if self.summarized_upto > self._turn_start:
+                self.summary, self.summarized_upto = "", 0
+            self.turn_seq -= 1
+        elif turn_seq != self.turn_seq + 1:
+            raise TurnSequenceError(self.turn_seq + 1, turn_seq)
+
+    def commit_turn(self, user_text, ai_text, turn_seq=None):
+        self._turn_start = len(self.history)
+        if user_text:
+            self.history.append({"speaker": "user", "text": user_text})
+        if ai_text:
+            self.history.append({"speaker": "interviewer", "text": ai_text})
+        self.turn_seq = turn_seq if turn_seq is not None else self.turn_seq + 1
+
+    def set_code(self, code):
+        """Replace the buffer with a full snapshot (older clients, or resync after a 409)."""
+        if code != self.code:
+            self.code = code
+            self.code_version += 1
+            self._last_delta = None
+
+    def apply_code_delta(self, base_version, ops):
+        """
+        Apply a delta made against `base_version`. Re-sending the last delta (client
+        retry) is a no-op; any other base raises CodeVersionError.
+        """
+        if self._last_delta == (base_version, ops) and base_version == self.code_version - 1:
+            return
+        if base_version != self.code_version:
+            raise CodeVersionError(self.code_version, base_version)
+        self.code = apply_code_ops(self.code, ops)
+        self.code_version += 1
+        self._last_delta = (base_version, ops)
+
+    def code_changes(self):
+        return code_diff(self.code_seen, self.code) if self.code_seen else ""
+
+    def to_dict(self):
+        data = {k: getattr(self, k) for k in self.FIELDS}
+        data["turn_start"] = self._turn_start
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data["session_id"])
+        for k in cls.FIELDS:
+            if k in data:
+                setattr(state, k, data[k])
+        state._turn_start = data.get("turn_start", len(state.history))
+        return state
+
+
+class SessionStore:
+    """
+    Bounded in-memory session state. Sessions idle for longer than idle_ttl are
+    dropped and the least recently used ones are evicted beyond max_sessions.
+
+    With persist_dir set, each session is also written as a JSON file so it
+    survives eviction and restarts (a local stand-in for a shared store).
+    """
+    def __init__(self, max_sessions=SESSION_STORE_MAX, idle_ttl=SESSION_IDLE_TTL_SEC, persist_dir=SESSION_STORE_DIR):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.persist_dir = persist_dir or None
+        self._sessions = OrderedDict()
+        self._locks = weakref.WeakValueDictionary() # session_id -> lock, alive while held or awaited
+        if self.persist_dir:
+            os.makedirs(self.persist_dir, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.persist_dir, f"{_SAFE_ID.sub('_', session_id)}.json")
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - state.last_access > self.idle_ttl:
+                del self._sessions[session_id]
+            else:
+                break
+
+    def _touch(self, state):
+        state.last_access = time.monotonic()
+        self._sessions[state.session_id] = state
+        self._sessions.move_to_end(state.session_id)
+        self._evict()
+
+    def create(self, session_id, **fields):
+        return self.add(SessionState(session_id, **fields))
+
+    def add(self, state):
+        """Register a state that was built before it was known to be needed."""
+        self._touch(state)
+        self.save(state)
+        return state
+
+    def discard(self, session_id):
+        self._sessions.pop(session_id, None)
+        if self.persist_dir:
+            try:
+                os.remove(self._path(session_id))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Failed to remove persisted session {session_id}: {e}")
+
+    def lock(self, session_id):
+        """Lock serializing the turns of one session (a fresh, unshared one without an id)."""
+        if not session_id:
+            return asyncio.Lock()
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        state = self._sessions.get(session_id)
+        if state is None and self.persist_dir:
+            path = self._path(session_id)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r") as f:
+                        state = SessionState.from_dict(json.load(f))
+                except Exception as e:
+                    logger.error(f"Failed to load persisted session {session_id}: {e}")
+        if state is not None:
+            self._touch(state)
+        return state
+
+    def save(self, state):
+        if not self.persist_dir:
+            return
+        path = self._path(state.session_id)
+        try:
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(state.to_dict(), f)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.error(f"Failed to persist session {state.session_id}: {e}")
@@ -48,6 +48,8 @@ class SpeechAnalyzer:
         }
 
 from video.models import VisualConfidenceModel, AudioConfidenceModel
+from prosody import ProsodyTracker
+from vad import StreamingVad
 
 # Setup paths
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -62,6 +64,17 @@ INPUT_DIM = 178
 SEQUENCE_LENGTH = 30
 WINDOW_SIZE_MS = 1000
 
+# Live audio track: prosody push cadence, and whether to also run windowed Whisper
+# inference on it (off by default; the interview transcribes whole turns instead)
+PROSODY_PUSH_INTERVAL_SEC = float(os.environ.get("PROSODY_PUSH_INTERVAL_SEC", "0.5"))
+LIVE_AUDIO_TRANSCRIPTS = os.environ.get("LIVE_AUDIO_TRANSCRIPTS", "0") == "1"
+
+# Server-side turn segmentation: a turn ends on a "turn_end" DataChannel message, or
+# automatically after this much silence following speech (0 disables auto-end)
+TURN_END_SILENCE_SEC = float(os.environ.get("TURN_END_SILENCE_SEC", "2.5"))
+MAX_TURN_SEC = 180
+TURN_PRE_ROLL_SEC = 0.3
+
 # Global AI Initializations
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -104,15 +117,25 @@ def get_landmarkers():
             print(f"Warning: MediaPipe init failed. {e}")
     return _face_landmarker, _hand_landmarker
 
-# Global Whisper Model (Disabled to avoid WinError 6 on Windows, using OpenAI API instead)
+# Global Whisper Model (LAZY). The remote whisper-1 API is the default because the
+# local model hit WinError 6 on Windows; set STT_BACKEND=local to run on-box.
+# Note: AudioConfidenceModel was trained on 'tiny' (384-dim) encoder features.
+STT_BACKEND = os.environ.get("STT_BACKEND", "openai").lower()
+WHISPER_MODEL_NAME = os.environ.get("WHISPER_MODEL", "tiny")
 whisper_model = None
-# try:
-#     print("Loading Whisper model...")
-#     whisper_model = whisper.load_model("tiny", device=device)
-#     print("Whisper model loaded!")
-# except Exception as e:
-#     whisper_model = None
-#     print(f"Failed to load whisper model: {e}")
+
+def get_whisper_model():
+    global whisper_model
+    if whisper_model is None and STT_BACKEND == "local":
+        try:
+            print(f"Loading Whisper model '{WHISPER_MODEL_NAME}'...")
+            whisper_model = whisper.load_model(WHISPER_MODEL_NAME, device=device)
+            whisper_model.eval()
+            print("Whisper model loaded!")
+        except Exception as e:
+            whisper_model = None
+            print(f"Failed to load whisper model: {e}")
+    return whisper_model
 
 def process_mediapipe_results(face_result, hand_result):
     bs = [0.0] * 52
@@ -137,6 +160,7 @@ class VideoStreamProcessor:
         self.track = track
         self.datachannel_manager = datachannel_manager
         self.feature_history = []
+        self.last_inference = None
         self.device = device
         self.model = get_visual_model() # Use lazy global
         # Initialize landmarkers locally to avoid cross-thread corruption in MediaPipe landmarker calls
@@ -218,6 +242,7 @@ class VideoStreamProcessor:
                 if current_time - last_inference_time > 1.0: # Run every 1s
                     last_inference_time = current_time
                     conf, gaze, fidget = await asyncio.to_thread(self.do_inference)
+                    self.last_inference = (conf, gaze, fidget)
                     
                     print(f"[DEBUG] Sending Inference: C={conf}, G={gaze}, F={fidget}")
                     self.datachannel_manager.send_json({
@@ -254,41 +279,193 @@ class VideoStreamProcessor:
         except Exception as e:
             pass # Suppress mp errors
 
+class AudioRingBuffer:
+    """
+    Preallocated float32 ring buffer for mono PCM.
+
+    Every sample is stored twice (at i and i + capacity), so any window of up to
+    `capacity` unread samples is one contiguous slice and can be handed out as a
+    view. Length is tracked with two counters instead of summing buffered frames.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = np.zeros(capacity * 2, dtype=np.float32)
+        self._written = 0 # total samples ever written
+        self._read = 0 # total samples ever consumed
+
+    def __len__(self):
+        return self._written - self._read
+
+    def write_int16(self, samples):
+        """Convert int16 samples to float32 directly into the buffer."""
+        n = len(samples)
+        if n == 0: return
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+            self._written += n - self.capacity
+            n = self.capacity
+        # Overrun drops the oldest unread audio rather than growing
+        if len(self) + n > self.capacity:
+            self._read = self._written + n - self.capacity
+
+        cap = self.capacity
+        pos = self._written % cap
+        np.multiply(samples, 1.0 / 32768.0, out=self._buf[pos:pos + n], casting="unsafe")
+        # Mirror into the other half
+        low_end = min(pos + n, cap)
+        np.copyto(self._buf[pos + cap:low_end + cap], self._buf[pos:low_end])
+        if pos + n > cap:
+            np.copyto(self._buf[0:pos + n - cap], self._buf[cap:pos + n])
+        self._written += n
+
+    def peek(self, n):
+        """Zero-copy view of the next n unread samples."""
+        n = min(n, len(self))
+        start = self._read % self.capacity
+        return self._buf[start:start + n]
+
+    def advance(self, n):
+        self._read += min(n, len(self))
+
+class TurnSegmenter:
+    """
+    Collects the candidate's PCM for one answer straight from the live audio track.
+
+    Audio before the first speech frame is kept only as a short pre-roll. Once
+    speech starts everything is appended until the turn ends, either explicitly
+    (end_turn) or after TURN_END_SILENCE_SEC of silence. The finished turn is
+    returned as a float32 array ready for STT and metrics, with no second decode.
+    """
+    def __init__(self, sample_rate=16000, end_silence_sec=TURN_END_SILENCE_SEC, max_turn_sec=MAX_TURN_SEC):
+        self.sample_rate = sample_rate
+        self.vad = StreamingVad(sample_rate)
+        self.end_silence = int(end_silence_sec * sample_rate)
+        self.max_samples = int(max_turn_sec * sample_rate)
+        self.pre_roll = int(TURN_PRE_ROLL_SEC * sample_rate)
+
+        self._buf = np.zeros(30 * sample_rate, dtype=np.float32) # grows by doubling up to max_samples
+        self._len = 0
+        self._frame = np.zeros(self.vad.frame_len, dtype=np.float32)
+        self._fill = 0
+        self.in_speech = False
+        self._last_speech_end = 0
+
+    def reset(self):
+        self._len = 0
+        self._fill = 0
+        self.in_speech = False
+        self._last_speech_end = 0
+
+    def _append(self, frame):
+        if self._len + len(frame) > len(self._buf):
+            grown = np.zeros(min(self.max_samples, len(self._buf) * 2), dtype=np.float32)
+            grown[:self._len] = self._buf[:self._len]
+            self._buf = grown
+        self._buf[self._len:self._len + len(frame)] = frame
+        self._len += len(frame)
+
+    def feed_int16(self, samples):
+        """
+        Feed int16 PCM. Returns the finished turn's PCM if silence just ended it,
+        otherwise None.
+        """
+        finished = None
+        i = 0
+        n = len(samples)
+        frame_len = len(self._frame)
+        while i < n:
+            take = min(frame_len - self._fill, n - i)
+            np.multiply(samples[i:i + take], 1.0 / 32768.0,
+                        out=self._frame[self._fill:self._fill + take], casting="unsafe")
+            self._fill += take
+            i += take
+            if self._fill < frame_len:
+                break
+            self._fill = 0
+
+            speech = self.vad.is_speech(self._frame)
+            if not self.in_speech:
+                if speech:
+                    self.in_speech = True
+                elif self._len + frame_len > 2 * self.pre_roll:
+                    # Keep only the pre-roll while waiting for the answer to start
+                    keep = self.pre_roll
+                    self._buf[:keep] = self._buf[self._len - keep:self._len]
+                    self._len = keep
+            self._append(self._frame)
+            if speech:
+                self._last_speech_end = self._len
+
+            if self.in_speech:
+                silent_for = self._len - self._last_speech_end
+                if (self.end_silence > 0 and silent_for >= self.end_silence) or self._len + frame_len > self.max_samples:
+                    finished = self.end_turn()
+        return finished
+
+    def end_turn(self):
+        """
+        Close the current turn. Returns a copy of its PCM (trailing silence beyond the
+        VAD hangover removed), or None if no speech was heard.
+        """
+        pcm = None
+        if self.in_speech:
+            pcm = self._buf[:self._last_speech_end].copy()
+        self.reset()
+        return pcm
+
+
 class AudioStreamProcessor:
-    def __init__(self, track, datachannel_manager):
+    def __init__(self, track, datachannel_manager, live_transcripts=LIVE_AUDIO_TRANSCRIPTS, push_interval=PROSODY_PUSH_INTERVAL_SEC, on_turn=None):
         self.track = track
         self.datachannel_manager = datachannel_manager
+        self.prosody = ProsodyTracker(sample_rate=16000)
+        # Turn segmentation is enabled once the client binds a session (see bind_session)
+        self.on_turn = on_turn
+        self.segmenter = None
+        self.session_id = None
+        self._session_clock = None # (monotonic time, client timestamp_sec) at bind
+        self._turn_count = 0
+        self.push_interval = push_interval
+        self.live_transcripts = live_transcripts and get_whisper_model() is not None
         
-        # Audio confidence model
-        self.audio_model = AudioConfidenceModel(embedding_dim=384)
-        if os.path.exists(AUDIO_MODEL_PATH):
-            self.audio_model.load_state_dict(torch.load(AUDIO_MODEL_PATH, map_location=device))
-        self.audio_model.to(device).eval()
+        # Audio confidence model (only needed for windowed Whisper inference)
+        self.audio_model = None
+        if self.live_transcripts:
+            self.audio_model = AudioConfidenceModel(embedding_dim=384)
+            if os.path.exists(AUDIO_MODEL_PATH):
+                self.audio_model.load_state_dict(torch.load(AUDIO_MODEL_PATH, map_location=device))
+            self.audio_model.to(device).eval()
 
         self.resampler = av.AudioResampler(format='s16', layout='mono', rate=16000)
         self.task = asyncio.create_task(self._process_stream())
 
     def _process_audio_chunk(self, audio_data):
+        whisper_model = get_whisper_model()
         if whisper_model is None: return
 
         # audio_data: np.array of float32 around (-1, 1), shape (N,)
-        audio_tensor = whisper.pad_or_trim(audio_data.flatten())
+        audio_data = audio_data.reshape(-1)
+        audio_tensor = whisper.pad_or_trim(audio_data)
         mel = whisper.log_mel_spectrogram(audio_tensor, n_mels=whisper_model.dims.n_mels).to(whisper_model.device)
+
+        # The encoder only accepts the full 30 s window, but everything past the chunk
+        # is padding. Mel hop is 10 ms and the encoder halves the frame rate, so each
+        # feature frame covers 2 * HOP_LENGTH samples.
+        samples_per_frame = whisper.audio.HOP_LENGTH * 2
+        n_frames = min(whisper_model.dims.n_audio_ctx, max(1, -(-len(audio_data) // samples_per_frame)))
         
         with torch.no_grad():
-            # 1. Transcript
-            options = whisper.DecodingOptions(language="en", fp16=False)
-            result = whisper.decode(whisper_model, mel, options)
-            transcript = result.text
-            
-            # 2. Embeddings
+            # 1. Encode once; shape is [1, 1500, 384] for 'tiny'
             audio_features = whisper_model.encoder(mel.unsqueeze(0))
-            # Shape for audio_features is [1, 1500, 384]
-            # Mean pool across time to get [1, 384] to send over datachannel
-            pooled_embedding = torch.mean(audio_features, dim=1).cpu().numpy()[0]
 
-            # 3. Audio Confidence
-            logits = self.audio_model(audio_features)
+            # 2. Transcript. decode() skips its own encoder pass when it is handed
+            # features of shape [n_audio_ctx, n_audio_state] instead of a mel.
+            options = whisper.DecodingOptions(language="en", fp16=False, without_timestamps=True)
+            result = whisper.decode(whisper_model, audio_features, options)[0]
+            transcript = result.text
+
+            # 3. Audio Confidence over the frames that contain audio, not the padding
+            logits = self.audio_model(audio_features[:, :n_frames])
             probs = F.softmax(logits, dim=1)
             audio_confidence = probs[0][1].item() # Class 1 is CONFIDENT
 
@@ -298,33 +475,99 @@ class AudioStreamProcessor:
             "confidence": audio_confidence
         }
 
+    def bind_session(self, session_id, timestamp_sec=0.0):
+        """Start segmenting turns for a session (client sent a 'session' message)."""
+        self.session_id = session_id
+        self._session_clock = (time.monotonic(), float(timestamp_sec))
+        if self.segmenter is None:
+            self.segmenter = TurnSegmenter(sample_rate=16000)
+
+    def session_time(self):
+        if self._session_clock is None:
+            return 0.0
+        bound_at, offset = self._session_clock
+        return offset + (time.monotonic() - bound_at)
+
+    def start_turn(self):
+        if self.segmenter is not None:
+            self.segmenter.reset()
+
+    def end_turn(self, timestamp_sec=None, reason="client"):
+        """Close the current turn and hand its PCM to on_turn."""
+        if self.segmenter is None:
+            return
+        self._dispatch_turn(self.segmenter.end_turn(), timestamp_sec, reason)
+
+    def _dispatch_turn(self, pcm, timestamp_sec=None, reason="silence"):
+        if self.on_turn is None or self.session_id is None:
+            return
+        self._turn_count += 1
+        turn = {
+            "session_id": self.session_id,
+            "turn_id": f"{self.session_id}-t{self._turn_count}",
+            "timestamp_sec": float(timestamp_sec) if timestamp_sec is not None else self.session_time(),
+            "reason": reason,
+        }
+        print(f"[DEBUG] Live turn {turn['turn_id']} ended ({reason}), {0 if pcm is None else len(pcm) / 16000:.1f}s audio")
+        asyncio.create_task(self.on_turn(pcm, turn))
+
+    def _push_prosody(self, timestamp_ms):
+        stats = self.prosody.snapshot()
+        # Own message type: audio_inference is one result per answer and the client
+        # records each as a biometric point
+        self.datachannel_manager.send_json({
+            "type": "prosody",
+            "confidence": stats["confidence"],
+            "volume_rms": stats["volume_rms"],
+            "pitch_stdev": stats["pitch_stdev"],
+            "pacing_wpm": stats["pacing_wpm"],
+            "is_speaking": stats["is_speaking"],
+            "timestamp": timestamp_ms
+        })
+        return stats["is_speaking"]
+
     async def _process_stream(self):
-        # We will buffer 3 seconds of audio at a time
+        # We will buffer 3 seconds of audio at a time and slide the window 1 s per inference
         chunk_length_samples = 16000 * 3 
-        audio_buffer = []
+        chunk_hop_samples = 16000
+        ring = AudioRingBuffer(chunk_length_samples + 16000) if self.live_transcripts else None
+
+        start_time = time.time()
+        last_push_time = 0
+        was_speaking = False
 
         while True:
             try:
                 frame = await self.track.recv()
                 
-                resampled_frames = self.resampler.resample(frame.frame)
+                resampled_frames = self.resampler.resample(frame)
                 for resampled_frame in resampled_frames:
-                    data = resampled_frame.to_ndarray()
-                    audio_buffer.append(data.flatten())
+                    # Packed mono s16 -> shape (1, n)
+                    samples = resampled_frame.to_ndarray()[0]
+                    self.prosody.update_int16(samples)
+                    if ring is not None:
+                        ring.write_int16(samples)
+                    if self.segmenter is not None:
+                        finished = self.segmenter.feed_int16(samples)
+                        if finished is not None:
+                            self._dispatch_turn(finished)
+
+                # Live prosody while the candidate talks, plus one update when they stop
+                current_time = time.time()
+                if current_time - last_push_time >= self.push_interval:
+                    last_push_time = current_time
+                    if self.prosody.snapshot()["is_speaking"] or was_speaking:
+                        was_speaking = self._push_prosody(int((current_time - start_time) * 1000))
                 
                 # Check if we have enough samples
-                current_length = sum(len(x) for x in audio_buffer)
-                if current_length >= chunk_length_samples:
-                    audio_data = np.concatenate(audio_buffer)[:chunk_length_samples]
-                    # Keep 1 sec overlap
-                    samples_to_keep = np.concatenate(audio_buffer)[16000:]
-                    audio_buffer = [samples_to_keep]
-
-                    # Convert to float32 expected by whisper
-                    audio_float = audio_data.astype(np.float32) / 32768.0
+                if ring is not None and len(ring) >= chunk_length_samples:
+                    # View into the ring; no frames are written while the model runs
+                    # because the next recv() waits for this await.
+                    audio_float = ring.peek(chunk_length_samples)
 
                     # Run model
                     result_event = await asyncio.to_thread(self._process_audio_chunk, audio_float)
+                    ring.advance(chunk_hop_samples)
                     if result_event:
                         self.datachannel_manager.send_json(result_event)
 
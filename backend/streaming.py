@@ -0,0 +1,330 @@
+import asyncio
+import json
+import os
+import re
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from metrics import metrics
+
+# Longest run of text held back while it could still turn into a score tag
+MAX_TAG_LEN = 40
+_TAG_WORD = "SCORE"
+
+# Used only when the model never emitted a well-formed [SCORE: x] tag
+_FALLBACK_PATTERNS = (
+    re.compile(r"\[(\d+\.?\d*)]"),                    # any bracketed number: [0.2]
+    re.compile(r"score:\s*(\d+\.?\d*)", re.IGNORECASE), # "Score: X" anywhere
+    re.compile(r"(\d\.\d+)\s*$"),                     # a decimal at the very end
+)
+# A tag cut off by the end of the stream, e.g. "[SCORE: 0.9"
+_TRUNCATED_TAG = re.compile(r"\[\s*SCORE\s*:\s*(\d+(?:\.\d+)?)(?![.\d])", re.IGNORECASE)
+
+
+def _match_tag(s):
+    """
+    Match a score tag at the start of s (which begins with "[").
+    Returns (length, score) for a complete tag, (None, None) if s is a proper
+    prefix of one, or (0, None) if s cannot become a tag.
+    """
+    n = len(s)
+    i = 1
+
+    def skip_ws(i):
+        while i < n and s[i] in " \t":
+            i += 1
+        return i
+
+    i = skip_ws(i)
+    for ch in _TAG_WORD:
+        if i >= n:
+            return None, None
+        if s[i].upper() != ch:
+            return 0, None
+        i += 1
+    i = skip_ws(i)
+    if i >= n:
+        return None, None
+    if s[i] != ":":
+        return 0, None
+    i = skip_ws(i + 1)
+    start = i
+    while i < n and (s[i].isdigit() or (s[i] == "." and "." not in s[start:i] and i > start)):
+        i += 1
+    if i >= n:
+        return None, None
+    if i == start:
+        return 0, None
+    number = s[start:i]
+    i = skip_ws(i)
+    if i >= n:
+        return None, None
+    if s[i] != "]":
+        return 0, None
+    try:
+        return i + 1, float(number)
+    except ValueError:
+        return 0, None
+
+
+class ScoreTagParser:
+    """
+    Removes `[SCORE: x]` tags from a token stream as it arrives.
+
+    feed() returns the text that is safe to forward right away; only a trailing
+    "[..." that could still be the start of a tag is held back. The first tag's
+    value is available in `score` as soon as its closing bracket arrives.
+    """
+    def __init__(self):
+        self.score = None
+        self.text = "" # everything forwarded so far, tags removed
+        self._pending = ""
+
+    def feed(self, chunk):
+        buf = self._pending + chunk
+        out = []
+        pos = 0
+        while True:
+            idx = buf.find("[", pos)
+            if idx < 0:
+                out.append(buf[pos:])
+                self._pending = ""
+                break
+            out.append(buf[pos:idx])
+            length, score = _match_tag(buf[idx:idx + MAX_TAG_LEN])
+            if length is None:
+                if len(buf) - idx >= MAX_TAG_LEN:
+                    # Absurdly padded "tag": give up on it
+                    out.append("[")
+                    pos = idx + 1
+                    continue
+                self._pending = buf[idx:]
+                break
+            if length == 0:
+                out.append("[")
+                pos = idx + 1
+                continue
+            if self.score is None:
+                self.score = score
+            pos = idx + length
+        emitted = "".join(out)
+        self.text += emitted
+        return emitted
+
+    def finish(self):
+        """
+        End of stream. Whatever is still held back is the start of a tag the model
+        never closed: it is dropped, never forwarded, but a score in it still counts.
+        """
+        pending, self._pending = self._pending, ""
+        match = _TRUNCATED_TAG.match(pending)
+        if match and self.score is None:
+            self.score = float(match.group(1))
+
+    def fallback_score(self):
+        """Best-effort score for responses that never contained a tag."""
+        for pattern in _FALLBACK_PATTERNS:
+            match = pattern.search(self.text)
+            if match:
+                try:
+                    return float(match.group(1))
+                except ValueError:
+                    pass
+        return None
+
+
+# ── SSE writer ──────────────────────────────────────────────────────────────
+SSE_COALESCE_MS = float(os.environ.get("SSE_COALESCE_MS", "30"))
+SSE_COALESCE_CHARS = int(os.environ.get("SSE_COALESCE_CHARS", "256"))
+SSE_MAX_BUFFERED = 64 * 1024 # Producers wait once this many bytes are queued for a slow client
+# How often a streaming handler checks whether its client is still connected
+DISCONNECT_POLL_SEC = float(os.environ.get("DISCONNECT_POLL_SEC", "0.1"))
+
+# Flush at once when a batch ends a sentence or clause so speech/UI never lag on it
+_FLUSH_NOW = re.compile(r"[.!?:;\n]")
+
+
+def _dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode()
+
+
+class SSEWriter:
+    """
+    Server-sent events over an aiohttp StreamResponse.
+
+    Tokens are coalesced into one `{"token": ...}` event per SSE_COALESCE_MS window
+    (or SSE_COALESCE_CHARS, or sentence boundary), serialized with orjson when
+    available, and written by a background task so the producer keeps reading
+    upstream while a write drains. Producers only wait when more than
+    SSE_MAX_BUFFERED bytes are pending (transport backpressure).
+    """
+    def __init__(self, response, window_ms=SSE_COALESCE_MS, max_chars=SSE_COALESCE_CHARS, max_buffered=SSE_MAX_BUFFERED):
+        self._response = response
+        self.window = window_ms / 1000.0
+        self.max_chars = max_chars
+        self.max_buffered = max_buffered
+        self._tokens = []
+        self._token_chars = 0
+        self._timer = None
+        self._out = bytearray()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._closed = False
+        self.error = None
+        self.events = 0
+        self.writes = 0
+        self._task = asyncio.create_task(self._pump())
+
+    async def send_token(self, text):
+        if not text:
+            return
+        self._tokens.append(text)
+        self._token_chars += len(text)
+        if self._token_chars >= self.max_chars or _FLUSH_NOW.search(text):
+            self._flush_tokens()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_tokens)
+        await self._backpressure()
+
+    async def send(self, payload):
+        """Queue a complete event; pending tokens go out first to keep order."""
+        self._flush_tokens()
+        self._enqueue(payload)
+        await self._backpressure()
+
+    async def close(self):
+        """Flush everything and wait until it has been written."""
+        self._flush_tokens()
+        self._closed = True
+        self._wakeup.set()
+        await self._task
+        metrics.inc("sse_events", self.events)
+        metrics.inc("sse_writes", self.writes)
+
+    def _flush_tokens(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._tokens:
+            text = "".join(self._tokens)
+            self._tokens.clear()
+            self._token_chars = 0
+            self._enqueue({"token": text})
+
+    def _enqueue(self, payload):
+        if self.error is not None:
+            return
+        self._out += b"data: " + _dumps(payload) + b"\n\n"
+        self.events += 1
+        self._wakeup.set()
+        if len(self._out) > self.max_buffered:
+            self._space.clear()
+
+    async def _backpressure(self):
+        if self.error is not None:
+            raise self.error
+        if not self._space.is_set():
+            await self._space.wait()
+            if self.error is not None:
+                raise self.error
+
+    async def _pump(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._out:
+                    data = bytes(self._out)
+                    self._out.clear()
+                    self._space.set()
+                    await self._response.write(data)
+                    self.writes += 1
+                if self._closed:
+                    return
+        except Exception as e:
+            # Client went away: fail the producer on its next send
+            self.error = e
+            self._out.clear()
+            self._space.set()
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client closed its connection while a response was being produced."""
+
+
+class DisconnectWatch:
+    """
+    Stops producing a response once its client has gone, so upstream streams are
+    torn down instead of being read to the end for nobody. aiohttp does not cancel
+    handlers on disconnect (and a busy handler never notices), so while inside
+    `async with DisconnectWatch(request) as watch:` the transport is polled.
+    Iterate provider streams through watch.guard() and await long waits through
+    watch.race(): either one cancels the pending step and raises
+    ClientDisconnected as soon as the connection closes.
+    """
+    def __init__(self, request, interval=DISCONNECT_POLL_SEC):
+        self._request = request
+        self.interval = interval
+        self.started_at = None
+        self.disconnected_at = None
+        self._gone = asyncio.Event()
+        self._watcher = None
+
+    @property
+    def connected(self):
+        transport = self._request.transport
+        return transport is not None and not transport.is_closing()
+
+    async def __aenter__(self):
+        self.started_at = time.monotonic()
+        self._watcher = asyncio.create_task(self._watch())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._watcher.cancel()
+        return False
+
+    async def _watch(self):
+        while self.connected:
+            await asyncio.sleep(self.interval)
+        self.disconnected_at = time.monotonic()
+        self._gone.set()
+
+    async def race(self, awaitable):
+        """Await `awaitable`; cancel it and raise ClientDisconnected if the client leaves first."""
+        if self._gone.is_set():
+            raise ClientDisconnected("client disconnected")
+        step = asyncio.ensure_future(awaitable)
+        gone = asyncio.ensure_future(self._gone.wait())
+        try:
+            await asyncio.wait({step, gone}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            gone.cancel()
+            if not step.done():
+                step.cancel()
+                await asyncio.wait({step})
+        if step.cancelled() and self._gone.is_set():
+            raise ClientDisconnected("client disconnected")
+        return step.result()
+
+    async def guard(self, stream):
+        """Async-iterate `stream` until it ends or the client leaves; closes it either way."""
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await self.race(iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
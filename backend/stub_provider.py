@@ -0,0 +1,232 @@
+"""
+Deterministic stand-in for the Gemini (text, TTS, context cache) and OpenAI
+(whisper-1 transcription) REST APIs, for load tests without network or spend.
+
+Run it standalone and point the server at it:
+
+    python stub_provider.py --port 9100
+    PROVIDER_MODE=stub-http STUB_PROVIDER_URL=http://127.0.0.1:9100/ python server.py
+
+or let the server start it in-process with PROVIDER_MODE=stub. The real SDK
+clients are used either way (only their base_url changes), so the whole request
+path, pooling and streaming included, is exercised.
+
+Latency and throughput are shaped by STUB_* environment variables (see StubProfile).
+Responses depend only on the request body and STUB_SEED, so runs are repeatable.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+
+import numpy as np
+from aiohttp import web
+
+STUB_PROVIDER_PORT = int(os.environ.get("STUB_PROVIDER_PORT", "9100"))
+
+_REPLIES = (
+    "That's a reasonable start.",
+    "I'd push back on that a little.",
+    "Walk me through how you would handle a partial failure there.",
+    "What trade-offs did you consider between consistency and latency?",
+    "How would you test that under production load?",
+    "Tell me about a time that design broke and what you changed.",
+    "How does that approach scale to ten times the traffic?",
+    "Let's go one level deeper on the data model.",
+)
+_TRANSCRIPTS = (
+    "I would start by profiling the hot path and then add caching where it matters.",
+    "We used a queue to decouple the writers from the readers, which helped a lot.",
+    "Honestly I am not sure, but I would probably look at the database indexes first.",
+)
+_TTS_RATE = 24000 # Gemini TTS output: 16-bit mono PCM at 24 kHz
+_WORDS_PER_SEC_SPOKEN = 2.6
+
+
+class StubProfile:
+    """Latency/throughput knobs, read from STUB_* environment variables."""
+    def __init__(self):
+        env = os.environ.get
+        self.ttft_ms = float(env("STUB_TTFT_MS", "250"))          # median time to first chunk
+        self.ttft_sigma = float(env("STUB_TTFT_SIGMA", "0.35"))   # log-normal spread
+        self.tail_rate = float(env("STUB_TAIL_RATE", "0.02"))     # share of very slow requests
+        self.tail_ms = float(env("STUB_TAIL_MS", "2000"))         # extra delay for those
+        self.tokens_per_sec = float(env("STUB_TOKENS_PER_SEC", "80"))
+        self.tts_rtf = float(env("STUB_TTS_RTF", "0.25"))         # synthesis seconds per audio second
+        self.stt_ms = float(env("STUB_STT_MS", "300"))
+        self.seed = int(env("STUB_SEED", "0"))
+
+    def first_chunk_delay(self, rng):
+        delay = self.ttft_ms / 1000.0 * rng.lognormvariate(0.0, self.ttft_sigma)
+        if rng.random() < self.tail_rate:
+            delay += self.tail_ms / 1000.0
+        return delay
+
+
+def _texts(content):
+    """All text parts of a Content dict / list of Content dicts."""
+    if not content:
+        return ""
+    if isinstance(content, list):
+        return "\n".join(_texts(c) for c in content)
+    return "\n".join(p.get("text", "") for p in content.get("parts", []) if isinstance(p, dict))
+
+
+class StubProvider:
+    def __init__(self, profile=None):
+        self.profile = profile or StubProfile()
+        self._cached = {} # cachedContents name -> system instruction text
+        self.requests = 0
+
+    def _rng(self, body):
+        digest = hashlib.sha1(body + str(self.profile.seed).encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/{version}/models/{target}", self.handle_models)
+        app.router.add_post("/{version}/cachedContents", self.handle_cache_create)
+        app.router.add_delete("/{version}/cachedContents/{name}", self.handle_cache_delete)
+        app.router.add_post("/v1/audio/transcriptions", self.handle_transcription)
+        app.router.add_get("/", lambda request: web.Response(text="stub provider"))
+        app.router.add_route("HEAD", "/v1/", lambda request: web.Response())
+        return app
+
+    async def start(self, host="127.0.0.1", port=STUB_PROVIDER_PORT):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        print(f"Stub provider listening on http://{host}:{port}/")
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    # ── Gemini ─────────────────────────────────────────────────────────────
+    async def handle_models(self, request):
+        self.requests += 1
+        model, _, action = request.match_info["target"].partition(":")
+        raw = await request.read()
+        body = json.loads(raw or b"{}")
+        rng = self._rng(raw)
+
+        system = _texts(body.get("systemInstruction"))
+        cached = self._cached.get(body.get("cachedContent"), "")
+        prompt = _texts(body.get("contents"))
+        usage = {
+            "promptTokenCount": (len(system) + len(cached) + len(prompt)) // 4 + 1,
+            "cachedContentTokenCount": len(cached) // 4,
+        }
+        modalities = (body.get("generationConfig") or {}).get("responseModalities") or []
+        streaming = action == "streamGenerateContent"
+
+        if "AUDIO" in modalities:
+            return await self._audio(request, rng, prompt, usage, streaming)
+
+        text = " ".join(rng.sample(_REPLIES, rng.randint(2, 3)))
+        if "[SCORE:" in system or "[SCORE:" in cached:
+            text += f" [SCORE: {rng.uniform(0.2, 0.95):.2f}]"
+        usage["candidatesTokenCount"] = len(text) // 4 + 1
+
+        if not streaming:
+            await asyncio.sleep(self.profile.first_chunk_delay(rng) + usage["candidatesTokenCount"] / self.profile.tokens_per_sec)
+            return web.json_response(self._candidate({"text": text}, usage))
+
+        response = await self._sse(request)
+        try:
+            await asyncio.sleep(self.profile.first_chunk_delay(rng))
+            words = text.split(" ")
+            for i in range(0, len(words), 3):
+                piece = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+                last = i + 3 >= len(words)
+                await self._event(response, self._candidate({"text": piece}, usage if last else None))
+                if not last:
+                    await asyncio.sleep(max(1, len(piece) // 4) / self.profile.tokens_per_sec)
+            await response.write_eof()
+        except ConnectionResetError:
+            pass # caller gave up on the stream (cancelled hedge, deadline)
+        return response
+
+    async def _audio(self, request, rng, prompt, usage, streaming):
+        spoken = prompt.split("\n\n", 1)[-1] # drop the "read this aloud" preamble
+        seconds = max(0.5, len(spoken.split()) / _WORDS_PER_SEC_SPOKEN)
+        t = np.arange(int(seconds * _TTS_RATE)) / _TTS_RATE
+        tone = 180.0 + 40.0 * rng.random()
+        pcm = (np.sin(2 * np.pi * tone * t) * 3000).astype("<i2").tobytes()
+        mime = f"audio/L16;codec=pcm;rate={_TTS_RATE}"
+
+        def part(data):
+            return {"inlineData": {"mimeType": mime, "data": base64.b64encode(data).decode("ascii")}}
+
+        if not streaming:
+            await asyncio.sleep(self.profile.first_chunk_delay(rng) + seconds * self.profile.tts_rtf)
+            return web.json_response(self._candidate(part(pcm), usage))
+
+        response = await self._sse(request)
+        try:
+            await asyncio.sleep(self.profile.first_chunk_delay(rng))
+            step = _TTS_RATE // 4 * 2 # 0.25 s of audio per chunk
+            for i in range(0, len(pcm), step):
+                last = i + step >= len(pcm)
+                await self._event(response, self._candidate(part(pcm[i:i + step]), usage if last else None))
+                if not last:
+                    await asyncio.sleep(0.25 * self.profile.tts_rtf)
+            await response.write_eof()
+        except ConnectionResetError:
+            pass # caller gave up on the stream (cancelled hedge, deadline)
+        return response
+
+    async def handle_cache_create(self, request):
+        body = await request.json()
+        name = "cachedContents/" + hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16]
+        self._cached[name] = _texts(body.get("systemInstruction"))
+        return web.json_response({"name": name, "model": body.get("model"), "displayName": body.get("displayName", "")})
+
+    async def handle_cache_delete(self, request):
+        self._cached.pop(f"cachedContents/{request.match_info['name']}", None)
+        return web.json_response({})
+
+    @staticmethod
+    def _candidate(part, usage):
+        payload = {"candidates": [{"content": {"role": "model", "parts": [part]}, "index": 0}]}
+        if usage:
+            payload["candidates"][0]["finishReason"] = "STOP"
+            payload["usageMetadata"] = usage
+        return payload
+
+    @staticmethod
+    async def _sse(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        return response
+
+    @staticmethod
+    async def _event(response, payload):
+        await response.write(b"data: " + json.dumps(payload).encode() + b"\r\n\r\n")
+
+    # ── OpenAI ─────────────────────────────────────────────────────────────
+    async def handle_transcription(self, request):
+        self.requests += 1
+        raw = await request.read()
+        rng = self._rng(raw)
+        await asyncio.sleep(self.profile.stt_ms / 1000.0 * rng.lognormvariate(0.0, self.profile.ttft_sigma))
+        return web.json_response({"text": rng.choice(_TRANSCRIPTS)})
+
+
+async def _serve(host, port):
+    provider = StubProvider()
+    await provider.start(host, port)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Gemini/OpenAI provider for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=STUB_PROVIDER_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
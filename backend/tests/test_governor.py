@@ -0,0 +1,195 @@
+import asyncio
+
+import pytest
+
+from deadlines import CallPolicy, call_with_deadline
+from governor import BACKGROUND, INTERACTIVE, GovernorShed, ProviderGovernor
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_interactive_overtakes_queued_background():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=1000, burst=1000, max_concurrency=1)
+        order = []
+        release = asyncio.Event()
+
+        async def hold():
+            async with gov.slot(INTERACTIVE):
+                await release.wait()
+
+        async def call(priority, name):
+            async with gov.slot(priority):
+                order.append(name)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        background = asyncio.create_task(call(BACKGROUND, "background"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call(INTERACTIVE, "interactive"))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, background, interactive)
+        return order
+
+    assert run(main()) == ["interactive", "background"]
+
+
+def test_background_is_capped_below_concurrency():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=1000, burst=1000, max_concurrency=4, max_background=1)
+        release = asyncio.Event()
+
+        async def hold(priority):
+            async with gov.slot(priority):
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold(BACKGROUND)) for _ in range(2)]
+        tasks += [asyncio.create_task(hold(INTERACTIVE)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        active = dict(gov._active)
+        release.set()
+        await asyncio.gather(*tasks)
+        return active
+
+    assert run(main()) == {INTERACTIVE: 3, BACKGROUND: 1}
+
+
+def test_background_shed_when_queue_full():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=1000, burst=1000, max_concurrency=1, background_queue_limit=1)
+        release = asyncio.Event()
+
+        async def hold(priority):
+            async with gov.slot(priority):
+                await release.wait()
+
+        holder = asyncio.create_task(hold(INTERACTIVE))
+        queued = asyncio.create_task(hold(BACKGROUND))
+        await asyncio.sleep(0)
+        with pytest.raises(GovernorShed):
+            async with gov.slot(BACKGROUND):
+                pass
+        release.set()
+        await asyncio.gather(holder, queued)
+
+    run(main())
+
+
+def test_background_shed_after_max_wait():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=1000, burst=1000, max_concurrency=1, background_max_wait_sec=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gov.slot(INTERACTIVE):
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(GovernorShed):
+            async with gov.slot(BACKGROUND):
+                pass
+        assert gov._queued[BACKGROUND] == 0
+        release.set()
+        await holder
+
+    run(main())
+
+
+def test_interactive_timeout_while_queued():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=1000, burst=1000, max_concurrency=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gov.slot(INTERACTIVE):
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            async with gov.slot(INTERACTIVE, timeout=0.05):
+                pass
+        assert gov._queued[INTERACTIVE] == 0
+        release.set()
+        await holder
+        assert gov._active[INTERACTIVE] == 0
+
+    run(main())
+
+
+def test_rate_limit_spaces_requests_after_burst():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=20, burst=2, max_concurrency=10)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(4):
+            async with gov.slot():
+                pass
+        return loop.time() - start
+
+    # Two requests ride the burst, the other two wait ~50 ms each for a token
+    assert 0.08 <= run(main()) < 0.5
+
+
+def test_try_token_respects_bucket_and_queue():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=0.001, burst=2, max_concurrency=10)
+        async with gov.slot():
+            assert gov.try_token()
+            assert not gov.try_token() # bucket empty
+            with pytest.raises(asyncio.TimeoutError):
+                await gov.token(timeout=0.02)
+
+    run(main())
+
+
+def test_hedges_and_retries_take_tokens():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=0.001, burst=3, max_concurrency=10)
+        policy = CallPolicy("t", budget_sec=2, first_chunk_sec=1, retries=1, hedge=True,
+                            default_hedge_sec=0.02, min_hedge_sec=0.02, retry_base_sec=0.01, governor=gov)
+        calls = 0
+
+        async def make_call():
+            nonlocal calls
+            calls += 1
+            if calls <= 2:
+                await asyncio.sleep(0.05)
+                raise RuntimeError("boom")
+            return "ok"
+
+        result = await call_with_deadline(make_call, policy)
+        return result, calls, gov._tokens
+
+    # Slot + hedge + retry: three provider requests, three tokens
+    result, calls, tokens = run(main())
+    assert result == "ok"
+    assert calls == 3
+    assert tokens < 1
+
+
+def test_hedge_skipped_when_bucket_empty():
+    async def main():
+        gov = ProviderGovernor(rate_per_sec=0.001, burst=1, max_concurrency=10)
+        events = []
+        policy = CallPolicy("t", budget_sec=1, first_chunk_sec=0.5, retries=0, hedge=True,
+                            default_hedge_sec=0.01, min_hedge_sec=0.01, governor=gov,
+                            on_event=lambda name, event, value: events.append(event))
+        calls = 0
+
+        async def make_call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        assert await call_with_deadline(make_call, policy) == "ok"
+        return calls, events
+
+    calls, events = run(main())
+    assert calls == 1
+    assert "hedge_skipped" in events and "hedged" not in events
@@ -0,0 +1,49 @@
+import asyncio
+
+from history_compactor import HistoryCompactor
+from session_store import SessionState
+
+
+def make_state(n):
+    state = SessionState("s1")
+    for i in range(n):
+        state.add_entry("user" if i % 2 else "interviewer", f"entry {i}")
+    return state
+
+
+def test_summary_is_stored_when_history_is_unchanged():
+    async def summarize(summary, entries, budget):
+        return f"summary of {len(entries)}"
+
+    async def run():
+        state = make_state(6)
+        await HistoryCompactor(summarize)._refresh(state, 4)
+        return state
+
+    state = asyncio.run(run())
+    assert state.summary == "summary of 4"
+    assert state.summarized_upto == 4
+
+
+def test_summary_is_discarded_when_history_is_replaced_at_the_same_length():
+    async def run():
+        state = make_state(6)
+        release = asyncio.Event()
+
+        async def summarize(summary, entries, budget):
+            await release.wait()
+            return "stale summary"
+
+        task = asyncio.create_task(HistoryCompactor(summarize)._refresh(state, 4))
+        await asyncio.sleep(0)
+        # A resync rewrites an entry the summary covers but keeps the length
+        rewritten = [dict(e) for e in state.history]
+        rewritten[1]["text"] = "corrected answer"
+        state.history = rewritten
+        release.set()
+        await task
+        return state
+
+    state = asyncio.run(run())
+    assert state.summary == ""
+    assert state.summarized_upto == 0
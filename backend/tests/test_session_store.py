@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import session_store
+from session_store import CodeVersionError, SessionState, SessionStore, TurnSequenceError
+
+
+def test_lru_eviction_beyond_max_sessions():
+    store = SessionStore(max_sessions=2, idle_ttl=3600, persist_dir="")
+    store.create("a")
+    store.create("b")
+    store.get("a") # "b" is now least recently used
+    store.create("c")
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert store.get("c") is not None
+
+
+def test_idle_sessions_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "monotonic", lambda: now[0])
+    store = SessionStore(max_sessions=10, idle_ttl=60, persist_dir="")
+    store.create("old")
+    now[0] += 61
+    store.create("new")
+    assert store.get("old") is None
+    assert store.get("new") is not None
+
+
+def test_persisted_session_survives_eviction(tmp_path):
+    store = SessionStore(max_sessions=1, idle_ttl=3600, persist_dir=str(tmp_path))
+    state = store.create("s/1", persona_id="p1", resume_text="resume")
+    state.begin_turn(1)
+    state.commit_turn("answer", "question", 1)
+    state.set_code("print(1)")
+    state.summary, state.summarized_upto = "so far", 1
+    store.save(state)
+    store.create("other") # evicts "s/1" from memory
+
+    loaded = store.get("s/1")
+    assert loaded is not state
+    assert loaded.to_dict() == state.to_dict()
+
+    store.discard("s/1")
+    assert SessionStore(persist_dir=str(tmp_path)).get("s/1") is None
+
+
+def test_repeated_turn_seq_rolls_back_the_last_turn():
+    state = SessionState("s1")
+    state.add_entry("interviewer", "greeting")
+    state.begin_turn(1)
+    state.commit_turn("first answer", "first reply", 1)
+    # The client did not see the reply and retries turn 1
+    state.begin_turn(1)
+    assert state.history == [{"speaker": "interviewer", "text": "greeting"}]
+    assert state.turn_seq == 0
+    state.commit_turn("first answer", "second reply", 1)
+    assert [e["text"] for e in state.history] == ["greeting", "first answer", "second reply"]
+    assert state.turn_seq == 1
+
+
+def test_turn_seq_gap_asks_for_resync():
+    state = SessionState("s1")
+    state.begin_turn(1)
+    state.commit_turn("a", "b", 1)
+    with pytest.raises(TurnSequenceError) as e:
+        state.begin_turn(3)
+    assert e.value.expected == 2
+    assert state.turn_seq == 1
+
+
+def test_code_delta_on_stale_base_asks_for_resync():
+    state = SessionState("s1")
+    state.set_code("x = 1\n")
+    ops = [{"offset": 4, "length": 1, "text": "2"}]
+    state.apply_code_delta(1, ops)
+    assert state.code == "x = 2\n"
+    state.apply_code_delta(1, ops) # retried delta is applied once
+    assert (state.code, state.code_version) == ("x = 2\n", 2)
+    with pytest.raises(CodeVersionError) as e:
+        state.apply_code_delta(1, [{"offset": 0, "length": 0, "text": "#"}])
+    assert e.value.current == 2
+
+
+def test_turns_of_one_session_are_serialized():
+    store = SessionStore(persist_dir="")
+    order = []
+
+    async def turn(name):
+        async with store.lock("s1"):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    async def run():
+        await asyncio.gather(turn("a"), turn("b"))
+
+    asyncio.run(run())
+    assert order == ["a start", "a end", "b start", "b end"]
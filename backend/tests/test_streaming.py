@@ -0,0 +1,42 @@
+from streaming import ScoreTagParser
+
+
+def feed_all(parser, chunks):
+    out = "".join(parser.feed(chunk) for chunk in chunks)
+    parser.finish()
+    return out
+
+
+def test_tag_is_removed_and_scored():
+    parser = ScoreTagParser()
+    out = feed_all(parser, ["Good answer. [SCO", "RE: 0.", "85] Next?"])
+    assert out == "Good answer.  Next?"
+    assert parser.score == 0.85
+
+
+def test_non_tag_brackets_pass_through():
+    parser = ScoreTagParser()
+    assert feed_all(parser, ["a [1] and [x", "yz]"]) == "a [1] and [xyz]"
+    assert parser.score is None
+
+
+def test_truncated_tag_with_value_is_dropped_but_scored():
+    parser = ScoreTagParser()
+    out = feed_all(parser, ["Good answer. [SCORE: 0.9"])
+    assert out == "Good answer. "
+    assert parser.text == "Good answer. "
+    assert parser.score == 0.9
+
+
+def test_truncated_tag_prefix_is_dropped():
+    for tail in ("[", "[SCO", "[ score", "[SCORE:", "[SCORE: 0."):
+        parser = ScoreTagParser()
+        out = feed_all(parser, ["Fine. ", tail])
+        assert out == "Fine. ", tail
+        assert parser.score is None, tail
+
+
+def test_truncated_tag_does_not_override_first_score():
+    parser = ScoreTagParser()
+    feed_all(parser, ["[SCORE: 0.4] ok [SCORE: 0.9"])
+    assert parser.score == 0.4
@@ -0,0 +1,322 @@
+import asyncio
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from audio_encoding import av, encode_opus
+from governor import governor
+from vad import trim_silence
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+MAX_OVERLAP_WORDS = 12
+TURN_IDLE_TIMEOUT_SEC = 120.0
+
+# Local STT batching: requests from different sessions that arrive within the
+# window are decoded together in a single encoder/decoder pass.
+LOCAL_MAX_BATCH = int(os.environ.get("WHISPER_MAX_BATCH", "8"))
+LOCAL_BATCH_WINDOW_MS = float(os.environ.get("WHISPER_BATCH_WINDOW_MS", "30"))
+WHISPER_WINDOW_SEC = 30
+# Trimming that saves less than this is not worth a re-encode; the original upload is sent
+MIN_TRIM_SAVING_SEC = 1.0
+# Longest an answer waits for a provider slot before STT gives up (asyncio.TimeoutError)
+STT_SLOT_TIMEOUT_SEC = float(os.environ.get("STT_SLOT_TIMEOUT_SEC", "10"))
+# Speech-only audio is re-encoded as Ogg/Opus for upload; plenty for STT at 16 kHz
+STT_OPUS_BITRATE = 24000
+
+_WORD_STRIP = re.compile(r"[^\w']+")
+
+
+def _normalize_word(word):
+    return _WORD_STRIP.sub("", word.lower())
+
+
+def stitch_transcripts(texts, max_overlap_words=MAX_OVERLAP_WORDS):
+    """
+    Join per-segment transcripts into one answer, dropping the words that were
+    transcribed twice because consecutive segments share a few seconds of audio.
+    """
+    words = []
+    for text in texts:
+        incoming = (text or "").split()
+        if not incoming:
+            continue
+        if words:
+            # Longest suffix of what we have that matches a prefix of the new segment
+            limit = min(max_overlap_words, len(words), len(incoming))
+            tail = [_normalize_word(w) for w in words[-limit:]]
+            head = [_normalize_word(w) for w in incoming[:limit]]
+            for k in range(limit, 0, -1):
+                if tail[-k:] == head[:k] and any(head[:k]):
+                    incoming = incoming[k:]
+                    break
+        words.extend(incoming)
+    return " ".join(words)
+
+
+class _Segment:
+    def __init__(self, seq, overlap_sec):
+        self.seq = seq
+        self.overlap_sec = overlap_sec
+        self.text = ""
+        self.pcm = None
+        self.task = None
+
+
+class ChunkedTranscription:
+    """
+    One candidate answer that is uploaded as a series of independently decodable
+    audio segments while the candidate is still speaking.
+
+    Every segment is transcribed in the background as soon as it arrives, so by
+    the time the turn ends only the last few seconds still need to go through STT.
+    """
+    def __init__(self, session_id, turn_id, transcribe_speech, load_pcm):
+        self.session_id = session_id
+        self.turn_id = turn_id
+        self._transcribe_speech = transcribe_speech # async (pcm, speech, sr, original_path) -> text
+        self._load_pcm = load_pcm
+        self.segments = {}
+        self.last_activity = time.monotonic()
+
+    def add_segment(self, seq, audio_bytes, overlap_sec=0.0, suffix=".webm"):
+        """
+        Register a segment and start transcribing it. Re-sent sequence numbers
+        (client retries) are ignored.
+        """
+        self.last_activity = time.monotonic()
+        if seq in self.segments:
+            return self.segments[seq]
+        segment = _Segment(seq, max(0.0, float(overlap_sec)))
+        segment.task = asyncio.create_task(self._process_segment(segment, audio_bytes, suffix))
+        self.segments[seq] = segment
+        return segment
+
+    async def _process_segment(self, segment, audio_bytes, suffix):
+        path = os.path.join(tempfile.gettempdir(), f"seg_{uuid.uuid4().hex}{suffix}")
+        with open(path, "wb") as f:
+            f.write(audio_bytes)
+        try:
+            pcm, _ = await asyncio.to_thread(self._load_pcm, path, SAMPLE_RATE)
+            if len(pcm) == 0:
+                logger.error(f"Segment {self.turn_id}#{segment.seq} could not be decoded")
+                return
+
+            skip = int(segment.overlap_sec * SAMPLE_RATE) if segment.seq > 0 else 0
+            segment.pcm = pcm[skip:]
+
+            # Silent segments (thinking pauses) never reach STT
+            speech, speech_duration, _ = await asyncio.to_thread(trim_silence, pcm, SAMPLE_RATE)
+            if speech_duration == 0:
+                print(f"[DEBUG] Segment {self.turn_id}#{segment.seq} is silent, skipping STT")
+                return
+            try:
+                segment.text = await self._transcribe_speech(pcm, speech, SAMPLE_RATE, path)
+            except Exception as e:
+                logger.error(f"Segment transcription failed ({self.turn_id}#{segment.seq}): {e}")
+                segment.text = ""
+            print(f"[DEBUG] Segment {self.turn_id}#{segment.seq} transcribed: '{segment.text[:40]}'")
+        finally:
+            if os.path.exists(path): os.remove(path)
+
+    @property
+    def pending(self):
+        return sum(1 for s in self.segments.values() if s.task and not s.task.done())
+
+    async def finalize(self):
+        """
+        Wait for outstanding segments and return the stitched transcript together
+        with the de-overlapped 16 kHz PCM of the whole answer.
+        """
+        ordered = [self.segments[k] for k in sorted(self.segments)]
+        await asyncio.gather(*(s.task for s in ordered if s.task), return_exceptions=True)
+        text = stitch_transcripts([s.text for s in ordered])
+        pcm_parts = [s.pcm for s in ordered if s.pcm is not None]
+        pcm = np.concatenate(pcm_parts) if pcm_parts else np.array([], dtype=np.float32)
+        return text, pcm
+
+    def cancel(self):
+        for s in self.segments.values():
+            if s.task and not s.task.done():
+                s.task.cancel()
+
+
+class ChunkedTranscriptionManager:
+    """
+    Tracks in-flight chunked turns keyed by (session_id, turn_id) and drops turns
+    that were abandoned without a finalize call.
+    """
+    def __init__(self, transcribe_speech, load_pcm, idle_timeout=TURN_IDLE_TIMEOUT_SEC):
+        self._transcribe_speech = transcribe_speech
+        self._load_pcm = load_pcm
+        self.idle_timeout = idle_timeout
+        self.turns = {}
+
+    def _evict_stale(self):
+        now = time.monotonic()
+        for key, turn in list(self.turns.items()):
+            if now - turn.last_activity > self.idle_timeout:
+                print(f"[DEBUG] Dropping abandoned chunked turn {key}")
+                turn.cancel()
+                del self.turns[key]
+
+    def get_or_create(self, session_id, turn_id):
+        self._evict_stale()
+        key = (session_id, turn_id)
+        turn = self.turns.get(key)
+        if turn is None:
+            turn = ChunkedTranscription(session_id, turn_id, self._transcribe_speech, self._load_pcm)
+            self.turns[key] = turn
+        return turn
+
+    def pop(self, session_id, turn_id):
+        return self.turns.pop((session_id, turn_id), None)
+
+
+class RemoteWhisperBackend:
+    """
+    Speech-to-text through the OpenAI whisper-1 API.
+    """
+    name = "openai"
+    accepts_files = True # the client's compressed upload can be sent as-is
+
+    def __init__(self, get_client, model="whisper-1"):
+        self._get_client = get_client
+        self.model = model
+
+    async def transcribe(self, pcm, sr=SAMPLE_RATE):
+        filename, audio = await asyncio.to_thread(_encode_upload, pcm, sr)
+        async with governor.slot(timeout=STT_SLOT_TIMEOUT_SEC):
+            transcription = await self._get_client().audio.transcriptions.create(
+                model=self.model, file=(filename, audio)
+            )
+        return transcription.text
+
+    async def transcribe_file(self, path):
+        async with governor.slot(timeout=STT_SLOT_TIMEOUT_SEC):
+            with open(path, "rb") as f:
+                transcription = await self._get_client().audio.transcriptions.create(model=self.model, file=f)
+        return transcription.text
+
+
+def _encode_upload(pcm, sr):
+    """(filename, bytes) for PCM sent to the API: Ogg/Opus, about a tenth of 16-bit PCM."""
+    if av is not None:
+        return "answer.ogg", encode_opus(pcm, sr, bitrate=STT_OPUS_BITRATE)
+    import soundfile as sf
+    buf = io.BytesIO()
+    sf.write(buf, pcm, sr, format="FLAC")
+    return "answer.flac", buf.getvalue()
+
+
+class LocalWhisperBackend:
+    """
+    Speech-to-text with a local openai-whisper model on CPU.
+
+    Concurrent calls (typically from different interview sessions) are queued and
+    collected for up to LOCAL_BATCH_WINDOW_MS, then their log-mel spectrograms are
+    stacked and decoded in one batched pass on a worker thread. Answers longer than
+    Whisper's 30 s window are split into windows that join the same batch.
+    """
+    name = "local"
+    accepts_files = False # decoding the upload again would cost more than the trimmed PCM
+
+    def __init__(self, model_loader, max_batch=LOCAL_MAX_BATCH, batch_window_ms=LOCAL_BATCH_WINDOW_MS):
+        self._model_loader = model_loader
+        self.max_batch = max(1, max_batch)
+        self.batch_window = batch_window_ms / 1000.0
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def transcribe(self, pcm, sr=SAMPLE_RATE):
+        if sr != SAMPLE_RATE:
+            raise ValueError(f"Local Whisper expects {SAMPLE_RATE} Hz PCM, got {sr}")
+        pcm = np.asarray(pcm, dtype=np.float32)
+        window = WHISPER_WINDOW_SEC * SAMPLE_RATE
+        pieces = [pcm[i:i + window] for i in range(0, max(len(pcm), 1), window)]
+
+        self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for piece in pieces:
+            fut = loop.create_future()
+            self._queue.put_nowait((piece, fut))
+            futures.append(fut)
+        texts = await asyncio.gather(*futures)
+        return " ".join(t for t in texts if t)
+
+    async def transcribe_file(self, path):
+        import whisper
+        # whisper.load_audio shells out to ffmpeg, so any container works
+        pcm = await asyncio.to_thread(whisper.load_audio, path, SAMPLE_RATE)
+        return await self.transcribe(pcm, SAMPLE_RATE)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [(pcm, fut) for pcm, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+            try:
+                texts = await asyncio.to_thread(self._decode_batch, [pcm for pcm, _ in batch])
+                for (_, fut), text in zip(batch, texts):
+                    if not fut.done(): fut.set_result(text)
+            except Exception as e:
+                logger.error(f"Local Whisper batch of {len(batch)} failed: {e}")
+                for _, fut in batch:
+                    if not fut.done(): fut.set_exception(e)
+
+    def _decode_batch(self, pcms):
+        import torch
+        import whisper
+
+        model = self._model_loader()
+        if model is None:
+            raise RuntimeError("Local Whisper model is not available")
+
+        # Per-item mels: log_mel_spectrogram normalises against the max of its input,
+        # so computing it on the stacked batch would couple unrelated sessions.
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(p)), n_mels=model.dims.n_mels)
+            for p in pcms
+        ]).to(model.device)
+
+        start = time.perf_counter()
+        options = whisper.DecodingOptions(language="en", fp16=False, without_timestamps=True)
+        with torch.no_grad():
+            results = whisper.decode(model, mels, options)
+        print(f"[DEBUG] Local Whisper decoded batch of {len(pcms)} in {time.perf_counter() - start:.2f}s")
+        return [r.text.strip() for r in results]
+
+
+def create_transcription_backend(get_client, model_loader):
+    """
+    Pick the STT backend for this deployment from STT_BACKEND ("openai" or "local").
+    """
+    choice = os.environ.get("STT_BACKEND", "openai").lower()
+    if choice == "local":
+        return LocalWhisperBackend(model_loader)
+    return RemoteWhisperBackend(get_client)
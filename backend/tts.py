@@ -0,0 +1,241 @@
+import asyncio
+import base64
+import logging
+import os
+import random
+import re
+
+from google.genai import types
+
+from deadlines import CallPolicy, stream_with_deadline
+from governor import BACKGROUND, governor
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TTS_MODEL = "models/gemini-2.5-flash-preview-tts"
+TTS_SAMPLE_RATE = 24000 # Gemini TTS returns 16-bit little-endian mono PCM at 24 kHz
+TTS_MIME_TYPE = f"audio/L16;rate={TTS_SAMPLE_RATE}"
+MIN_SENTENCE_CHARS = 12 # Shorter fragments are merged into the next one (except the first, e.g. "Hello!")
+
+# Sentences synthesized at once per utterance, and per-sentence retry policy
+TTS_CONCURRENCY = int(os.environ.get("TTS_CONCURRENCY", "3"))
+TTS_RETRIES = int(os.environ.get("TTS_RETRIES", "2"))
+TTS_RETRY_BASE_SEC = float(os.environ.get("TTS_RETRY_BASE_SEC", "0.4"))
+
+# Per-sentence request: watchdog and hedge only; OrderedSynthesizer does the retries
+TTS_POLICY = CallPolicy.from_env("tts", budget_sec=20.0, first_chunk_sec=6.0, retries=0, on_event=metrics.call_event, governor=governor)
+# Startup cache prewarm: nobody is listening, so it yields to live speech
+TTS_PREWARM_POLICY = CallPolicy.from_env("tts_prewarm", budget_sec=60.0, first_chunk_sec=10.0, hedge=False, on_event=metrics.call_event, governor=governor, priority=BACKGROUND)
+
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+_ABBREVIATIONS = ("e.g.", "i.e.", "etc.", "vs.", "mr.", "mrs.", "ms.", "dr.", "prof.", "sr.", "jr.")
+
+
+def tts_prompt(text):
+    return f"Please read the following text aloud naturally and professionally:\n\n{text}"
+
+
+def _audio_bytes(chunk):
+    if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
+        return None
+    part = chunk.candidates[0].content.parts[0]
+    if hasattr(part, 'inline_data') and part.inline_data and part.inline_data.data:
+        return part.inline_data.data
+    if hasattr(part, 'blob') and part.blob and part.blob.data:
+        return part.blob.data
+    return None
+
+
+async def synthesize_stream(client, text, voice=None, policy=TTS_POLICY):
+    """Yield raw PCM chunks for `text` from Gemini TTS as they arrive."""
+    config = types.GenerateContentConfig(response_modalities=["AUDIO"])
+    if voice:
+        config.speech_config = types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=voice)
+            )
+        )
+    stream = stream_with_deadline(lambda: client.aio.models.generate_content_stream(
+        model=TTS_MODEL,
+        contents=tts_prompt(text),
+        config=config
+    ), policy)
+    async for chunk in stream:
+        audio = _audio_bytes(chunk)
+        if audio:
+            yield audio
+
+
+class SentenceSplitter:
+    """Cuts a token stream into sentences as soon as each one is complete."""
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buf = ""
+        self._first = True
+
+    def feed(self, text):
+        self._buf += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buf):
+            candidate = self._buf[start:match.end()]
+            words = self._buf[start:match.start() + 1].split()
+            if words and words[-1].lower() in _ABBREVIATIONS:
+                continue
+            if len(candidate.strip()) < self.min_chars and not self._first:
+                continue
+            self._first = False
+            sentences.append(candidate.strip())
+            start = match.end()
+        self._buf = self._buf[start:]
+        return sentences
+
+    def flush(self):
+        rest, self._buf = self._buf.strip(), ""
+        return [rest] if rest else []
+
+
+def split_sentences(text):
+    splitter = SentenceSplitter()
+    return splitter.feed(text) + splitter.flush()
+
+
+class SentenceSynthesisError(Exception):
+    def __init__(self, index, cause):
+        super().__init__(f"TTS failed for sentence {index}: {cause}")
+        self.index = index
+        self.cause = cause
+
+
+_END = object()
+
+
+class OrderedSynthesizer:
+    """
+    Synthesizes sentences concurrently (at most `concurrency` at a time) and
+    replays their audio strictly in order. The earliest unfinished sentence streams
+    live; later ones buffer until it is done.
+
+    A failed sentence is retried on its own with jittered backoff, as long as none
+    of its audio has been emitted yet (a second take would not splice cleanly).
+    """
+    def __init__(self, synthesize, voice=None, concurrency=TTS_CONCURRENCY, retries=TTS_RETRIES):
+        self._synthesize = synthesize
+        self.voice = voice
+        self.retries = retries
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._slots = [] # one chunk queue per sentence, in order
+        self._tasks = []
+        self._closed = False
+        self._changed = asyncio.Event()
+
+    def submit(self, text):
+        queue = asyncio.Queue()
+        self._slots.append(queue)
+        self._tasks.append(asyncio.create_task(self._run(len(self._slots) - 1, text, queue)))
+        self._changed.set()
+
+    def close(self):
+        """No more sentences will be submitted."""
+        self._closed = True
+        self._changed.set()
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    async def _run(self, index, text, queue):
+        async with self._sem:
+            for attempt in range(self.retries + 1):
+                emitted = False
+                try:
+                    async for chunk in self._synthesize(text, self.voice):
+                        emitted = True
+                        queue.put_nowait(chunk)
+                    queue.put_nowait(_END)
+                    return
+                except Exception as e:
+                    logger.error(f"TTS sentence {index} failed (attempt {attempt + 1}): {e}")
+                    if emitted or attempt == self.retries:
+                        queue.put_nowait(SentenceSynthesisError(index, e))
+                        return
+                    await asyncio.sleep(TTS_RETRY_BASE_SEC * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    async def chunks(self, start=0):
+        """
+        Yield (sentence_index, pcm_chunk) in order. A sentence that still fails after
+        its retries raises SentenceSynthesisError; call chunks(e.index + 1) to skip it
+        and carry on.
+        """
+        index = start
+        while True:
+            if index >= len(self._slots):
+                if self._closed:
+                    return
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+            queue = self._slots[index]
+            index += 1
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, SentenceSynthesisError):
+                    raise item
+                yield index - 1, item
+
+
+class SpeechPipeline:
+    """
+    Synthesizes sentences of a streaming chat reply while the reply is still being
+    generated. Sentences are spoken in order; each audio chunk is handed to `send`
+    as an SSE payload with base64 PCM. `synthesize(text, voice)` is an async
+    generator of PCM chunks (synthesize_stream or a cache in front of it).
+    """
+    def __init__(self, synthesize, send, voice=None):
+        self._send = send
+        self._splitter = SentenceSplitter()
+        self._synth = OrderedSynthesizer(synthesize, voice)
+        self._worker = asyncio.create_task(self._run())
+        self.sentences = 0
+        self.chunks = 0
+
+    def feed(self, text):
+        for sentence in self._splitter.feed(text):
+            self._synth.submit(sentence)
+            self.sentences += 1
+
+    async def close(self):
+        """Queue the trailing text and wait until every sentence has been sent."""
+        for sentence in self._splitter.flush():
+            self._synth.submit(sentence)
+            self.sentences += 1
+        self._synth.close()
+        await self._worker
+
+    def cancel(self):
+        self._worker.cancel()
+        self._synth.cancel()
+
+    async def _run(self):
+        chunks = self._synth.chunks()
+        while True:
+            try:
+                index, audio = await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            except SentenceSynthesisError as e:
+                # Skip the sentence rather than stall the rest of the reply
+                await self._send({"audio_error": str(e.cause), "sentence": e.index})
+                chunks = self._synth.chunks(e.index + 1)
+                continue
+            await self._send({
+                "audio": base64.b64encode(audio).decode("ascii"),
+                "sentence": index,
+                "seq": self.chunks,
+                "mime_type": TTS_MIME_TYPE,
+            })
+            self.chunks += 1
+        await self._send({"audio_done": True, "sentences": self.sentences, "chunks": self.chunks})
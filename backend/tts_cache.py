@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import unicodedata
+from collections import OrderedDict
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_MEMORY_BYTES = int(os.environ.get("TTS_CACHE_MEMORY_MB", "32")) * 1024 * 1024
+TTS_CACHE_DISK_BYTES = int(os.environ.get("TTS_CACHE_DISK_MB", "256")) * 1024 * 1024
+# Set to an empty string to keep the cache in memory only
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "aceit-tts-cache"))
+# Cache hits are replayed in chunks of this size (0.5 s of 24 kHz 16-bit PCM)
+REPLAY_CHUNK_BYTES = 24000
+
+# Utterances every interviewer is told to say verbatim, synthesized per persona voice
+# at startup; persona-specific ones (greeting, sign-off) come from the prompt catalog
+PREWARM_PHRASES = (
+    "Let's move on to the coding question.",
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    text = text.replace("’", "'").replace("“", '"').replace("”", '"')
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class TTSCache:
+    """
+    Two-tier cache of synthesized utterances keyed by (model, voice, normalized text):
+    an LRU in memory and a size-capped directory of .pcm files. A hit replays the
+    stored PCM immediately in the same byte framing a live synthesis produces.
+    """
+    def __init__(self, synthesize, model, memory_bytes=TTS_CACHE_MEMORY_BYTES,
+                 disk_bytes=TTS_CACHE_DISK_BYTES, cache_dir=TTS_CACHE_DIR):
+        self._synthesize = synthesize # async generator: (text, voice) -> PCM chunks
+        self.model = model
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.cache_dir = cache_dir or None
+        self._memory = OrderedDict() # key -> bytes
+        self._memory_size = 0
+        self._disk = OrderedDict() # key -> file size, oldest first
+        self._disk_size = 0
+        if self.cache_dir:
+            self._load_disk_index()
+
+    def key(self, text, voice):
+        raw = f"{self.model}|{voice or ''}|{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pcm")
+
+    def _load_disk_index(self):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entries = []
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith(".pcm"):
+                    st = os.stat(os.path.join(self.cache_dir, filename))
+                    entries.append((st.st_mtime, filename[:-len(".pcm")], st.st_size))
+            for _, key, size in sorted(entries):
+                self._disk[key] = size
+                self._disk_size += size
+            logger.info(f"TTS cache: {len(self._disk)} utterances on disk ({self._disk_size / 1e6:.1f} MB)")
+        except OSError as e:
+            logger.error(f"TTS cache directory unavailable, using memory only: {e}")
+            self.cache_dir = None
+
+    def _remember(self, key, audio):
+        if len(audio) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _read_file(self, key):
+        path = self._path(key)
+        with open(path, "rb") as f:
+            audio = f.read()
+        os.utime(path) # recency for eviction order across restarts
+        return audio
+
+    def _write_file(self, key, audio):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(audio)
+        os.replace(tmp, path)
+
+    async def get(self, text, voice):
+        key = self.key(text, voice)
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            metrics.inc("tts_cache_hit_memory")
+            return audio
+        if self.cache_dir and key in self._disk:
+            try:
+                audio = await asyncio.to_thread(self._read_file, key)
+                self._disk.move_to_end(key)
+                self._remember(key, audio)
+                metrics.inc("tts_cache_hit_disk")
+                return audio
+            except OSError:
+                self._disk_size -= self._disk.pop(key, 0)
+        metrics.inc("tts_cache_miss")
+        return None
+
+    async def put(self, text, voice, audio):
+        if not audio:
+            return
+        key = self.key(text, voice)
+        self._remember(key, audio)
+        if not self.cache_dir or key in self._disk or len(audio) > self.disk_bytes:
+            return
+        try:
+            await asyncio.to_thread(self._write_file, key, audio)
+        except OSError as e:
+            logger.error(f"TTS cache write failed: {e}")
+            return
+        self._disk[key] = len(audio)
+        self._disk_size += len(audio)
+        while self._disk_size > self.disk_bytes:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+        metrics.set_gauge("tts_cache_disk_bytes", self._disk_size)
+
+    async def stream(self, text, voice=None):
+        """Yield PCM chunks for `text`: replayed from the cache or synthesized and stored."""
+        audio = await self.get(text, voice)
+        if audio is not None:
+            for i in range(0, len(audio), REPLAY_CHUNK_BYTES):
+                yield audio[i:i + REPLAY_CHUNK_BYTES]
+            return
+        parts = []
+        async for chunk in self._synthesize(text, voice):
+            parts.append(chunk)
+            yield chunk
+        # Only complete utterances are stored; an interrupted stream raises above
+        await self.put(text, voice, b"".join(parts))
+
+    async def prewarm(self, voices, phrases=PREWARM_PHRASES, synthesize=None, voice_phrases=None):
+        """
+        Synthesize common phrases for each voice, plus `voice_phrases` ({voice:
+        [phrase, ...]}) for their own voice, skipping what is cached already. An
+        optional `synthesize` (e.g. lower priority) replaces the live one.
+        """
+        synthesize = synthesize or self._synthesize
+        utterances = [(voice, phrase) for voice in voices for phrase in phrases]
+        for voice, extra in (voice_phrases or {}).items():
+            utterances += [(voice, phrase) for phrase in extra]
+        warmed = 0
+        for voice, phrase in dict.fromkeys(utterances):
+            key = self.key(phrase, voice)
+            if key in self._memory or key in self._disk:
+                continue
+            try:
+                parts = [chunk async for chunk in synthesize(phrase, voice)]
+                await self.put(phrase, voice, b"".join(parts))
+                warmed += 1
+            except Exception as e:
+                logger.warning(f"TTS prewarm failed for {voice!r}: {e}")
+        logger.info(f"TTS cache prewarm finished: {warmed} utterances synthesized")
+        return warmed
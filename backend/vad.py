@@ -0,0 +1,133 @@
+import numpy as np
+
+# Frame-level voice activity detection tuned for a single close-talking speaker.
+# Cheap enough to run on every turn upload before it is sent to STT.
+FRAME_MS = 30
+ENERGY_MARGIN_DB = 12.0     # How far above the estimated noise floor speech must sit
+ABSOLUTE_FLOOR_DB = -55.0   # Anything quieter than this is silence regardless of noise floor
+NOISE_FLOOR_CAP_DB = -45.0  # Recordings with no pauses must not raise the floor into speech level
+MAX_FLATNESS = 0.55         # Speech is tonal; broadband noise has a flat spectrum
+HANGOVER_MS = 240           # Keep this much audio after speech stops (trailing consonants)
+MIN_SPEECH_MS = 90          # Ignore isolated clicks/pops shorter than this
+PAD_MS = 120                # Context kept on both sides of each detected span
+MAX_GAP_MS = 300            # Long pauses are shortened to this when trimming
+
+
+def frame_activity(y, sr, frame_ms=FRAME_MS):
+    """
+    Classify fixed-length frames of mono float PCM as speech/non-speech.
+    Returns (active_mask, frame_length_samples).
+    """
+    frame_len = max(1, int(sr * frame_ms / 1000))
+    n_frames = len(y) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool), frame_len
+
+    frames = np.asarray(y[:n_frames * frame_len], dtype=np.float32).reshape(n_frames, frame_len)
+
+    # 1. Energy gate relative to the quietest 10% of the recording
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    noise_floor = min(np.percentile(energy_db, 10), NOISE_FLOOR_CAP_DB)
+    threshold = max(noise_floor + ENERGY_MARGIN_DB, ABSOLUTE_FLOOR_DB)
+    active = energy_db > threshold
+
+    # 2. Spectral flatness gate to reject loud but noise-like frames (fans, keyboard hiss)
+    if active.any():
+        spectrum = np.abs(np.fft.rfft(frames[active] * np.hanning(frame_len), axis=1)) ** 2 + 1e-12
+        flatness = np.exp(np.mean(np.log(spectrum), axis=1)) / np.mean(spectrum, axis=1)
+        active[np.flatnonzero(active)] = flatness < MAX_FLATNESS
+
+    # 3. Drop blips shorter than MIN_SPEECH_MS, then extend speech by the hangover
+    min_frames = max(1, MIN_SPEECH_MS // frame_ms)
+    hang_frames = HANGOVER_MS // frame_ms
+    for start, end in _runs(active):
+        if end - start < min_frames:
+            active[start:end] = False
+    for start, end in _runs(active):
+        active[end:end + hang_frames] = True
+    return active, frame_len
+
+
+def _runs(mask):
+    """(start, end) index pairs for each run of True values in a boolean array."""
+    if len(mask) == 0:
+        return []
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def speech_segments(y, sr):
+    """
+    Sample-index (start, end) spans that contain speech, padded by PAD_MS and merged
+    when they overlap.
+    """
+    active, frame_len = frame_activity(y, sr)
+    pad = int(sr * PAD_MS / 1000)
+    segments = []
+    for start, end in _runs(active):
+        s = max(0, start * frame_len - pad)
+        e = min(len(y), end * frame_len + pad)
+        if segments and s <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], e)
+        else:
+            segments.append((s, e))
+    return segments
+
+
+def trim_silence(y, sr):
+    """
+    Remove leading/trailing silence and shorten long pauses.
+
+    Returns (speech_pcm, speech_duration_sec, segments). speech_pcm is empty when
+    the recording contains no speech at all.
+    """
+    segments = speech_segments(y, sr)
+    if not segments:
+        return np.zeros(0, dtype=np.float32), 0.0, []
+
+    speech_samples = sum(e - s for s, e in segments)
+    max_gap = int(sr * MAX_GAP_MS / 1000)
+    parts = []
+    for i, (s, e) in enumerate(segments):
+        if i > 0:
+            gap = s - segments[i - 1][1]
+            if gap > 0:
+                parts.append(np.zeros(min(gap, max_gap), dtype=np.float32))
+        parts.append(np.asarray(y[s:e], dtype=np.float32))
+    return np.concatenate(parts), speech_samples / float(sr), segments
+
+
+class StreamingVad:
+    """
+    Frame-by-frame counterpart of frame_activity() for live audio. The noise floor
+    follows quiet frames quickly and drifts up slowly, so a long answer does not
+    teach it that speech is background.
+    """
+    def __init__(self, sr=16000, frame_ms=FRAME_MS):
+        self.frame_len = max(1, int(sr * frame_ms / 1000))
+        self.hang_frames = HANGOVER_MS // frame_ms
+        self.min_frames = max(1, MIN_SPEECH_MS // frame_ms)
+        self.noise_floor = NOISE_FLOOR_CAP_DB
+        self._run = 0
+        self._hang = 0
+
+    def is_speech(self, frame):
+        """Classify one frame of float PCM (frame_len samples)."""
+        energy_db = 10.0 * np.log10(float(np.dot(frame, frame)) / len(frame) + 1e-10)
+        if energy_db < self.noise_floor:
+            self.noise_floor = 0.5 * self.noise_floor + 0.5 * energy_db
+        else:
+            self.noise_floor = min(NOISE_FLOOR_CAP_DB, 0.998 * self.noise_floor + 0.002 * energy_db)
+        threshold = max(self.noise_floor + ENERGY_MARGIN_DB, ABSOLUTE_FLOOR_DB)
+
+        if energy_db > threshold:
+            self._run += 1
+            if self._run >= self.min_frames:
+                self._hang = self.hang_frames
+                return True
+            return False
+        self._run = 0
+        if self._hang > 0:
+            self._hang -= 1
+            return True
+        return False
@@ -2,12 +2,15 @@
 import { useState, useEffect, useRef, Suspense } from "react";
 import { useRouter } from "next/navigation";
 import { useInterviewStore } from "@/store/useInterviewStore";
+import { codeEdit, takeSentences } from "@/lib/interviewUtils";
 import dynamic from "next/dynamic";
 import { AvatarHandle } from "@/components/Avatar";
 import { PythonProvider, usePython } from "react-py";
 import { CodeEditor, ConsoleOutput } from "@/components/CodeEditor";
 
 const PYTHON_PACKAGES = { official: ["pyodide-http"] };
+// How long to wait for a live turn transcript before uploading the recording instead
+const LIVE_TURN_TIMEOUT_MS = 12000;
 const Avatar = dynamic(() => import("@/components/Avatar"), { ssr: false });
 
 // ─── GLOBAL STYLES ────────────────────────────────────────────────────────────
@@ -573,6 +576,11 @@ function InterviewContent() {
   const isIntroTriggeredRef = useRef(false);
   const currentTurnIdRef = useRef(0);
   const scriptedQuestionsRef = useRef<any[]>([]);
+  // Server-side turn segmentation over the DataChannel: once the session is bound,
+  // an answer is cut from the live audio track and transcribed without an upload
+  const liveTurnsRef = useRef(false);
+  const liveTextsRef = useRef<string[]>([]);
+  const liveTurnWaiterRef = useRef<((text: string | null) => void) | null>(null);
 
   // Re-attach camera stream when localVideoRef changes or phase changes
   useEffect(() => {
@@ -614,6 +622,33 @@ function InterviewContent() {
     return false;
   };
 
+  // Conversation and code live server-side: a turn carries the new utterance, its
+  // turn_seq and the code edit since the server's snapshot. The full history or
+  // code only goes up when the server answers 409 asking for it.
+  const turnSeqRef = useRef(0);
+  const codeVersionRef = useRef<number | null>(null);
+  const serverCodeRef = useRef("");
+  const sentCodeRef = useRef("");
+
+  const postChat = async (inputText: string, forceCoding: boolean) => {
+    let resendHistory = false;
+    let resendCode = codeVersionRef.current === null;
+    for (let attempt = 0; attempt < 3; attempt++) {
+      const body: Record<string, unknown> = { text: inputText, question_index: questionIndex, session_id: sessionId, timestamp_sec: elapsedSeconds, interviewer_persona: interviewerPersona, pressure_score: pressureScore, pressure_trend: pressureTrend, force_coding: forceCoding, turn_seq: turnSeqRef.current + 1 };
+      if (resendHistory) Object.assign(body, { history: transcript, resume_text: resumeText, job_text: jobText });
+      if (resendCode) body.code = code;
+      else if (code !== serverCodeRef.current) body.code_delta = { base_version: codeVersionRef.current, ops: [codeEdit(serverCodeRef.current, code)] };
+      sentCodeRef.current = code;
+      const res = await fetch('http://127.0.0.1:8080/api/chat', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) });
+      if (res.status !== 409) return res;
+      const conflict = await res.json().catch(() => ({}));
+      if (!conflict.resync && !conflict.code_resync) break;
+      if (conflict.resync) resendHistory = true;
+      if (conflict.code_resync) resendCode = true;
+    }
+    throw new Error("Chat API error: session could not be resynced");
+  };
+
   const handleChatStream = async (inputText: string, ignoreScore: boolean = false, forceCoding: boolean = false) => {
     if (!sessionId) return;
     if (audioQueueRef.current) audioQueueRef.current.stop();
@@ -625,7 +660,7 @@ function InterviewContent() {
 
     try {
       if (!audioQueueRef.current) audioQueueRef.current = new AudioQueue(() => setIsSpeaking(false), avatarRef);
-      const chatRes = await fetch('http://127.0.0.1:8080/api/chat', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ text: inputText, question_index: questionIndex, session_id: sessionId, timestamp_sec: elapsedSeconds, resume_text: resumeText, job_text: jobText, interviewer_persona: interviewerPersona, pressure_score: pressureScore, pressure_trend: pressureTrend, history: transcript, code: code, force_coding: forceCoding }) });
+      const chatRes = await postChat(inputText, forceCoding);
       if (!chatRes.ok) throw new Error(`Chat API error: ${chatRes.status}`);
       const reader = chatRes.body?.getReader();
       if (!reader) throw new Error("No reader");
@@ -656,6 +691,8 @@ function InterviewContent() {
                 if (turnId === currentTurnIdRef.current && audioQueueRef.current) audioQueueRef.current.add(fragmentForTTS);
               }
             } else if (data.done) {
+              if (data.turn_seq != null) turnSeqRef.current = data.turn_seq;
+              if (data.code_version != null) { codeVersionRef.current = data.code_version; serverCodeRef.current = sentCodeRef.current; }
               setQuestionIndex(data.next_index);
               const finalDisplay = data.full_text?.replace(/\[SCORE:\s*\d+\.?\d*\]/gi, "").trim() || fullSentence.replace(/\[SCORE:\s*\d+\.?\d*\]/gi, "").trim();
               updateLastTranscriptText(finalDisplay);
@@ -676,23 +713,45 @@ function InterviewContent() {
     }
   };
 
-  const processTurn = async (audioBlob: Blob | null, videoBlob: Blob | null) => {
-    if (!sessionId || !audioBlob) { if (!audioBlob) alert("No audio recorded."); return; }
+  useEffect(() => {
+    if (connStatus !== "connected" || !sessionId || dcRef.current?.readyState !== "open") return;
+    dcRef.current.send(JSON.stringify({ type: "session", session_id: sessionId, timestamp_sec: elapsedSeconds }));
+  }, [connStatus, sessionId]);
+
+  // Ends the live turn and waits for its transcript; null means use the upload instead
+  const endLiveTurn = (): Promise<string | null> => {
+    const dc = dcRef.current;
+    if (!liveTurnsRef.current || dc?.readyState !== "open") return Promise.resolve(null);
+    return new Promise(resolve => {
+      const timer = setTimeout(() => settle(null), LIVE_TURN_TIMEOUT_MS);
+      const settle = (text: string | null) => { clearTimeout(timer); liveTurnWaiterRef.current = null; resolve(text); };
+      liveTurnWaiterRef.current = settle;
+      dc.send(JSON.stringify({ type: "turn_end", timestamp_sec: elapsedSeconds }));
+    });
+  };
+
+  const processTurn = async (audioBlob: Blob | null, videoBlob: Blob | null, liveText: Promise<string | null>) => {
+    if (!sessionId) return;
     setIsProcessing(true);
     if (!audioQueueRef.current) audioQueueRef.current = new AudioQueue(() => setIsSpeaking(false), avatarRef);
     audioQueueRef.current.stop();
     try {
-      const formData = new FormData();
-      formData.append('audio', audioBlob);
-      if (videoBlob) formData.append('video', videoBlob);
-      formData.append('session_id', sessionId);
-      formData.append('timestamp_sec', elapsedSeconds.toString());
-      const streamRes = await fetch('http://127.0.0.1:8080/api/stream-process', { method: 'POST', body: formData });
-      const streamData = await streamRes.json();
-      if (streamData.text) {
-        addTranscriptEntry({ time: elapsedSeconds, speaker: 'user', text: streamData.text });
-        updatePressureScore(scorePerformance(streamData.text));
-        await handleChatStream(streamData.text);
+      let text = await liveText;
+      if (text === null) {
+        // No live segmentation (or it failed): upload the recorded answer
+        if (!audioBlob) { alert("No audio recorded."); return; }
+        const formData = new FormData();
+        formData.append('audio', audioBlob);
+        if (videoBlob) formData.append('video', videoBlob);
+        formData.append('session_id', sessionId);
+        formData.append('timestamp_sec', elapsedSeconds.toString());
+        const streamRes = await fetch('http://127.0.0.1:8080/api/stream-process', { method: 'POST', body: formData });
+        text = (await streamRes.json()).text;
+      }
+      if (text) {
+        addTranscriptEntry({ time: elapsedSeconds, speaker: 'user', text });
+        updatePressureScore(scorePerformance(text));
+        await handleChatStream(text);
       }
     } catch (err) { console.error("Turn processing failed:", err); } finally { setIsProcessing(false); }
   };
@@ -719,6 +778,8 @@ function InterviewContent() {
         videoRecorder.ondataavailable = (e) => { if (e.data.size > 0) videoChunksRef.current.push(e.data); };
         videoRecorder.start(); videoRecorderRef.current = videoRecorder;
       }
+      liveTextsRef.current = [];
+      if (liveTurnsRef.current && dcRef.current?.readyState === "open") dcRef.current.send(JSON.stringify({ type: "turn_start" }));
       setIsRecording(true);
     } catch (err: any) {
       [audioRecorderRef, videoRecorderRef].forEach(ref => { if (ref.current?.state === "recording") ref.current.stop(); ref.current = null; });
@@ -730,13 +791,14 @@ function InterviewContent() {
     const hasAudio = !!audioRecorderRef.current; const hasVideo = !!videoRecorderRef.current;
     const activeRecorders = [audioRecorderRef.current, videoRecorderRef.current].filter(r => r !== null);
     if (activeRecorders.length === 0) { setIsRecording(false); return; }
+    const liveText = endLiveTurn();
     let stoppedCount = 0;
     const onRecorderStop = () => {
       stoppedCount++;
       if (stoppedCount === activeRecorders.length) {
         const audioBlob = hasAudio ? new Blob(audioChunksRef.current, { type: audioChunksRef.current[0]?.type || 'audio/webm' }) : null;
         const videoBlob = hasVideo ? new Blob(videoChunksRef.current, { type: videoChunksRef.current[0]?.type || 'video/webm' }) : null;
-        processTurn(audioBlob, videoBlob);
+        processTurn(audioBlob, videoBlob, liveText);
       }
     };
     activeRecorders.forEach(r => { r!.onstop = onRecorderStop; r!.stop(); });
@@ -816,6 +878,17 @@ function InterviewContent() {
             setConfidence(conf); setGazeScore(msgGaze); setFidget(msgFidget);
             addBiometricPoint({ time: Math.round(msg.timestamp / 1000), gazeScore: msgGaze, confidence: conf, fidgetIndex: msgFidget, stressSpike: conf < 40 });
           }
+          if (msg.type === "prosody") {
+            // Live gauge only (~2/s while speaking); per-answer points come from audio_inference
+            const liveConf = Math.round(msg.confidence * 100);
+            setConfidence(prev => Math.round((prev + liveConf) / 2));
+          }
+          if (msg.type === "session_bound") liveTurnsRef.current = true;
+          if (msg.type === "turn_transcript") {
+            // Silence-ended turns within one answer are joined; the turn_end reply closes it
+            if (msg.text && !msg.error) liveTextsRef.current.push(msg.text);
+            if (msg.reason === "client") liveTurnWaiterRef.current?.(msg.error ? null : liveTextsRef.current.join(" "));
+          }
           if (msg.type === "audio_inference") {
             const audioConf = Math.round(msg.confidence * 100);
             setConfidence(prev => Math.round((prev + audioConf) / 2));
@@ -858,7 +931,8 @@ function InterviewContent() {
       if (firstText) {
         if (!audioQueueRef.current) audioQueueRef.current = new AudioQueue(() => setIsSpeaking(false), avatarRef);
         setIsSpeaking(true);
-        audioQueueRef.current.add(firstText);
+        // Same sentence units the upload screen prefetched, so these are cache hits
+        takeSentences(firstText, true).sentences.forEach(sentence => audioQueueRef.current?.add(sentence));
         audioQueueRef.current.signalEndTurn();
       }
     }
@@ -4,6 +4,7 @@ import { useRouter } from "next/navigation";
 import { useInterviewStore } from "@/store/useInterviewStore";
 import Link from "next/link";
 import { useAuth } from "@clerk/nextjs";
+import { takeSentences } from "@/lib/interviewUtils";
 
 export default function UploadPage() {
   const router = useRouter();
@@ -28,6 +29,10 @@ export default function UploadPage() {
   const [isImporting, setIsImporting] = useState(false);
   const [importedResumeName, setImportedResumeName] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  // Speculative setup: the backend builds the interviewer prompt and starts the
+  // opening question while the candidate is still on this screen
+  const prepIdRef = useRef<string | null>(null);
+  const preparedResumeRef = useRef<File | string | null>(null);
 
   useEffect(() => {
     fetch("http://127.0.0.1:8080/api/jobs")
@@ -39,6 +44,36 @@ export default function UploadPage() {
   }, []);
 
 
+  useEffect(() => {
+    if (jobText.trim().length <= 20) return;
+    const timer = setTimeout(() => {
+      const formData = new FormData();
+      if (prepIdRef.current) formData.append("prep_id", prepIdRef.current);
+      // The resume goes up once; later calls only update the other fields
+      const storedResume = useInterviewStore.getState().resumeText;
+      if (resumeFile && preparedResumeRef.current !== resumeFile) {
+        formData.append("resume", resumeFile);
+        preparedResumeRef.current = resumeFile;
+      } else if (!resumeFile && storedResume && preparedResumeRef.current !== storedResume) {
+        formData.append("resume_text", storedResume);
+        preparedResumeRef.current = storedResume;
+      }
+      formData.append("job_description", jobText);
+      if (interviewerPersona) formData.append("interviewer_persona", interviewerPersona);
+      formData.append("role", role);
+      formData.append("company", company);
+      if (clerkUserId) formData.append("user_id", clerkUserId);
+
+      fetch("http://127.0.0.1:8080/api/prepare-session", { method: "POST", body: formData })
+        .then(res => (res.ok ? res.json() : null))
+        .then(data => {
+          if (data?.prep_id) prepIdRef.current = data.prep_id;
+        })
+        .catch(err => console.warn("Session prepare failed:", err));
+    }, 800);
+    return () => clearTimeout(timer);
+  }, [resumeFile, importedResumeName, jobText, interviewerPersona, role, company, clerkUserId]);
+
   const handleFileDrop = (e: React.DragEvent) => {
     e.preventDefault();
     setIsDragging(false);
@@ -102,22 +137,70 @@ export default function UploadPage() {
       if (clerkUserId) {
         formData.append("user_id", clerkUserId);
       }
+      if (prepIdRef.current) {
+        formData.append("prep_id", prepIdRef.current);
+      }
 
+      // SSE variant: the session id arrives first, then the greeting token by token
       const res = await fetch("http://127.0.0.1:8080/api/init-session", {
         method: "POST",
+        headers: { Accept: "text/event-stream" },
         body: formData,
       });
 
-      if (!res.ok) throw new Error("Failed to initialize session");
-
-      const data = await res.json();
-
-      setResumeText(data.resume_text);
-      setJobText(data.job_text);
-      setSessionId(data.session_id);
+      if (!res.ok || !res.body) throw new Error("Failed to initialize session");
+
+      // Each finished greeting sentence is synthesized right away, so the interviewer's
+      // first words are already in the TTS cache when the interview screen speaks them
+      const prefetchSpeech = (sentence: string) => {
+        fetch("http://127.0.0.1:8080/api/tts", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ text: sentence }),
+        })
+          .then(r => r.arrayBuffer())
+          .catch(err => console.warn("Greeting TTS prefetch failed:", err));
+      };
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let streamBuffer = "";
+      let speechBuffer = "";
+      let initialQuestion = "";
+      let finished = false;
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        streamBuffer += decoder.decode(value, { stream: true });
+        const lines = streamBuffer.split("\n");
+        streamBuffer = lines.pop() || "";
+        for (const line of lines) {
+          if (!line.startsWith("data: ")) continue;
+          let data;
+          try { data = JSON.parse(line.substring(6)); } catch { continue; }
+          if (data.error) throw new Error(data.error);
+          if (data.session_id) {
+            setSessionId(data.session_id);
+            setJobText(data.job_text);
+          } else if (data.token) {
+            initialQuestion += data.token;
+            speechBuffer += data.token;
+            const { sentences, rest } = takeSentences(speechBuffer);
+            speechBuffer = rest;
+            sentences.forEach(prefetchSpeech);
+          } else if (data.done) {
+            takeSentences(speechBuffer, true).sentences.forEach(prefetchSpeech);
+            initialQuestion = data.initial_question || initialQuestion.trim();
+            finished = true;
+          }
+        }
+      }
+      // Without "done" the server has already discarded the session
+      if (!finished) throw new Error("Session stream ended early");
+      reader.cancel().catch(() => {});
 
-      if (data.initial_question) {
-        addTranscriptEntry({ time: 0, speaker: "interviewer", text: data.initial_question });
+      if (initialQuestion) {
+        addTranscriptEntry({ time: 0, speaker: "interviewer", text: initialQuestion });
       }
 
       setPhase("connecting");
@@ -53,3 +53,30 @@ export function scorePerformance(text: string): number {
 
     return Math.max(-1, Math.min(1, raw));
 }
+
+/**
+ * Splits the complete sentences off the front of `text` and returns them with the
+ * unfinished remainder (nothing is left over when `final` is set). The greeting is
+ * prefetched and spoken in these units, so both requests to /api/tts carry the
+ * same strings and the second one is served from the server's TTS cache.
+ */
+export function takeSentences(text: string, final: boolean = false): { sentences: string[]; rest: string } {
+    const parts = text.split(/(?<=[.!?])\s+/);
+    const rest = final ? "" : parts.pop() || "";
+    return { sentences: parts.map(s => s.trim()).filter(Boolean), rest };
+}
+
+/**
+ * The single {offset, length, text} edit that turns `prev` into `next`, for the
+ * /api/chat `code_delta` protocol. Offsets count code points, as the server does.
+ */
+export function codeEdit(prev: string, next: string): { offset: number; length: number; text: string } {
+    const a = Array.from(prev);
+    const b = Array.from(next);
+    let start = 0;
+    while (start < a.length && start < b.length && a[start] === b[start]) start++;
+    let endA = a.length;
+    let endB = b.length;
+    while (endA > start && endB > start && a[endA - 1] === b[endB - 1]) { endA--; endB--; }
+    return { offset: start, length: endA - start, text: b.slice(start, endB).join("") };
+}